@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure history prompt tokens: round-count window vs token-budget window.
+
+Replays the recorded answers in `eval/bench_answers.json` as one long
+conversation and prints, per turn, the history tokens that would be sent
+with the legacy `SESSION_MAX_HISTORY_ROUNDS` window and with
+`HISTORY_TOKEN_BUDGET` (+ a summary capped at HISTORY_SUMMARY_MAX_CHARS).
+No LLM required; summaries are assumed to hit their size cap.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+from src.core.token_counter import count_message_tokens  # noqa: E402
+from src.services.history_window import split_history_by_budget  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare history token usage per turn")
+    parser.add_argument("--answers", default="eval/bench_answers.json", help="Recorded answers (relative to service/ai)")
+    parser.add_argument("--turns", type=int, default=20, help="Conversation length to simulate")
+    parser.add_argument("--budget", type=int, default=settings.HISTORY_TOKEN_BUDGET, help="History token budget")
+    parser.add_argument("--rounds", type=int, default=settings.SESSION_MAX_HISTORY_ROUNDS, help="Legacy round window")
+    args = parser.parse_args()
+
+    answers: List[Dict[str, str]] = json.loads((AI_ROOT / args.answers).read_text(encoding="utf-8"))
+    summary_tokens = count_message_tokens([{"content": "摘" * settings.HISTORY_SUMMARY_MAX_CHARS}])
+
+    history: List[dict] = []
+    legacy_total = 0
+    budget_total = 0
+    print(f"{'turn':>4} {'legacy':>8} {'budget':>8} {'kept':>5}")
+    for turn in range(max(1, args.turns)):
+        item = answers[turn % len(answers)]
+        legacy = count_message_tokens(history[-args.rounds * 2 :])
+        older, recent = split_history_by_budget(history, args.budget)
+        windowed = count_message_tokens(recent) + (summary_tokens if older else 0)
+        legacy_total += legacy
+        budget_total += windowed
+        print(f"{turn + 1:>4} {legacy:>8} {windowed:>8} {len(recent) // 2:>5}")
+        history.append({"role": "user", "content": item["query"]})
+        history.append({"role": "assistant", "content": item["answer"]})
+
+    saved = legacy_total - budget_total
+    ratio = saved / legacy_total if legacy_total else 0.0
+    print(
+        f"[bench_history_window] budget={args.budget} legacy_total={legacy_total} "
+        f"budget_total={budget_total} saved={saved} ({ratio:.1%})"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
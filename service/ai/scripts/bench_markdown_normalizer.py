@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Throughput benchmark (MB/s) for markdown normalization.
+
+Compares the streaming engine (`normalize_markdown_content`) with the
+multi-pass reference implementation on managed docs + repository markdown.
+No network required.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from src.core.markdown_normalizer import (  # noqa: E402
+    _normalize_markdown_content_multipass,
+    normalize_markdown_content,
+)
+from verify_markdown_normalizer_equivalence import _iter_markdown_files  # noqa: E402
+
+
+def _measure(fn: Callable[..., str], texts: List[str], target: str, repeat: int) -> float:
+    total_bytes = sum(len(text.encode("utf-8")) for text in texts) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text, target=target, strip_decorative=True)
+    elapsed = time.perf_counter() - start
+    return total_bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark markdown normalizer throughput")
+    parser.add_argument("--repeat", type=int, default=5, help="Corpus passes per measurement")
+    args = parser.parse_args()
+
+    texts = [path.read_text(encoding="utf-8", errors="ignore") for path in _iter_markdown_files()]
+    if not texts:
+        print("[bench_markdown_normalizer] ERROR: no markdown files found")
+        return 1
+
+    repeat = max(1, args.repeat)
+    corpus_kb = sum(len(text.encode("utf-8")) for text in texts) / 1024
+    print(f"[bench_markdown_normalizer] files={len(texts)} corpus={corpus_kb:.1f}KB repeat={repeat}")
+
+    # 预热一次，排除正则编译与首次导入开销。
+    for text in texts:
+        normalize_markdown_content(text)
+        _normalize_markdown_content_multipass(text)
+
+    for target in ("index", "answer"):
+        streaming = _measure(normalize_markdown_content, texts, target, repeat)
+        multipass = _measure(_normalize_markdown_content_multipass, texts, target, repeat)
+        speedup = streaming / multipass if multipass > 0 else 0.0
+        print(
+            f"target={target:<6} streaming={streaming:6.2f}MB/s "
+            f"multipass={multipass:6.2f}MB/s speedup={speedup:.2f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
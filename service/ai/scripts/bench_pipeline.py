@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Offline microbenchmarks for the markdown and answer post-processing pipeline.
+
+Fixed corpus:
+1) A snapshot of this repository's markdown files in `eval/bench_markdown.json`
+   (refresh with `--snapshot-corpus`, then `--update-baseline`).
+2) Recorded synthetic LLM answers in `eval/bench_answers.json`.
+
+For every benchmarked function the suite reports ops/sec, p50/p99 latency and
+peak allocation per op (tracemalloc), writes `eval/last_bench_report.json`,
+and compares against `eval/bench_baseline.json`. Timings are gated as ratios
+to a calibration workload measured in the same run, so a baseline recorded on
+one machine still applies on another; allocation is gated directly. A corpus
+fingerprint that differs from the baseline's is an error, not a warning.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from src.core.document_cleaner import clean_document_content  # noqa: E402
+from src.core.markdown_blocks import markdown_to_blocks  # noqa: E402
+from src.core.markdown_normalizer import normalize_markdown_content  # noqa: E402
+from src.services import chat_service  # noqa: E402
+
+
+SKIP_DIR_NAMES = {".git", "node_modules", "venv", ".venv", "__pycache__", "managed_docs"}
+DEFAULT_ANSWERS = "eval/bench_answers.json"
+DEFAULT_MARKDOWN = "eval/bench_markdown.json"
+DEFAULT_BASELINE = "eval/bench_baseline.json"
+DEFAULT_REPORT = "eval/last_bench_report.json"
+STREAM_FRAGMENT_CHARS = 24
+
+
+CALIBRATION_TEXT = "## 标题\n\n- galay-http 支持 HTTP/1.1 与 WebSocket。\n```cpp\nHttpServer server(config);\n```\n" * 40
+CALIBRATION_CALLS = 3
+_CALIBRATION_RE = re.compile(r"^(#+)\s*(.+)$|^```(\w*)$", re.MULTILINE)
+
+
+def _snapshot_markdown_corpus(path: Path) -> None:
+    """把仓库当前的 markdown 文件写入快照；只在有意更新基准语料时运行"""
+    items: List[Dict[str, str]] = []
+    for md_path in sorted(REPO_ROOT.rglob("*.md")):
+        relative = md_path.relative_to(REPO_ROOT)
+        if any(part in SKIP_DIR_NAMES for part in relative.parts):
+            continue
+        items.append({"path": relative.as_posix(), "text": md_path.read_text(encoding="utf-8", errors="ignore")})
+    path.write_text(json.dumps(items, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+
+
+def _load_markdown_corpus(path: Path) -> List[str]:
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(raw, list):
+        raise ValueError("Markdown corpus must be a JSON array")
+    return [str(item["text"]) for item in raw]
+
+
+def _calibration() -> int:
+    """与被测函数同类的纯 Python 负载（正则 + 逐行字符串处理），用于把耗时换算成与机器无关的比值"""
+    lines = []
+    for line in CALIBRATION_TEXT.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("- "):
+            stripped = stripped[2:]
+        lines.append(stripped.replace("HTTP", "http"))
+    return len(_CALIBRATION_RE.findall("\n".join(lines)))
+
+
+def _load_answers(path: Path) -> List[Dict[str, Any]]:
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(raw, list):
+        raise ValueError("Answer corpus must be a JSON array")
+    return raw
+
+
+def _corpus_fingerprint(markdown: List[str], answers: List[Dict[str, Any]]) -> str:
+    digest = hashlib.sha1()
+    for text in markdown:
+        digest.update(text.encode("utf-8"))
+    for item in answers:
+        digest.update(str(item.get("answer", "")).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def _answer_docs(item: Dict[str, Any]) -> List[Tuple[Document, float]]:
+    docs: List[Tuple[Document, float]] = []
+    for rank, source in enumerate(item.get("sources", [])):
+        doc = Document(page_content="", metadata={"project": source["project"], "source": source["source"]})
+        docs.append((doc, max(0.0, 0.82 - rank * 0.1)))
+    return docs
+
+
+def _postprocess_answer(item: Dict[str, Any], docs_with_score: List[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+    """与 ChatService.chat 相同的回答后处理链。"""
+    message = item["query"]
+    docs = [doc for doc, _ in docs_with_score]
+    history = [{"role": "user", "content": "galay-http 怎么快速开始？"}, {"role": "assistant", "content": "..."}]
+    answer = chat_service._normalize_answer_text(item["answer"], user_message=message)
+    answer = chat_service._prune_setup_sections_for_followup(answer, message, history)
+    answer = chat_service._downgrade_answer_when_example_missing(answer, message, docs)
+    answer = chat_service._enforce_confidence_gate_for_code(answer, message, docs_with_score)
+    answer = chat_service._ensure_source_citations(answer, docs)
+    return chat_service._build_answer_blocks(answer)
+
+
+def _stream_preview(item: Dict[str, Any]) -> int:
+    """按固定分片回放一次流式输出，覆盖切片、清洗与预览规范化。"""
+    raw = item["answer"]
+    streamed_parts: List[str] = []
+    buffer = ""
+    previews = 0
+    for start in range(0, len(raw), STREAM_FRAGMENT_CHARS):
+        buffer += chat_service._sanitize_stream_fragment(raw[start : start + STREAM_FRAGMENT_CHARS])
+        while True:
+            piece, buffer = chat_service._pop_stream_emit_piece(buffer)
+            if not piece:
+                break
+            streamed_parts.append(piece)
+            chat_service._build_stream_preview(streamed_parts, user_message=item["query"])
+            previews += 1
+    return previews
+
+
+def _build_suite(markdown: List[str], answers: List[Dict[str, Any]]) -> Dict[str, List[Callable[[], Any]]]:
+    normalized_docs = [normalize_markdown_content(text, target="index") for text in markdown]
+    normalized_answers = [normalize_markdown_content(item["answer"], target="answer") for item in answers]
+    scored = [_answer_docs(item) for item in answers]
+
+    return {
+        "normalize_markdown_content[index]": [
+            (lambda t=text: normalize_markdown_content(t, target="index")) for text in markdown
+        ],
+        "normalize_markdown_content[answer]": [
+            (lambda t=item["answer"]: normalize_markdown_content(t, target="answer")) for item in answers
+        ],
+        "clean_document_content[markdown]": [
+            (lambda t=text: clean_document_content(t, "markdown")) for text in markdown
+        ],
+        "markdown_to_blocks": [
+            (lambda t=text: markdown_to_blocks(t)) for text in normalized_docs + normalized_answers
+        ],
+        "chat._normalize_answer_text": [
+            (lambda i=item: chat_service._normalize_answer_text(i["answer"], user_message=i["query"]))
+            for item in answers
+        ],
+        "chat.answer_postprocess": [
+            (lambda i=item, s=score: _postprocess_answer(i, s)) for item, score in zip(answers, scored)
+        ],
+        "chat.stream_preview": [(lambda i=item: _stream_preview(i)) for item in answers],
+    }
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _timed(call: Callable[[], Any], into: List[float]) -> None:
+    begin = time.perf_counter_ns()
+    call()
+    into.append((time.perf_counter_ns() - begin) / 1000)
+
+
+def _run_bench(calls: List[Callable[[], Any]], rounds: int) -> Dict[str, Any]:
+    for call in calls:
+        call()
+
+    # 每轮前后各跑一段校准负载，与被测函数经历相同的 CPU 频率与争用
+    latencies_us: List[float] = []
+    calibration_us: List[float] = []
+    for _ in range(rounds):
+        for _ in range(CALIBRATION_CALLS):
+            _timed(_calibration, calibration_us)
+        for call in calls:
+            _timed(call, latencies_us)
+        for _ in range(CALIBRATION_CALLS):
+            _timed(_calibration, calibration_us)
+    elapsed = sum(latencies_us) / 1e6
+    calibration_p50 = _percentile(sorted(calibration_us), 50)
+    calibration_mean = statistics.fmean(calibration_us)
+
+    tracemalloc.start()
+    peaks: List[int] = []
+    for call in calls:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(max(0, peak - current))
+    tracemalloc.stop()
+
+    latencies_us.sort()
+    p50 = _percentile(latencies_us, 50)
+    mean = statistics.fmean(latencies_us)
+    return {
+        "inputs": len(calls),
+        "ops": len(latencies_us),
+        "ops_per_sec": round(len(latencies_us) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_us": round(p50, 1),
+        "p99_us": round(_percentile(latencies_us, 99), 1),
+        "alloc_peak_kb_per_op": round(statistics.fmean(peaks) / 1024, 2) if peaks else 0.0,
+        # 以校准负载为单位的吞吐与 p50：机器快慢一起变，比值基本不变
+        "relative_ops": round(calibration_mean / mean, 6) if mean > 0 else 0.0,
+        "relative_p50": round(p50 / calibration_p50, 4) if calibration_p50 > 0 else 0.0,
+    }
+
+
+def _compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    max_regression: float,
+    max_alloc_regression: float,
+) -> List[str]:
+    regressions: List[str] = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # 绝对 ops/sec 与 p50 随机器变化，只报告；门禁看相对校准负载的比值。p99 样本少、抖动大，不做门禁。
+        base_ops = base.get("relative_ops", 0.0)
+        if base_ops > 0 and current["relative_ops"] < base_ops * (1 - max_regression):
+            regressions.append(f"{name}: relative_ops {current['relative_ops']} < baseline {base_ops}")
+        base_p50 = base.get("relative_p50", 0.0)
+        if base_p50 > 0 and current["relative_p50"] > base_p50 * (1 + max_regression):
+            regressions.append(f"{name}: relative_p50 {current['relative_p50']} > baseline {base_p50}")
+        base_alloc = base["alloc_peak_kb_per_op"]
+        if base_alloc > 0 and current["alloc_peak_kb_per_op"] > base_alloc * (1 + max_alloc_regression):
+            regressions.append(
+                f"{name}: alloc_peak_kb_per_op {current['alloc_peak_kb_per_op']} > baseline {base_alloc}"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark markdown and answer pipeline")
+    parser.add_argument("--answers", default=DEFAULT_ANSWERS, help="Recorded answer corpus (relative to service/ai)")
+    parser.add_argument("--markdown", default=DEFAULT_MARKDOWN, help="Markdown corpus snapshot (relative to service/ai)")
+    parser.add_argument(
+        "--snapshot-corpus", action="store_true", help="Re-snapshot the repository markdown into --markdown and exit"
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON (relative to service/ai)")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Report JSON (relative to service/ai)")
+    parser.add_argument("--rounds", type=int, default=20, help="Timed passes over each input set")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument(
+        "--max-regression", type=float, default=0.3, help="Allowed slowdown of ops/sec and p50 relative to calibration"
+    )
+    parser.add_argument("--max-alloc-regression", type=float, default=0.2, help="Allowed allocation growth ratio")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results as the new baseline")
+    args = parser.parse_args()
+
+    # 回答修正会打 warning 日志，基准运行时屏蔽，避免 I/O 干扰计时。
+    logging.disable(logging.WARNING)
+
+    markdown_path = AI_ROOT / args.markdown
+    if args.snapshot_corpus:
+        _snapshot_markdown_corpus(markdown_path)
+        print(f"[bench_pipeline] markdown corpus snapshot written to: {markdown_path}")
+        return 0
+
+    markdown = _load_markdown_corpus(markdown_path)
+    answers = _load_answers(AI_ROOT / args.answers)
+    fingerprint = _corpus_fingerprint(markdown, answers)
+    print(f"[bench_pipeline] markdown_files={len(markdown)} answers={len(answers)} corpus={fingerprint}")
+
+    suite = _build_suite(markdown, answers)
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, calls in suite.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = _run_bench(calls, max(1, args.rounds))
+        row = results[name]
+        print(
+            f"{name:<38} ops/s={row['ops_per_sec']:>10.1f} p50={row['p50_us']:>9.1f}us "
+            f"p99={row['p99_us']:>9.1f}us alloc={row['alloc_peak_kb_per_op']:>8.1f}KB/op "
+            f"rel_p50={row['relative_p50']:.3f}"
+        )
+
+    report = {"corpus": fingerprint, "python": sys.version.split()[0], "results": results}
+    output_path = AI_ROOT / args.output
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"[bench_pipeline] report written to: {output_path}")
+
+    baseline_path = AI_ROOT / args.baseline
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"[bench_pipeline] baseline updated: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"[bench_pipeline] WARN: baseline not found, skip comparison: {baseline_path}")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline.get("corpus") != fingerprint:
+        print(
+            f"[bench_pipeline] FAIL: corpus changed ({baseline.get('corpus')} -> {fingerprint}); "
+            "results are not comparable, refresh with --update-baseline if the change is intended"
+        )
+        return 1
+
+    regressions = _compare(results, baseline.get("results", {}), args.max_regression, args.max_alloc_regression)
+    if regressions:
+        print("[bench_pipeline] REGRESSION")
+        for row in regressions:
+            print(f"- {row}")
+        return 1
+
+    print("[bench_pipeline] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
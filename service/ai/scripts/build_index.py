@@ -38,6 +38,14 @@ def main():
     vs.initialize(force_rebuild=args.force)
 
     logger.info("Index build complete!")
+    if vs.build_report:
+        report = vs.build_report
+        logger.info(
+            "Build report: "
+            f"files markdown={report['markdown_files']} code={report['code_files']}, "
+            f"chunks loaded={report['chunks_loaded']} indexed={report['chunks_indexed']}, "
+            f"near-duplicates dropped={report['near_duplicates_dropped']}"
+        )
 
     # 简单验证
     test_query = "galay"
@@ -62,10 +62,12 @@ def match_file_contains(expect: List[str], candidates: List[str]) -> bool:
     return False
 
 
-def evaluate_search(base_url: str, case: Dict[str, Any], top_k: int, timeout: float) -> Dict[str, Any]:
+def evaluate_search(
+    base_url: str, case: Dict[str, Any], top_k: int, timeout: float, retrieval_profile: str | None = None
+) -> Dict[str, Any]:
     status, data = post_json(
         f"{base_url}/api/search",
-        {"query": case["query"], "k": top_k},
+        {"query": case["query"], "k": top_k, "retrieval_profile": retrieval_profile},
         timeout=timeout,
     )
     if status != 200:
@@ -95,13 +97,16 @@ def evaluate_search(base_url: str, case: Dict[str, Any], top_k: int, timeout: fl
     }
 
 
-def evaluate_chat(base_url: str, case: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+def evaluate_chat(
+    base_url: str, case: Dict[str, Any], timeout: float, retrieval_profile: str | None = None
+) -> Dict[str, Any]:
     status, data = post_json(
         f"{base_url}/api/chat",
         {
             "message": case["query"],
             "session_id": f"eval-{case['id']}",
             "use_memory": False,
+            "retrieval_profile": retrieval_profile,
         },
         timeout=timeout,
     )
@@ -139,6 +144,11 @@ def main() -> None:
     parser.add_argument("--top-k", type=int, default=5)
     parser.add_argument("--timeout", type=float, default=20.0)
     parser.add_argument("--min-pass-rate", type=float, default=0.7)
+    parser.add_argument(
+        "--retrieval-profile",
+        default=None,
+        help="Retrieval profile for search/chat requests (fast | balanced | thorough); default: server default",
+    )
     args = parser.parse_args()
 
     ai_dir = Path(__file__).resolve().parent.parent
@@ -148,6 +158,7 @@ def main() -> None:
     print(f"[INFO] Base URL: {args.base_url}")
     print(f"[INFO] Cases: {cases_path}")
     print(f"[INFO] Mode: {args.mode}")
+    print(f"[INFO] Retrieval profile: {args.retrieval_profile or 'server default'}")
     print(f"[INFO] Total cases: {len(cases)}")
 
     passed = 0
@@ -160,11 +171,11 @@ def main() -> None:
         chat_ok = True
 
         if args.mode in {"search", "all"}:
-            search_result = evaluate_search(args.base_url, case, args.top_k, args.timeout)
+            search_result = evaluate_search(args.base_url, case, args.top_k, args.timeout, args.retrieval_profile)
             case_result["search"] = search_result
             search_ok = search_result.get("ok", False)
         if args.mode in {"chat", "all"}:
-            chat_result = evaluate_chat(args.base_url, case, args.timeout)
+            chat_result = evaluate_chat(args.base_url, case, args.timeout, args.retrieval_profile)
             case_result["chat"] = chat_result
             chat_ok = chat_result.get("ok", False)
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Local OpenAI-compatible mock provider with injectable latency.
+
+Serves `/v1/chat/completions` (plain and SSE streaming) and `/v1/embeddings`.
+Every `slow_every`-th request waits `slow_ms` instead of `base_ms` before the
+response (or before the first streamed chunk), which reproduces the occasional
+slow provider responses that dominate tail latency. Setting `fail_status`
+(e.g. 500) makes every request fail, to simulate an upstream outage.
+
+Chat responses report `usage.prompt_tokens_details.cached_tokens` like a
+provider with automatic prefix caching: the longest prefix (of the serialized
+messages) shared with an earlier request counts as cached, rounded down to
+`cache_block_tokens`. Streaming responses append a usage chunk when the client
+sends `stream_options.include_usage`.
+
+Usable standalone:
+    python scripts/mock_openai_provider.py --port 18080 --slow-every 20 --slow-ms 1500
+or in-process from verify/bench scripts via `MockOpenAIProvider`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.server
+import json
+import threading
+import time
+from typing import Any, Dict
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_MockServer"
+
+    def setup(self) -> None:
+        super().setup()
+        # 每个 TCP 连接只调用一次：用于检查客户端是否复用 keep-alive 连接
+        self.server.provider.record_connection()
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        delay = self.server.provider.next_delay_seconds()
+        if self.server.provider.fail_status:
+            time.sleep(delay)
+            self._send_json({"error": {"message": "injected failure"}}, status=self.server.provider.fail_status)
+        elif self.path.rstrip("/").endswith("/embeddings"):
+            time.sleep(delay)
+            self._send_json(self.server.provider.embedding_body(payload))
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self.server.provider.record_chat_model(payload)
+            usage = self.server.provider.chat_usage(payload)
+            if payload.get("stream"):
+                include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+                self._stream_chat(delay, usage if include_usage else None)
+            else:
+                time.sleep(delay)
+                self._send_json(self.server.provider.chat_body(usage))
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+    def _send_json(self, body: Dict[str, Any], status: int = 200) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_chat(self, first_chunk_delay: float, usage: Dict[str, Any] | None) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        provider = self.server.provider
+        try:
+            time.sleep(first_chunk_delay)
+            for index, piece in enumerate(provider.stream_pieces):
+                if index:
+                    time.sleep(provider.chunk_interval_ms / 1000.0)
+                self._write_chunk(provider.stream_chunk(piece))
+            if usage is not None:
+                self._write_chunk(provider.usage_chunk(usage))
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端（落败的对冲请求）主动断开
+            provider.record_aborted_stream()
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class _MockServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    provider: "MockOpenAIProvider"
+
+
+class MockOpenAIProvider:
+    """OpenAI 兼容的本地桩服务，延迟可注入"""
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        base_ms: float = 20.0,
+        slow_every: int = 0,
+        slow_ms: float = 1000.0,
+        chunk_interval_ms: float = 5.0,
+        dimensions: int = 8,
+        cache_block_tokens: int = 64,
+    ) -> None:
+        self.base_ms = base_ms
+        self.slow_every = slow_every
+        self.slow_ms = slow_ms
+        self.chunk_interval_ms = chunk_interval_ms
+        self.fail_status = 0
+        self.dimensions = dimensions
+        self.cache_block_tokens = cache_block_tokens
+        self._prompts: list[str] = []
+        self.stream_pieces = ["galay-http ", "是基于 C++20 协程的 ", "HTTP 库。"]
+        self.requests = 0
+        self.connections = 0
+        self.aborted_streams = 0
+        # 每个对话请求里的 model 字段，按到达顺序
+        self.chat_models: list[str] = []
+        self._lock = threading.Lock()
+        self._server = _MockServer((host, port), _Handler)
+        self._server.provider = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIProvider":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def next_delay_seconds(self) -> float:
+        with self._lock:
+            self.requests += 1
+            slow = self.slow_every > 0 and self.requests % self.slow_every == 0
+        return (self.slow_ms if slow else self.base_ms) / 1000.0
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def record_chat_model(self, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self.chat_models.append(str(payload.get("model", "")))
+
+    def record_aborted_stream(self) -> None:
+        with self._lock:
+            self.aborted_streams += 1
+
+    def embedding_body(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = payload.get("input") or [""]
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            seed = sum(ord(ch) for ch in str(text)) or 1
+            vector = [((seed * (i + 7)) % 97) / 97.0 for i in range(self.dimensions)]
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        return {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    def chat_usage(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """按与历史请求的最长公共前缀估算缓存命中（约 4 字符 / token）"""
+        prompt = json.dumps(payload.get("messages") or [], ensure_ascii=False)
+        with self._lock:
+            shared = max((_common_prefix_len(prompt, seen) for seen in self._prompts), default=0)
+            self._prompts.append(prompt)
+        prompt_tokens = max(1, len(prompt) // 4)
+        block = max(1, self.cache_block_tokens)
+        cached = (shared // 4) // block * block
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(self.stream_pieces),
+            "total_tokens": prompt_tokens + len(self.stream_pieces),
+            "prompt_tokens_details": {"cached_tokens": min(cached, prompt_tokens)},
+        }
+
+    def chat_body(self, usage: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mock-chat",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(self.stream_pieces)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    def stream_chunk(self, piece: str) -> str:
+        body = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "mock-chat",
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    def usage_chunk(self, usage: Dict[str, Any]) -> str:
+        body = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "mock-chat",
+            "choices": [],
+            "usage": usage,
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--base-ms", type=float, default=20.0, help="Normal response / first-chunk latency")
+    parser.add_argument("--slow-every", type=int, default=0, help="Every N-th request is slow (0 = never)")
+    parser.add_argument("--slow-ms", type=float, default=1000.0, help="Latency of slow requests")
+    parser.add_argument("--fail-status", type=int, default=0, help="Fail every request with this HTTP status")
+    args = parser.parse_args()
+
+    provider = MockOpenAIProvider(
+        host=args.host,
+        port=args.port,
+        base_ms=args.base_ms,
+        slow_every=args.slow_every,
+        slow_ms=args.slow_ms,
+    )
+    provider.fail_status = args.fail_status
+    print(f"[mock_openai_provider] serving {provider.base_url}")
+    try:
+        provider._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for the in-memory session store.
+
+Writer threads append numbered turns to a shared pool of sessions while
+reader threads take lock-free snapshots. Checks, for every snapshot and
+for the final state:
+1) History never exceeds the per-session bound.
+2) Each user entry is immediately followed by its own assistant entry
+   (turns are never torn or interleaved).
+3) Per-writer sequence numbers only increase within a session.
+4) Without eviction, every written session keeps its history.
+A second phase runs with fewer slots than sessions to exercise eviction. A
+third phase keeps a set of hot sessions busy (written and read continuously)
+while new sessions churn through the remaining slots, so the CLOCK hand keeps
+rotating past the hot sessions; a hot session that is not actually evicted
+must never read back empty or shorter than before, and must keep every turn.
+Prints appends/sec and snapshots/sec.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Set
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.services.session_store import InMemorySessionStore  # noqa: E402
+
+
+def _check_history(history: List[dict], max_entries: int) -> str:
+    if len(history) > max_entries:
+        return f"history too long: {len(history)} > {max_entries}"
+    if len(history) % 2:
+        return f"odd history length: {len(history)}"
+    last_seq: Dict[str, int] = {}
+    for index in range(0, len(history), 2):
+        user, assistant = history[index], history[index + 1]
+        if user["role"] != "user" or assistant["role"] != "assistant":
+            return f"roles out of order at {index}: {user['role']}/{assistant['role']}"
+        if assistant["content"] != f"ack {user['content']}":
+            return f"torn turn at {index}: {user['content']!r} / {assistant['content']!r}"
+        writer, seq = user["content"].rsplit(":", 1)
+        if int(seq) <= last_seq.get(writer, -1):
+            return f"sequence went backwards for {writer}: {seq}"
+        last_seq[writer] = int(seq)
+    return ""
+
+
+def _run_phase(
+    name: str,
+    *,
+    writers: int,
+    readers: int,
+    sessions: int,
+    appends: int,
+    max_sessions: int,
+    rounds: int,
+) -> List[str]:
+    store = InMemorySessionStore(max_sessions, rounds, ttl_seconds=3600)
+    max_entries = rounds * 2
+    failures: List[str] = []
+    failures_lock = threading.Lock()
+    stop_readers = threading.Event()
+    snapshot_counts = [0] * readers
+    start_barrier = threading.Barrier(writers + readers + 1)
+
+    def fail(message: str) -> None:
+        with failures_lock:
+            if len(failures) < 20:
+                failures.append(f"{name}: {message}")
+
+    def writer(writer_id: int) -> None:
+        start_barrier.wait()
+        try:
+            for seq in range(appends):
+                session_id = f"s{(writer_id + seq) % sessions}"
+                content = f"w{writer_id}:{seq}"
+                store.append_turn(session_id, content, f"ack {content}")
+        except Exception as e:  # 任何异常都是并发缺陷
+            fail(f"writer {writer_id} raised {type(e).__name__}: {e}")
+
+    def reader(reader_id: int) -> None:
+        start_barrier.wait()
+        count = 0
+        try:
+            while not stop_readers.is_set():
+                for index in range(sessions):
+                    problem = _check_history(store.get_history(f"s{index}"), max_entries)
+                    if problem:
+                        fail(f"reader snapshot s{index}: {problem}")
+                    count += 1
+                store.list_sessions()
+                # 每轮扫描后让出 GIL，避免读线程空转饿死写线程。
+                time.sleep(0)
+        except Exception as e:
+            fail(f"reader {reader_id} raised {type(e).__name__}: {e}")
+        snapshot_counts[reader_id] = count
+
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    reader_threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in writer_threads + reader_threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_readers.set()
+    for thread in reader_threads:
+        thread.join()
+
+    active = store.list_sessions()
+    if len(active) > max_sessions:
+        fail(f"{len(active)} active sessions exceed max_sessions={max_sessions}")
+    for session_id in active:
+        problem = _check_history(store.get_history(session_id), max_entries)
+        if problem:
+            fail(f"final {session_id}: {problem}")
+
+    if max_sessions >= sessions:
+        # 无淘汰时，每个被写入过的会话都必须保留历史。
+        touched = {(writer_id + seq) % sessions for writer_id in range(writers) for seq in range(appends)}
+        for index in sorted(touched):
+            if not store.get_history(f"s{index}"):
+                fail(f"final s{index}: history lost")
+
+    total_appends = writers * appends
+    print(
+        f"[stress_session_store] {name:<9} writers={writers} readers={readers} sessions={sessions} "
+        f"max_sessions={max_sessions} appends={total_appends} "
+        f"appends/s={total_appends / elapsed:,.0f} snapshots/s={sum(snapshot_counts) / elapsed:,.0f}"
+    )
+    return failures
+
+
+CHURN_INTERVAL_SECONDS = 0.001
+
+
+class _ObservedSessions(OrderedDict):
+    """记录时钟指针的旋转次数与真正被淘汰的会话
+
+    删除后又插回同一个会话对象也算旋转（不持分段锁的 del + 重新插入就是这样旋转的）。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rotations = 0
+        self.evicted: Set[str] = set()
+        self._removed: Dict[str, object] = {}
+
+    def move_to_end(self, key, last=True):  # type: ignore[override]
+        self.rotations += 1
+        super().move_to_end(key, last)
+
+    def __delitem__(self, key) -> None:
+        self._removed[key] = self[key]
+        self.evicted.add(key)
+        super().__delitem__(key)
+
+    def __setitem__(self, key, value) -> None:
+        if self._removed.pop(key, None) is value:
+            self.rotations += 1
+            self.evicted.discard(key)
+        super().__setitem__(key, value)
+
+
+def _run_rotation_phase(*, hot: int, churn_slots: int, readers: int, appends: int, rounds: int) -> List[str]:
+    name = "rotating"
+    store = InMemorySessionStore(hot + churn_slots, rounds, ttl_seconds=3600)
+    observed = _ObservedSessions()
+    store._sessions = observed  # noqa: SLF001
+    hot_ids = [f"hot{index}" for index in range(hot)]
+    # 先占满 churn 槽位再建热会话：第一次满员扫描淘汰的是 churn 会话
+    for index in range(churn_slots):
+        store.append_turn(f"warm{index}", f"warm{index}:0", f"ack warm{index}:0")
+    for session_id in hot_ids:
+        store.append_turn(session_id, f"{session_id}:0", f"ack {session_id}:0")
+    max_entries = rounds * 2
+    suspects: List[str] = []
+    suspects_lock = threading.Lock()
+    stop = threading.Event()
+    start_barrier = threading.Barrier(hot + readers + 2)
+    errors: List[str] = []
+
+    def suspect(session_id: str, message: str) -> None:
+        with suspects_lock:
+            suspects.append(f"{session_id}\0{message}")
+
+    def hot_writer(session_id: str) -> None:
+        start_barrier.wait()
+        try:
+            for seq in range(1, appends + 1):
+                store.append_turn(session_id, f"{session_id}:{seq}", f"ack {session_id}:{seq}")
+        except Exception as e:
+            errors.append(f"{name}: writer {session_id} raised {type(e).__name__}: {e}")
+
+    def reader() -> None:
+        start_barrier.wait()
+        seen = {session_id: 2 for session_id in hot_ids}
+        try:
+            while not stop.is_set():
+                for session_id in hot_ids:
+                    history = store.get_history(session_id)
+                    if len(history) < seen[session_id]:
+                        suspect(session_id, f"history shrank from {seen[session_id]} to {len(history)} entries")
+                    seen[session_id] = max(seen[session_id], len(history))
+                    problem = _check_history(history, max_entries)
+                    if problem:
+                        suspect(session_id, problem)
+                time.sleep(0)
+        except Exception as e:
+            errors.append(f"{name}: reader raised {type(e).__name__}: {e}")
+
+    def churn() -> None:
+        start_barrier.wait()
+        index = 0
+        while not stop.is_set():
+            store.append_turn(f"churn{index}", f"churn{index}:0", f"ack churn{index}:0")
+            index += 1
+            # 给热会话的读写留出时间重新置位访问标记，时钟指针越过它们时只旋转不淘汰
+            time.sleep(CHURN_INTERVAL_SECONDS)
+
+    hot_threads = [threading.Thread(target=hot_writer, args=(session_id,)) for session_id in hot_ids]
+    other_threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=churn)]
+    for thread in hot_threads + other_threads:
+        thread.start()
+    start_barrier.wait()
+    for thread in hot_threads:
+        thread.join()
+    stop.set()
+    for thread in other_threads:
+        thread.join()
+
+    failures = list(errors)
+    # 真被淘汰过的热会话变短是正常的，只追究没被淘汰却读到空 / 变短 / 丢轮次的情况
+    evicted_hot = observed.evicted.intersection(hot_ids)
+    for row in suspects:
+        session_id, message = row.split("\0", 1)
+        if session_id not in evicted_hot and len(failures) < 20:
+            failures.append(f"{name}: live {session_id}: {message}")
+    for session_id in hot_ids:
+        if session_id in evicted_hot:
+            continue
+        history = store.get_history(session_id)
+        expected = [f"{session_id}:{seq}" for seq in range(max(0, appends + 1 - rounds), appends + 1)]
+        if [entry["content"] for entry in history[::2]] != expected:
+            failures.append(f"{name}: live {session_id} lost turns: {[e['content'] for e in history[::2]]}")
+    if not observed.rotations:
+        failures.append(f"{name}: clock hand never rotated past a session")
+    # CLOCK 是近似 LRU，偶尔会淘汰一个热会话；大部分热会话必须留下，检查才有意义
+    if len(evicted_hot) > hot // 2:
+        failures.append(f"{name}: {len(evicted_hot)}/{hot} hot sessions were evicted, nothing left to check")
+    print(
+        f"[stress_session_store] {name:<9} hot={hot} churn_slots={churn_slots} readers={readers} "
+        f"rotations={observed.rotations} evictions={len(observed.evicted)} hot_evicted={len(evicted_hot)}"
+    )
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Stress test InMemorySessionStore")
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--appends", type=int, default=2000, help="Appends per writer thread")
+    parser.add_argument("--rounds", type=int, default=5, help="History rounds kept per session")
+    args = parser.parse_args()
+
+    # 线程切换间隔调小，放大交错概率。
+    sys.setswitchinterval(1e-5)
+
+    failures = _run_phase(
+        "no-evict",
+        writers=args.writers,
+        readers=args.readers,
+        sessions=args.sessions,
+        appends=args.appends,
+        max_sessions=args.sessions,
+        rounds=args.rounds,
+    )
+    failures += _run_phase(
+        "evicting",
+        writers=args.writers,
+        readers=args.readers,
+        sessions=args.sessions,
+        appends=args.appends,
+        max_sessions=max(1, args.sessions // 4),
+        rounds=args.rounds,
+    )
+    failures += _run_rotation_phase(
+        hot=8, churn_slots=4, readers=args.readers, appends=args.appends, rounds=args.rounds
+    )
+
+    if failures:
+        print("[stress_session_store] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[stress_session_store] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
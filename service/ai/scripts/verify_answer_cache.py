@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Check the answer cache of memoryless queries.
+
+Runs ChatService.query / query_stream and `/api/chat` with a fake vector store
+whose query embeddings are chosen per question, and counts LLM generations.
+Checks that:
+1) A repeated question (after normalization) is an exact hit: no retrieval or
+   LLM call, `cached: true` in the service result, the SSE done event and the
+   HTTP response.
+2) A paraphrase whose embedding is above ANSWER_CACHE_SIMILARITY_THRESHOLD is a
+   semantic hit; one below the threshold misses and calls the LLM.
+3) The cache keeps at most ANSWER_CACHE_MAX_ENTRIES answers and evicts the
+   least recently used one.
+4) An index reload (generation bump) invalidates every cached answer.
+5) hit_exact / hit_semantic / miss / evicted counters are emitted.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_UPSTREAMS = ""
+settings.FAST_MODEL_NAME = ""
+settings.RATE_LIMIT_ENABLED = False
+settings.ANSWER_CACHE_ENABLED = True
+settings.ANSWER_CACHE_SEMANTIC_ENABLED = True
+settings.ANSWER_CACHE_MAX_ENTRIES = 3
+settings.ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+import httpx  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+DIMENSIONS = 8
+QUESTION = "galay-http 是什么？"
+SAME_AFTER_NORMALIZATION = "  Galay-HTTP   是什么?"
+PARAPHRASE = "介绍一下 galay-http"
+UNRELATED_PARAPHRASE = "galay-http 和 galay-rpc 有什么区别"
+OTHER_QUESTIONS = ["galay-redis 是什么？", "galay-rpc 是什么？", "galay-kernel 是什么？"]
+
+
+def _axis(index: int, tilt: float = 0.0) -> List[float]:
+    """第 index 维为主方向；tilt 为向第 index+1 维偏转的弧度"""
+    vector = [0.0] * DIMENSIONS
+    vector[index] = math.cos(tilt)
+    vector[(index + 1) % DIMENSIONS] = math.sin(tilt)
+    return vector
+
+
+EMBEDDINGS: Dict[str, List[float]] = {
+    QUESTION: _axis(0),
+    SAME_AFTER_NORMALIZATION: _axis(0),
+    # cos(0.2) ≈ 0.98：高于阈值
+    PARAPHRASE: _axis(0, 0.2),
+    # cos(0.6) ≈ 0.83：低于阈值
+    UNRELATED_PARAPHRASE: _axis(0, 0.6),
+    **{question: _axis(2 + i) for i, question in enumerate(OTHER_QUESTIONS)},
+}
+
+
+class _FakeVectorStore:
+    is_ready = True
+
+    def __init__(self) -> None:
+        self.embedded: List[str] = []
+
+    def embed_query(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return EMBEDDINGS[text]
+
+
+def _docs() -> List[Tuple[Document, float]]:
+    doc = Document(
+        page_content="galay-http 是基于 C++20 协程的 HTTP 库，HttpRouter 注册路由，HttpServer 启动服务。" * 4,
+        metadata={"project": "galay-http", "source": "galay-http/README.md", "file_path": "README.md"},
+    )
+    return [(doc, 0.2)]
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self.retrievals = 0
+        self.generations: List[str] = []
+
+
+def _build_service() -> Tuple[ChatService, _Counters]:
+    counters = _Counters()
+    service = ChatService(_FakeVectorStore())  # type: ignore[arg-type]
+
+    def _retrieve(message, deadline, profile):
+        counters.retrievals += 1
+        return _docs()
+
+    def _generate(message, docs, llm=None, deadline=None):
+        counters.generations.append(message)
+        return f"回答：{message} —— galay-http 是基于 C++20 协程的 HTTP 库。"
+
+    service._retrieve = _retrieve  # type: ignore[method-assign]
+    service._rag.generate = _generate  # type: ignore[method-assign]
+    return service, counters
+
+
+def _check_hits(service: ChatService, counters: _Counters, failures: List[str]) -> None:
+    first = service.query(QUESTION)
+    exact = service.query(SAME_AFTER_NORMALIZATION)
+    semantic = service.query(PARAPHRASE)
+    below = service.query(UNRELATED_PARAPHRASE)
+    print(
+        f"[verify_answer_cache] first cached={first.get('cached', False)} exact={exact.get('cached')} "
+        f"semantic={semantic.get('cached')} below_threshold={below.get('cached', False)} "
+        f"llm_calls={len(counters.generations)} retrievals={counters.retrievals}"
+    )
+    if first.get("cached"):
+        failures.append("first query was reported as cached")
+    if not exact.get("cached") or exact["response"] != first["response"]:
+        failures.append("normalized repeat of a question was not an exact cache hit")
+    if not semantic.get("cached") or semantic["response"] != first["response"]:
+        failures.append("paraphrase above the similarity threshold was not a semantic hit")
+    if below.get("cached") or below["response"] == first["response"]:
+        failures.append("paraphrase below the similarity threshold was served from the cache")
+    if counters.generations != [QUESTION, UNRELATED_PARAPHRASE] or counters.retrievals != 2:
+        failures.append(f"cache hits still called retrieval / the LLM: {counters.generations}")
+
+
+async def _check_stream_and_http(service: ChatService, counters: _Counters, failures: List[str]) -> None:
+    calls = len(counters.generations)
+    events = [event async for event in service.query_stream(QUESTION)]
+    done = next((event for event in events if event.get("done")), {})
+
+    app_module._vector_store = service._vector_store  # type: ignore[assignment]
+    app_module._chat_service = service  # type: ignore[assignment]
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+        response = await client.post("/api/chat", json={"message": PARAPHRASE, "use_memory": False})
+    body = response.json()
+    print(f"[verify_answer_cache] stream done cached={done.get('cached')} http cached={body.get('cached')}")
+    if not done.get("cached"):
+        failures.append("query_stream done event is missing cached: true on a hit")
+    if response.status_code != 200 or body.get("cached") is not True:
+        failures.append(f"/api/chat response is missing cached: true on a hit: {response.status_code} {body}")
+    if len(counters.generations) != calls:
+        failures.append("stream / HTTP cache hits called the LLM")
+
+
+def _check_eviction(service: ChatService, counters: _Counters, failures: List[str]) -> None:
+    # 缓存里已有 QUESTION 与 UNRELATED_PARAPHRASE；先访问 QUESTION 使其成为最近使用
+    service.query(QUESTION)
+    for question in OTHER_QUESTIONS[:2]:
+        service.query(question)
+    calls = len(counters.generations)
+    kept = service.query(QUESTION)
+    evicted = service.query(UNRELATED_PARAPHRASE)
+    entries = metrics.snapshot()["gauges"].get("chat.answer_cache.entries")
+    print(
+        f"[verify_answer_cache] after eviction: recent_kept={kept.get('cached')} "
+        f"lru_evicted={not evicted.get('cached')} entries={entries:.0f}"
+    )
+    if not kept.get("cached"):
+        failures.append("recently used answer was evicted")
+    if evicted.get("cached") or len(counters.generations) != calls + 1:
+        failures.append("least recently used answer was not evicted")
+    if entries != settings.ANSWER_CACHE_MAX_ENTRIES:
+        failures.append(f"cache holds {entries} entries, max is {settings.ANSWER_CACHE_MAX_ENTRIES}")
+
+
+def _check_invalidation(service: ChatService, counters: _Counters, failures: List[str]) -> None:
+    if not service.query(QUESTION).get("cached"):
+        failures.append("answer not cached before the index reload")
+    service.on_index_reloaded()
+    calls = len(counters.generations)
+    exact = service.query(QUESTION)
+    semantic = service.query(PARAPHRASE)
+    print(
+        f"[verify_answer_cache] after reload: exact_cached={exact.get('cached', False)} "
+        f"semantic_cached={semantic.get('cached', False)} llm_calls={len(counters.generations) - calls}"
+    )
+    if exact.get("cached") or len(counters.generations) != calls + 1:
+        failures.append("index reload did not invalidate the exact cache entry")
+    if not semantic.get("cached"):
+        failures.append("answer generated after the reload was not cached under the new generation")
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    service, counters = _build_service()
+    _check_hits(service, counters, failures)
+    asyncio.run(_check_stream_and_http(service, counters, failures))
+    _check_eviction(service, counters, failures)
+    _check_invalidation(service, counters, failures)
+
+    counts = metrics.snapshot()["counters"]
+    names = ("hit_exact", "hit_semantic", "miss", "evicted")
+    print(
+        "[verify_answer_cache] counters "
+        + " ".join(f"{name}={counts.get(f'chat.answer_cache.{name}', 0):.0f}" for name in names)
+    )
+    for name in names:
+        if not counts.get(f"chat.answer_cache.{name}"):
+            failures.append(f"chat.answer_cache.{name} not emitted")
+
+    if failures:
+        print("[verify_answer_cache] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_answer_cache] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Check chat / search / admin bulkheads through the real FastAPI app.
+
+A fake chat service whose answers take a while saturates the chat bulkhead and
+checks that:
+1) Requests beyond concurrency + queue depth are shed with 503 + Retry-After.
+2) `/api/search` and `/health` keep answering quickly during the chat burst.
+3) Queue wait time is exported per bulkhead and no slot leaks after the burst.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+settings.BULKHEAD_CHAT_CONCURRENCY = 2
+settings.BULKHEAD_CHAT_QUEUE = 2
+settings.BULKHEAD_SEARCH_CONCURRENCY = 2
+settings.BULKHEAD_SEARCH_QUEUE = 8
+settings.BULKHEAD_RETRY_AFTER_SECONDS = 3
+# 只观察隔舱本身，关闭按客户端限流。
+settings.RATE_LIMIT_ENABLED = False
+
+import httpx  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from src.core.bulkhead import bulkhead_stats  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+CHAT_SECONDS = 0.4
+BURST = 12
+
+
+class _FakeVectorStore:
+    is_ready = True
+
+
+class _FakeRag:
+    def retrieve_with_score(self, query: str, k: int = 4, deadline=None, profile=None):
+        time.sleep(0.01)
+        return [(Document(page_content="galay-http 用法", metadata={"source": "README.md"}), 0.9)]
+
+
+class _FakeChatService:
+    rag_service = _FakeRag()
+
+    def query(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None) -> dict:
+        time.sleep(CHAT_SECONDS)
+        return {"success": True, "response": "galay-http 是协程 HTTP 库。", "sources": []}
+
+    async def query_stream(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None):
+        await asyncio.sleep(CHAT_SECONDS)
+        yield {"replace": "galay-http", "blocks": []}
+        yield {"done": True, "sources": []}
+
+    def llm_upstream_health(self) -> dict:
+        return {}
+
+
+async def _run(failures: List[str]) -> None:
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+
+        async def chat(index: int) -> httpx.Response:
+            return await client.post("/api/chat", json={"message": f"问题 {index}", "use_memory": False})
+
+        async def probe(path: str) -> float:
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            if path == "/health":
+                response = await client.get(path)
+            else:
+                response = await client.post(path, json={"query": "galay-http", "k": 1})
+            if response.status_code != 200:
+                failures.append(f"{path} returned {response.status_code} during chat burst")
+            return (time.perf_counter() - started) * 1000
+
+        results = await asyncio.gather(*(chat(i) for i in range(BURST)), probe("/api/search"), probe("/health"))
+        chats: List[httpx.Response] = list(results[:BURST])
+        search_ms, health_ms = results[BURST:]
+
+        ok = sum(1 for r in chats if r.status_code == 200)
+        shed = [r for r in chats if r.status_code == 503]
+        print(
+            f"[verify_bulkheads] chat ok={ok} shed={len(shed)} "
+            f"search_ms={search_ms:.1f} health_ms={health_ms:.1f}"
+        )
+        capacity = settings.BULKHEAD_CHAT_CONCURRENCY + settings.BULKHEAD_CHAT_QUEUE
+        if ok != capacity or len(shed) != BURST - capacity:
+            failures.append(f"chat: expected {capacity} ok and {BURST - capacity} shed, got ok={ok} shed={len(shed)}")
+        if any(r.headers.get("Retry-After") != str(settings.BULKHEAD_RETRY_AFTER_SECONDS) for r in shed):
+            failures.append("chat: shed responses are missing Retry-After")
+        if search_ms > CHAT_SECONDS * 1000 / 2 or health_ms > CHAT_SECONDS * 1000 / 2:
+            failures.append("search/health were slowed down by the chat burst")
+
+        # 流式接口在返回 200 之前占名额：排满时同样 503
+        streams = await asyncio.gather(
+            *(client.post("/api/chat/stream", json={"message": "流式", "use_memory": False}) for _ in range(BURST))
+        )
+        stream_ok = sum(1 for r in streams if r.status_code == 200 and '"done": true' in r.text)
+        stream_shed = sum(1 for r in streams if r.status_code == 503)
+        print(f"[verify_bulkheads] stream ok={stream_ok} shed={stream_shed}")
+        if stream_ok != capacity or stream_shed != BURST - capacity:
+            failures.append(f"stream: expected {capacity} ok and {BURST - capacity} shed, got {stream_ok}/{stream_shed}")
+
+    histograms = metrics.snapshot()["histograms"]
+    wait = histograms.get("bulkhead.chat.queue_wait_ms", {})
+    print(f"[verify_bulkheads] chat queue_wait_ms p99={wait.get('p99', 0):.1f} stats={bulkhead_stats()}")
+    if not wait.get("count") or wait.get("p99", 0) < CHAT_SECONDS * 1000 / 2:
+        failures.append("chat: queue wait time not exported")
+    if "bulkhead.search.queue_wait_ms" not in histograms or "bulkhead.admin.queue_wait_ms" not in histograms:
+        failures.append("search/admin: queue wait time not exported")
+    leaked = {name: stats for name, stats in bulkhead_stats().items() if stats["active"] or stats["queued"]}
+    if leaked:
+        failures.append(f"slots leaked after the burst: {leaked}")
+
+
+def main() -> int:
+    app_module._vector_store = _FakeVectorStore()  # type: ignore[assignment]
+    app_module._chat_service = _FakeChatService()  # type: ignore[assignment]
+    metrics.reset()
+    failures: List[str] = []
+    asyncio.run(_run(failures))
+
+    if failures:
+        print("[verify_bulkheads] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_bulkheads] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Check deterministic chunk ids assigned at ingestion.
+
+Builds a small docs tree and a real (local, persistent) Chroma index with a
+deterministic fake embedding, then checks that:
+1) Every chunk gets chunk_index / content_hash / chunk_id metadata; ids are
+   unique and identical across loads.
+2) Editing one file changes only that file's ids.
+3) Chroma stores the chunks under their chunk_id; re-adding the same chunks
+   upserts instead of duplicating, and chunks can be deleted by id.
+4) Rerank keys (_doc_key) keep every chunk of one file distinct.
+No network access or real embedding model needed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.core.document_loader import GalayDocumentLoader  # noqa: E402
+from src.core.vector_store import VectorStoreManager  # noqa: E402
+from src.services.rag_service import _doc_key  # noqa: E402
+
+SECTION = "## {title}\n\n{body}\n\n```cpp\nHttpServer server(config);\nserver.start(std::move(router));\n```\n"
+
+
+class _HashEmbeddings(Embeddings):
+    def _embed(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:16]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _write_docs(root: Path, revision: str = "") -> None:
+    for name in ("快速开始", "路由"):
+        sections = [
+            SECTION.format(title=f"{name} 第 {i} 节", body=f"galay-http {name} 说明 {i}。" * 30) for i in range(6)
+        ]
+        (root / f"{name}.md").write_text("# " + name + "\n\n" + "\n".join(sections), encoding="utf-8")
+    (root / "路由.md").write_text((root / "路由.md").read_text(encoding="utf-8") + revision, encoding="utf-8")
+
+
+def main() -> int:
+    failures: List[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir = Path(tmp) / "galay-http"
+        docs_dir.mkdir()
+        settings.GALAY_DOCS_PATH = str(docs_dir)
+        settings.GALAY_DOCS_PATHS_FILE = ""
+        settings.VECTOR_STORE_PATH = str(Path(tmp) / "chroma")
+        _write_docs(docs_dir)
+
+        first = GalayDocumentLoader().load_all()
+        second = GalayDocumentLoader().load_all()
+        ids = [doc.metadata.get("chunk_id") for doc in first]
+        print(f"[verify_chunk_ids] chunks={len(first)} sample={ids[0] if ids else None}")
+        if not ids or not all(ids):
+            failures.append("chunks without chunk_id")
+        if len(set(ids)) != len(ids):
+            failures.append("chunk ids are not unique")
+        if ids != [doc.metadata.get("chunk_id") for doc in second]:
+            failures.append("chunk ids differ between two loads of the same tree")
+        if any(doc.metadata.get("chunk_index") is None or not doc.metadata.get("content_hash") for doc in first):
+            failures.append("chunks without chunk_index / content_hash")
+
+        _write_docs(docs_dir, revision="\n\n## 新增\n\n新增的路由说明。\n")
+        edited = GalayDocumentLoader().load_all()
+        by_source = lambda docs, name: [d.metadata["chunk_id"] for d in docs if d.metadata["source"] == name]  # noqa: E731
+        if by_source(edited, "快速开始.md") != by_source(first, "快速开始.md"):
+            failures.append("editing one file changed the ids of another file")
+        if by_source(edited, "路由.md") == by_source(first, "路由.md"):
+            failures.append("editing a file did not change its chunk ids")
+
+        keys = {_doc_key(doc) for doc in first}
+        if len(keys) != len(first):
+            failures.append(f"rerank keys collapse chunks: {len(first)} chunks -> {len(keys)} keys")
+
+        vs = VectorStoreManager()
+        vs._embedding_mgr._embeddings = _HashEmbeddings()  # noqa: SLF001
+        _write_docs(docs_dir)
+        vs.initialize(force_rebuild=True)
+        collection = vs.store._collection  # noqa: SLF001
+        stored = collection.get()["ids"]
+        if sorted(stored) != sorted(ids):
+            failures.append("Chroma ids are not the loader's chunk ids")
+
+        vs.add_documents(first[:3])
+        count_after_upsert = collection.count()
+        vs.delete_documents(ids[:2])
+        count_after_delete = collection.count()
+        print(
+            f"[verify_chunk_ids] stored={len(stored)} after_upsert={count_after_upsert} "
+            f"after_delete={count_after_delete}"
+        )
+        if count_after_upsert != len(ids):
+            failures.append(f"re-adding chunks duplicated them: {count_after_upsert} != {len(ids)}")
+        if count_after_delete != len(ids) - 2 or collection.get(ids=ids[:2])["ids"]:
+            failures.append("delete by chunk id did not remove exactly those chunks")
+
+    if failures:
+        print("[verify_chunk_ids] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_chunk_ids] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
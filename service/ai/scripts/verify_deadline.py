@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Check request deadline propagation through retrieval, embedding and the LLM.
+
+1) With plenty of budget retrieval runs the wide candidate fetch and the
+   lexical fallback; with a short budget both are skipped and counted.
+2) An already expired deadline stops retrieval before the vector search.
+3) Query embedding against a slow mock provider gives up at the deadline
+   instead of waiting for the full response.
+4) LLM invoke / astream against a slow mock provider give up at the deadline,
+   without counting the upstream as failed.
+5) `/api/chat` hands a deadline to the chat service and maps an exceeded
+   deadline to 504.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_MAX_RETRIES = 0
+settings.LLM_UPSTREAMS = ""
+settings.HEDGE_EMBEDDINGS_ENABLED = False
+settings.HEDGE_LLM_STREAM_ENABLED = False
+settings.RATE_LIMIT_ENABLED = False
+settings.DEADLINE_OPTIONAL_STAGE_MIN_SECONDS = 1.0
+
+import httpx  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from langchain_openai import OpenAIEmbeddings  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from src.core.deadline import Deadline, deadline_scope  # noqa: E402
+from src.core.embeddings import SafeEmbeddingAdapter  # noqa: E402
+from src.core.http_clients import get_async_http_client, get_http_client  # noqa: E402
+from src.core.llm import build_chat_model, stream_chat  # noqa: E402
+from src.services.rag_service import RAGService  # noqa: E402
+from src.utils.exceptions import DeadlineExceededError  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+SLOW_MS = 2000.0
+BUDGET_SECONDS = 0.4
+
+
+class _FakeVectorStore:
+    def __init__(self) -> None:
+        self.candidate_ks: List[int] = []
+
+    def search_with_score(self, query: str, k: int = 4):
+        self.candidate_ks.append(k)
+        return [(Document(page_content="galay-http 用法 HttpServer", metadata={"source": "README.md"}), 0.2)]
+
+
+class _FakeLlm:
+    def invoke(self, messages, **kwargs):
+        raise AssertionError("not used")
+
+
+def _check_retrieval(failures: List[str]) -> None:
+    store = _FakeVectorStore()
+    rag = RAGService(store, llm=_FakeLlm())  # type: ignore[arg-type]
+    lexical_calls: List[int] = []
+    rag._lexical_fallback = lambda terms, *args, **kwargs: lexical_calls.append(1) or []  # type: ignore[method-assign]
+
+    rag.retrieve_with_score("galay-http HttpServer 用法", k=4, deadline=Deadline(60))
+    wide_k, wide_lexical = store.candidate_ks[-1], len(lexical_calls)
+    rag.retrieve_with_score("galay-http HttpServer 用法", k=4, deadline=Deadline(0.5))
+    short_k, short_lexical = store.candidate_ks[-1], len(lexical_calls) - wide_lexical
+    counters = metrics.snapshot()["counters"]
+    print(
+        f"[verify_deadline] retrieval wide_k={wide_k} short_k={short_k} "
+        f"lexical={wide_lexical}/{short_lexical} skipped={counters.get('deadline.skipped.wide_fetch', 0):.0f}"
+        f"/{counters.get('deadline.skipped.lexical_fallback', 0):.0f}"
+    )
+    if wide_k < 64 or wide_lexical != 1:
+        failures.append("retrieval: wide fetch / lexical fallback did not run with plenty of budget")
+    if short_k >= wide_k or short_lexical:
+        failures.append("retrieval: optional stages still ran with a short budget")
+    if not counters.get("deadline.skipped.wide_fetch") or not counters.get("deadline.skipped.lexical_fallback"):
+        failures.append("retrieval: skipped stages not counted in metrics")
+
+    expired = Deadline(0)
+    calls = len(store.candidate_ks)
+    try:
+        rag.retrieve_with_score("galay-http", k=4, deadline=expired)
+        failures.append("retrieval: expired deadline did not raise")
+    except DeadlineExceededError:
+        pass
+    if len(store.candidate_ks) != calls:
+        failures.append("retrieval: vector search ran after the deadline")
+
+
+def _check_embedding(base_url: str, failures: List[str]) -> None:
+    adapter = SafeEmbeddingAdapter(
+        base=OpenAIEmbeddings(
+            model="mock-embedding",
+            openai_api_key=settings.OPENAI_API_KEY,
+            openai_api_base=base_url,
+            check_embedding_ctx_length=False,
+            max_retries=0,
+            http_client=get_http_client(base_url),
+            http_async_client=get_async_http_client(base_url),
+        ),
+        batch_size=8,
+    )
+    started = time.perf_counter()
+    try:
+        with deadline_scope(Deadline(BUDGET_SECONDS)):
+            adapter.embed_query("slow embedding")
+        failures.append("embedding: slow request finished inside a short deadline")
+    except DeadlineExceededError:
+        pass
+    elapsed = time.perf_counter() - started
+    print(f"[verify_deadline] embedding gave up after {elapsed:.2f}s")
+    if elapsed > BUDGET_SECONDS + 0.5:
+        failures.append(f"embedding: waited {elapsed:.2f}s for a {BUDGET_SECONDS}s deadline")
+
+
+async def _check_llm(failures: List[str]) -> None:
+    router = build_chat_model()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(router.invoke, "hi", Deadline(BUDGET_SECONDS))
+        failures.append("llm invoke: slow request finished inside a short deadline")
+    except DeadlineExceededError:
+        pass
+    invoke_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        async for _ in stream_chat(router, "hi", Deadline(BUDGET_SECONDS)):
+            pass
+        failures.append("llm stream: slow stream finished inside a short deadline")
+    except DeadlineExceededError:
+        pass
+    stream_elapsed = time.perf_counter() - started
+
+    upstream = next(iter(router.health().values()))
+    print(
+        f"[verify_deadline] llm invoke={invoke_elapsed:.2f}s stream={stream_elapsed:.2f}s "
+        f"upstream_failures={upstream['failures']} state={upstream['state']}"
+    )
+    for name, elapsed in (("invoke", invoke_elapsed), ("stream", stream_elapsed)):
+        if elapsed > BUDGET_SECONDS + 0.5:
+            failures.append(f"llm {name}: waited {elapsed:.2f}s for a {BUDGET_SECONDS}s deadline")
+    if upstream["failures"]:
+        failures.append("llm: deadline expiry was counted as an upstream failure")
+
+
+class _FakeVectorStoreReady:
+    is_ready = True
+
+
+class _DeadlineChatService:
+    def __init__(self) -> None:
+        self.deadlines: List[object] = []
+
+    def query(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None) -> dict:
+        self.deadlines.append(deadline)
+        raise DeadlineExceededError()
+
+
+async def _check_http(failures: List[str]) -> None:
+    svc = _DeadlineChatService()
+    app_module._vector_store = _FakeVectorStoreReady()  # type: ignore[assignment]
+    app_module._chat_service = svc  # type: ignore[assignment]
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+        response = await client.post("/api/chat", json={"message": "galay-http", "use_memory": False})
+    print(f"[verify_deadline] http status={response.status_code}")
+    if not svc.deadlines or not isinstance(svc.deadlines[0], Deadline):
+        failures.append("http: chat service did not receive a deadline")
+    if response.status_code != 504:
+        failures.append(f"http: expected 504 for an exceeded deadline, got {response.status_code}")
+
+
+async def _run_async(failures: List[str]) -> None:
+    await _check_llm(failures)
+    await _check_http(failures)
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    _check_retrieval(failures)
+
+    provider = MockOpenAIProvider(base_ms=SLOW_MS).start()
+    settings.OPENAI_API_BASE = provider.base_url
+    try:
+        _check_embedding(provider.base_url, failures)
+        asyncio.run(_run_async(failures))
+    finally:
+        provider.stop()
+
+    if failures:
+        print("[verify_deadline] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_deadline] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
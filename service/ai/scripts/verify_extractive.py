@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Check the opt-in extractive answer path.
+
+Runs ChatService.query / query_stream / chat with fake retrieval (scores chosen
+per case) and an LLM that records every call. Checks that:
+1) A high-confidence definition question with EXTRACTIVE_ANSWER_ENABLED and
+   per-request allow_extractive is answered from the document text, with the
+   extractive lead and source citations, without calling the LLM, in all three
+   entry points.
+2) The config flag and allow_extractive are both required.
+3) The _compute_evidence_confidence gate: just above the threshold fires, just
+   below falls back to the LLM; usage / setup questions never fire.
+4) Only EXTRACTIVE_ANSWER_MAX_CHUNKS chunks are quoted, long chunks are cut at
+   paragraph boundaries within EXTRACTIVE_ANSWER_MAX_CHARS and code fences
+   stay balanced.
+5) chat.extractive.considered / fired / skipped_query / skipped_confidence
+   counters are emitted.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_UPSTREAMS = ""
+settings.FAST_MODEL_NAME = ""
+settings.ANSWER_CACHE_ENABLED = False
+settings.HISTORY_SUMMARY_ENABLED = False
+settings.EXTRACTIVE_ANSWER_MIN_CONFIDENCE = 0.8
+settings.EXTRACTIVE_ANSWER_MAX_CHUNKS = 2
+settings.EXTRACTIVE_ANSWER_MAX_CHARS = 600
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.messages import AIMessage, AIMessageChunk  # noqa: E402
+
+from src.services import chat_service as chat_module  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+QUESTION = "galay-http 是什么？"
+USAGE_QUESTION = "怎么用 galay-http 写一个 HTTP 服务器示例？"
+LLM_ANSWER = "这是模型生成的回答。"
+
+
+def _docs(*scores: float) -> List[Tuple[Document, float]]:
+    sources = ["galay-http/README.md", "galay-http/docs/架构.md", "galay-http/docs/路由.md"]
+    docs = []
+    for index, score in enumerate(scores):
+        body = f"galay-http 是基于 C++20 协程的 HTTP 库（第 {index} 篇）。\n\nHttpServer 在 Runtime 调度器上运行。"
+        docs.append(
+            (
+                Document(
+                    page_content=f"# 概述 {index}\n\n{body}",
+                    metadata={"project": "galay-http", "source": sources[index % len(sources)]},
+                ),
+                score,
+            )
+        )
+    return docs
+
+
+class _RecordingLlm:
+    def __init__(self) -> None:
+        self.calls: List[str] = []
+
+    def invoke(self, messages, **kwargs):
+        self.calls.append("invoke")
+        return AIMessage(content=LLM_ANSWER)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls.append("ainvoke")
+        return AIMessage(content=LLM_ANSWER)
+
+    async def astream(self, messages, **kwargs):
+        self.calls.append("astream")
+        yield AIMessageChunk(content=LLM_ANSWER)
+
+
+def _build_service(llm: _RecordingLlm, retrieved: List[List[Tuple[Document, float]]]) -> ChatService:
+    service = ChatService(vector_store=None)
+    service._retrieve = lambda message, deadline, profile: retrieved[0]  # type: ignore[method-assign]
+    service._retrieve_for_session = lambda *args, **kwargs: retrieved[0]  # type: ignore[method-assign]
+    service._select_model = lambda *args, **kwargs: llm  # type: ignore[method-assign]
+
+    def _generate(message, docs, llm_override=None, deadline=None):
+        llm.calls.append("generate")
+        return LLM_ANSWER
+
+    async def _generate_stream(message, docs, llm_override=None, deadline=None):
+        llm.calls.append("generate_stream")
+        yield LLM_ANSWER
+
+    service._rag.generate = _generate  # type: ignore[method-assign]
+    service._rag.generate_stream = _generate_stream  # type: ignore[method-assign]
+    return service
+
+
+async def _collect(events) -> List[dict]:
+    return [event async for event in events]
+
+
+def _check_fast_path(service: ChatService, llm: _RecordingLlm, failures: List[str]) -> None:
+    result = service.query(QUESTION, allow_extractive=True)
+    events = asyncio.run(_collect(service.query_stream(QUESTION, allow_extractive=True)))
+    chat_events = asyncio.run(_collect(service.chat_stream(QUESTION, "verify-extractive", allow_extractive=True)))
+    chat_result = service.chat(QUESTION, "verify-extractive-sync", allow_extractive=True)
+    answer = result.get("response", "")
+    print(
+        f"[verify_extractive] fast path: extractive={result.get('extractive')} "
+        f"stream={events[-1].get('extractive')} chat_stream={chat_events[-1].get('extractive')} "
+        f"chat={chat_result.get('extractive')} llm_calls={llm.calls}"
+    )
+    if not result.get("extractive") or not answer.startswith(chat_module._EXTRACTIVE_ANSWER_LEAD):
+        failures.append("high-confidence definition question was not answered extractively")
+    if "参考来源" not in answer or "galay-http/README.md" not in answer:
+        failures.append("extractive answer is missing source citations")
+    if not result.get("sources"):
+        failures.append("extractive answer is missing the sources list")
+    if not events or not events[-1].get("extractive") or events[0].get("replace") != answer:
+        failures.append("query_stream did not serve the same extractive answer")
+    if not chat_events or not chat_events[-1].get("extractive") or not chat_result.get("extractive"):
+        failures.append("chat / chat_stream did not serve an extractive answer")
+    if not service._sessions.get_history("verify-extractive"):
+        failures.append("extractive chat_stream answer was not written to session history")
+    if llm.calls:
+        failures.append(f"LLM was called on the extractive path: {llm.calls}")
+
+
+def _check_gates(service: ChatService, llm: _RecordingLlm, retrieved, failures: List[str]) -> None:
+    cases = [
+        ("flag on, allow_extractive=false", True, False, QUESTION, (0.95, 0.9), False),
+        ("flag off, allow_extractive=true", False, True, QUESTION, (0.95, 0.9), False),
+        ("confidence just above threshold", True, True, QUESTION, (0.82, 0.78), True),
+        ("confidence just below threshold", True, True, QUESTION, (0.79, 0.79), False),
+        ("usage question", True, True, USAGE_QUESTION, (0.95, 0.9), False),
+    ]
+    for name, enabled, allow, question, scores, expect_extractive in cases:
+        settings.EXTRACTIVE_ANSWER_ENABLED = enabled
+        retrieved[0] = _docs(*scores)
+        confidence = chat_module._compute_evidence_confidence(retrieved[0])
+        llm.calls.clear()
+        result = service.query(question, allow_extractive=allow)
+        extractive = bool(result.get("extractive"))
+        print(
+            f"[verify_extractive] {name}: confidence={confidence:.3f} extractive={extractive} "
+            f"llm_calls={len(llm.calls)}"
+        )
+        if extractive != expect_extractive:
+            failures.append(f"{name}: extractive={extractive}, expected {expect_extractive}")
+        if expect_extractive == bool(llm.calls):
+            failures.append(f"{name}: LLM calls {llm.calls} do not match the extractive decision")
+    settings.EXTRACTIVE_ANSWER_ENABLED = True
+
+
+def _check_truncation(failures: List[str]) -> None:
+    long_text = "\n\n".join(
+        [f"第 {i} 段：galay-http 的说明文字。" * 6 for i in range(8)]
+        + ["```cpp\nHttpServer server(config);\n" + "server.start();\n" * 40 + "```"]
+    )
+    docs = [
+        Document(page_content=long_text, metadata={"project": "galay-http", "source": "galay-http/README.md"}),
+        Document(page_content="第二篇。" * 20, metadata={"project": "galay-http", "source": "galay-http/docs/a.md"}),
+        Document(page_content="第三篇。" * 20, metadata={"project": "galay-http", "source": "galay-http/docs/b.md"}),
+    ]
+    answer = chat_module._build_extractive_answer(docs)
+    body = answer.split("参考来源")[0]
+    # 代码块内部有空行：按段落截断会落在代码块中间
+    code_text = "简介段落。\n\n```cpp\n" + "\n\n".join(f"server.route(\"/r{i}\", handler);" for i in range(60)) + "\n```"
+    truncated = chat_module._truncate_markdown(code_text, 700)
+    paragraphs = code_text.split("\n\n")
+    boundaries = {"\n\n".join(paragraphs[:k]) for k in range(1, len(paragraphs) + 1)}
+    print(f"[verify_extractive] truncation: answer_chars={len(body)} truncated_chars={len(truncated)}")
+    if len(body) > settings.EXTRACTIVE_ANSWER_MAX_CHARS + len(chat_module._EXTRACTIVE_ANSWER_LEAD) + 200:
+        failures.append(f"extractive answer body has {len(body)} chars, budget {settings.EXTRACTIVE_ANSWER_MAX_CHARS}")
+    if "galay-http/docs/b.md" in answer:
+        failures.append("extractive answer quoted more than EXTRACTIVE_ANSWER_MAX_CHUNKS chunks")
+    if answer.count("```") % 2 or truncated.count("```") % 2:
+        failures.append("truncation left an unbalanced code fence")
+    if truncated.removesuffix("\n```") not in boundaries or len(truncated) > 700 + len("\n```"):
+        failures.append("_truncate_markdown did not cut at a paragraph boundary within the limit")
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    settings.EXTRACTIVE_ANSWER_ENABLED = True
+    llm = _RecordingLlm()
+    retrieved = [_docs(0.95, 0.9, 0.85)]
+    service = _build_service(llm, retrieved)
+
+    _check_fast_path(service, llm, failures)
+    _check_gates(service, llm, retrieved, failures)
+    _check_truncation(failures)
+
+    counters = metrics.snapshot()["counters"]
+    names = ("considered", "fired", "skipped_query", "skipped_confidence")
+    print(
+        "[verify_extractive] counters "
+        + " ".join(f"{name}={counters.get(f'chat.extractive.{name}', 0):.0f}" for name in names)
+    )
+    for name in names:
+        if not counters.get(f"chat.extractive.{name}"):
+            failures.append(f"chat.extractive.{name} not emitted")
+
+    if failures:
+        print("[verify_extractive] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_extractive] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Check request hedging against a local mock provider with injected slow responses.
+
+For `embed_query` and for the first-token phase of the chat stream, runs the
+same request sequence with hedging off and on and checks that:
+1) Hedging cuts p99 latency (slow responses are raced by a duplicate).
+2) Hedges fire, some win, and the hedge rate stays under HEDGE_MAX_RATE.
+3) Losing streams are closed (the mock sees the client disconnect).
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+# 对冲策略在导入时读取初始阈值，先写好测试配置。
+settings.HEDGE_DELAY_PERCENTILE = 90.0
+settings.HEDGE_MIN_DELAY_MS = 30
+settings.HEDGE_MAX_DELAY_MS = 3000
+settings.HEDGE_MIN_SAMPLES = 10
+settings.HEDGE_MAX_RATE = 0.2
+settings.OPENAI_API_KEY = "mock-key"
+
+from langchain_openai import OpenAIEmbeddings  # noqa: E402
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.core.embeddings import SafeEmbeddingAdapter  # noqa: E402
+from src.core.http_clients import get_async_http_client, get_http_client  # noqa: E402
+from src.core.llm import build_chat_model, stream_chat  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+REQUESTS = 100
+SLOW_EVERY = 20
+SLOW_MS = 800.0
+
+
+def _p99(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(0.99 * (len(ordered) - 1)))]
+
+
+def _run_embeddings(base_url: str, hedge: bool, tag: str) -> List[float]:
+    settings.HEDGE_EMBEDDINGS_ENABLED = hedge
+    adapter = SafeEmbeddingAdapter(
+        base=OpenAIEmbeddings(
+            model="mock-embedding",
+            openai_api_key=settings.OPENAI_API_KEY,
+            openai_api_base=base_url,
+            check_embedding_ctx_length=False,
+            http_client=get_http_client(base_url),
+            http_async_client=get_async_http_client(base_url),
+        ),
+        batch_size=8,
+    )
+    latencies: List[float] = []
+    for index in range(REQUESTS):
+        started = time.perf_counter()
+        adapter.embed_query(f"{tag} query {index}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def _run_streams(hedge: bool) -> List[float]:
+    settings.HEDGE_LLM_STREAM_ENABLED = hedge
+    llm = build_chat_model()
+    latencies: List[float] = []
+    for index in range(REQUESTS):
+        started = time.perf_counter()
+        first_ms = 0.0
+        chunks = 0
+        async for chunk in stream_chat(llm, f"question {index}"):
+            if not chunks:
+                first_ms = (time.perf_counter() - started) * 1000
+            chunks += 1 if chunk.content else 0
+        if chunks != 3:
+            raise RuntimeError(f"stream {index} returned {chunks} content chunks, expected 3")
+        latencies.append(first_ms)
+    return latencies
+
+
+def _check(
+    name: str,
+    off: List[float],
+    on: List[float],
+    failures: List[str],
+    extra: Callable[[], str] = lambda: "",
+) -> None:
+    counters = metrics.snapshot()["counters"]
+    requests = counters.get(f"hedge.{name}.requests", 0)
+    fired = counters.get(f"hedge.{name}.fired", 0)
+    won = counters.get(f"hedge.{name}.won", 0)
+    print(
+        f"[verify_hedging] {name:<16} p99_off={_p99(off):7.1f}ms p99_on={_p99(on):7.1f}ms "
+        f"requests={requests:.0f} fired={fired:.0f} won={won:.0f} {extra()}"
+    )
+    if _p99(on) >= _p99(off) * 0.6:
+        failures.append(f"{name}: hedging did not cut p99 ({_p99(off):.1f}ms -> {_p99(on):.1f}ms)")
+    if not fired or not won:
+        failures.append(f"{name}: expected hedges to fire and win, fired={fired} won={won}")
+    if requests and fired / requests > settings.HEDGE_MAX_RATE + 0.05:
+        failures.append(f"{name}: hedge rate {fired / requests:.2f} exceeds cap {settings.HEDGE_MAX_RATE}")
+
+
+def main() -> int:
+    failures: List[str] = []
+    provider = MockOpenAIProvider(base_ms=15.0, slow_every=SLOW_EVERY, slow_ms=SLOW_MS).start()
+    settings.OPENAI_API_BASE = provider.base_url
+    try:
+        metrics.reset()
+        off = _run_embeddings(provider.base_url, hedge=False, tag="off")
+        on = _run_embeddings(provider.base_url, hedge=True, tag="on")
+        _check("embed_query", off, on, failures)
+
+        aborted_before = provider.aborted_streams
+
+        async def _both() -> tuple:
+            # 共享的异步连接池绑定事件循环，两轮放在同一个循环里跑。
+            return await _run_streams(hedge=False), await _run_streams(hedge=True)
+
+        off, on = asyncio.run(_both())
+        # 落败的流在服务端写入时才会发现断开，稍等慢请求结束。
+        time.sleep(SLOW_MS / 1000.0 + 0.2)
+        aborted = provider.aborted_streams - aborted_before
+        _check("llm_first_token", off, on, failures, extra=lambda: f"aborted_streams={aborted}")
+        if aborted < 1:
+            failures.append("llm_first_token: losing streams were not closed")
+    finally:
+        provider.stop()
+
+    if failures:
+        print("[verify_hedging] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_hedging] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Check the shared upstream HTTP connection pools.
+
+Builds the chat model and the embedding model against two local mock providers
+and checks that:
+1) The LLM and embedding wrappers get the same pooled client for one origin
+   (different path prefixes included) and a separate one per other origin.
+2) Sequential chat / embedding requests reuse one keep-alive connection per
+   pool instead of opening a connection per request; concurrent requests stay
+   within HTTP_POOL_MAX_CONNECTIONS.
+3) embed_query inside a request deadline passes the per-request timeout through
+   to the embeddings client.
+4) `/metrics` http_pools reports per-origin request counts, connection counts
+   and utilisation for the sync and async pools.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_MAX_RETRIES = 0
+settings.LLM_UPSTREAMS = ""
+settings.HEDGE_LLM_STREAM_ENABLED = False
+settings.HEDGE_EMBEDDINGS_ENABLED = False
+settings.RATE_LIMIT_ENABLED = False
+settings.HTTP2_ENABLED = False
+settings.HTTP_POOL_MAX_CONNECTIONS = 4
+
+import httpx  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.core import http_clients  # noqa: E402
+from src.core.deadline import Deadline, deadline_scope  # noqa: E402
+from src.core.embeddings import EmbeddingManager  # noqa: E402
+from src.core.llm import build_chat_model  # noqa: E402
+
+SEQUENTIAL_REQUESTS = 20
+CONCURRENT_THREADS = 8
+
+
+def _build(base_url: str):
+    settings.OPENAI_API_BASE = base_url
+    router = build_chat_model()
+    embeddings = EmbeddingManager().get_embeddings()
+    # 离线环境没有 tiktoken 编码文件，跳过按 token 切分
+    embeddings._base.check_embedding_ctx_length = False  # noqa: SLF001
+    return router._upstreams[0].llm, embeddings  # noqa: SLF001
+
+
+def _check_sharing(primary: MockOpenAIProvider, other: MockOpenAIProvider, failures: List[str]):
+    chat, embeddings = _build(primary.base_url)
+    # 同一 origin 的另一个路径前缀
+    prefixed_chat, _ = _build(primary.base_url.replace("/v1", "/proxy/v1"))
+    other_chat, other_embeddings = _build(other.base_url)
+    base = embeddings._base  # noqa: SLF001
+    same_origin = chat.http_client is base.http_client is prefixed_chat.http_client
+    same_async = chat.http_async_client is base.http_async_client
+    separate = other_chat.http_client is not chat.http_client
+    print(
+        f"[verify_http_pools] one pool per origin: llm+embedding shared={same_origin} async shared={same_async} "
+        f"other origin separate={separate} origins={sorted(http_clients.http_pool_stats())}"
+    )
+    if not same_origin or not same_async:
+        failures.append("LLM and embedding wrappers do not share the pooled client of one origin")
+    if not separate or other_embeddings._base.http_client is not other_chat.http_client:  # noqa: SLF001
+        failures.append("different origins share a pool / one origin has several pools")
+    if len(http_clients.http_pool_stats()) != 2:
+        failures.append(f"expected 2 pooled origins, got {sorted(http_clients.http_pool_stats())}")
+    return chat, embeddings
+
+
+def _check_keepalive(provider: MockOpenAIProvider, chat, embeddings, failures: List[str]) -> None:
+    before = provider.connections
+    for index in range(SEQUENTIAL_REQUESTS):
+        chat.invoke(f"galay-http 是什么 {index}")
+        embeddings.embed_query(f"galay-http 路由 {index}")
+    try:
+        with deadline_scope(Deadline(5.0)):
+            embeddings.embed_query("deadline query")
+    except TypeError as e:
+        failures.append(f"embeddings client rejected the per-request timeout: {e}")
+    sync_connections = provider.connections - before
+
+    async def _stream() -> None:
+        for index in range(SEQUENTIAL_REQUESTS // 2):
+            async for _ in chat.astream(f"galay-rpc 是什么 {index}"):
+                pass
+
+    before = provider.connections
+    asyncio.run(_stream())
+    async_connections = provider.connections - before
+    print(
+        f"[verify_http_pools] keep-alive: sync requests={2 * SEQUENTIAL_REQUESTS + 1} connections={sync_connections} "
+        f"async streams={SEQUENTIAL_REQUESTS // 2} connections={async_connections}"
+    )
+    if sync_connections != 1:
+        failures.append(f"sequential sync requests opened {sync_connections} connections, expected 1")
+    if async_connections != 1:
+        failures.append(f"sequential async streams opened {async_connections} connections, expected 1")
+
+    before = provider.connections
+    errors: List[str] = []
+
+    def worker(index: int) -> None:
+        try:
+            for round_index in range(3):
+                chat.invoke(f"galay-redis {index}-{round_index}")
+        except Exception as e:  # 任何异常都说明连接池用法有问题
+            errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(CONCURRENT_THREADS)]
+    for thread in threads:
+        thread.start()
+    # 请求进行中采样：活跃连接应计入利用率
+    peak_utilization = 0.0
+    while any(thread.is_alive() for thread in threads):
+        origin = http_clients._origin(provider.base_url)  # noqa: SLF001
+        sync_stats = http_clients.http_pool_stats().get(origin, {}).get("sync", {})
+        peak_utilization = max(peak_utilization, sync_stats.get("utilization", 0.0))
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    concurrent_connections = provider.connections - before
+    print(
+        f"[verify_http_pools] concurrent: threads={CONCURRENT_THREADS} new_connections={concurrent_connections} "
+        f"max_connections={settings.HTTP_POOL_MAX_CONNECTIONS} peak_utilization={peak_utilization:.2f}"
+    )
+    if errors:
+        failures.append(f"concurrent requests failed: {errors[:3]}")
+    # 已有 1 条空闲连接可复用，新开的连接数不超过池上限
+    if concurrent_connections > settings.HTTP_POOL_MAX_CONNECTIONS:
+        failures.append(f"concurrent requests opened {concurrent_connections} connections, pool max is 4")
+    if peak_utilization <= 0:
+        failures.append("http_pools never reported active connections while requests were in flight")
+
+
+async def _check_metrics(origin_url: str, failures: List[str]) -> None:
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+        response = await client.get("/metrics")
+    pools = response.json().get("http_pools", {})
+    entry = pools.get(http_clients._origin(origin_url), {})  # noqa: SLF001
+    sync_stats, async_stats = entry.get("sync", {}), entry.get("async", {})
+    print(
+        f"[verify_http_pools] /metrics: requests={entry.get('requests')} sync={sync_stats} "
+        f"async_connections={async_stats.get('connections')}"
+    )
+    expected_requests = 2 * SEQUENTIAL_REQUESTS + 1 + SEQUENTIAL_REQUESTS // 2 + CONCURRENT_THREADS * 3
+    if entry.get("requests") != expected_requests:
+        failures.append(f"http_pools requests={entry.get('requests')}, expected {expected_requests}")
+    keys = {"connections", "active", "idle", "max_connections", "utilization"}
+    if not keys <= set(sync_stats) or not keys <= set(async_stats):
+        failures.append(f"http_pools is missing connection stats: {sorted(sync_stats)}")
+    if not 1 <= sync_stats.get("connections", 0) <= settings.HTTP_POOL_MAX_CONNECTIONS:
+        failures.append(f"http_pools sync connections={sync_stats.get('connections')}")
+    if sync_stats.get("idle") != sync_stats.get("connections") or sync_stats.get("utilization") != 0:
+        failures.append("idle pool does not report zero utilisation")
+
+
+def main() -> int:
+    failures: List[str] = []
+    primary = MockOpenAIProvider(base_ms=5.0, chunk_interval_ms=1.0).start()
+    other = MockOpenAIProvider(base_ms=5.0).start()
+    try:
+        chat, embeddings = _check_sharing(primary, other, failures)
+        _check_keepalive(primary, chat, embeddings, failures)
+        asyncio.run(_check_metrics(primary.base_url, failures))
+    finally:
+        primary.stop()
+        other.stop()
+
+    if failures:
+        print("[verify_http_pools] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_http_pools] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Check the columnar lexical fallback corpus and report its memory footprint.
+
+On a synthetic corpus (mixed Chinese prose and C++ snippets, realistic
+metadata) served by a fake Chroma collection:
+1) Reports retained / peak memory (tracemalloc) of the previous
+   representation (one Document + metadata dict per chunk, loaded with a
+   single unpaginated get) against the columnar corpus.
+2) The lexical fallback returns the same ranking and scores as a per-Document
+   scan with the previous scoring code.
+3) The corpus is loaded in pages (limit/offset) and Documents are fetched by id
+   only for the final top-k; collections that ignore limit/offset still load
+   exactly once.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.services import rag_service  # noqa: E402
+from src.services.rag_service import RAGService  # noqa: E402
+
+CORPUS_SIZE = 20000
+PAGE_SIZE = 2000
+PROJECTS = ["galay-http", "galay-rpc", "galay-redis", "galay-kernel", "galay-mysql", "galay-utils"]
+QUERIES = [
+    "galay-http HttpServer 路由 示例",
+    "galay-redis pipeline 超时 怎么用",
+    "协程 调度器 runtime",
+    "RpcClient 服务发现",
+]
+
+
+def _chunk_text(i: int) -> str:
+    project = PROJECTS[i % len(PROJECTS)]
+    if i % 3 == 0:
+        return (
+            f"```cpp\n#include <{project}/Server.h>\nHttpRouter router; HttpServerConfig config;\n"
+            f"HttpServer server(config); // chunk {i}\nserver.start(std::move(router));\n```\n"
+        ) * 4
+    return (
+        f"{project} 第 {i} 段：协程 调度 与 路由 配置 说明，Pipeline 批处理、超时控制与服务发现。"
+        f"RedisClient / RpcClient 在 Runtime 调度器上运行，示例见 examples/{i % 40}。"
+    ) * 4
+
+
+class _FakeCollection:
+    """Chroma collection 的最小替身；每次 get 返回新对象，和真实库反序列化一致"""
+
+    def __init__(self, honor_paging: bool = True) -> None:
+        self.honor_paging = honor_paging
+        self.calls: List[dict] = []
+        self.ids = [f"chunk-{i}" for i in range(CORPUS_SIZE)]
+        self.documents = [_chunk_text(i) for i in range(CORPUS_SIZE)]
+        self.metadatas = [
+            {
+                "source": f"{PROJECTS[i % len(PROJECTS)]}/{'examples' if i % 5 == 0 else 'docs'}/{i // 40}.md",
+                "project": PROJECTS[i % len(PROJECTS)],
+                "file_name": f"{i // 40}.md",
+                "file_type": "markdown",
+                "cleaned": True,
+                "chunk": i % 40,
+            }
+            for i in range(CORPUS_SIZE)
+        ]
+
+    def get(self, ids=None, include=None, limit=None, offset=None):
+        self.calls.append({"ids": ids, "limit": limit, "offset": offset})
+        if ids is not None:
+            rows = [int(chunk_id.split("-")[1]) for chunk_id in ids]
+        elif self.honor_paging and limit is not None:
+            rows = list(range(CORPUS_SIZE))[offset or 0 : (offset or 0) + limit]
+        else:
+            rows = list(range(CORPUS_SIZE))
+        return {
+            "ids": [self.ids[i].encode().decode() for i in rows],
+            "documents": [self.documents[i].encode().decode() for i in rows],
+            "metadatas": [{k: v for k, v in self.metadatas[i].items()} for i in rows],
+        }
+
+
+class _FakeVectorStore:
+    def __init__(self, collection: _FakeCollection) -> None:
+        self.store = SimpleNamespace(_collection=collection)
+
+
+class _FakeLlm:
+    def invoke(self, messages, **kwargs):
+        raise AssertionError("not used")
+
+
+def _legacy_docs(collection: _FakeCollection) -> List[Document]:
+    # 旧实现：一次性全量 get，每个 chunk 一个 Document + metadata 副本
+    payload = collection.get(include=["documents", "metadatas"])
+    documents = payload.get("documents", []) or []
+    metadatas = payload.get("metadatas", []) or []
+    docs: List[Document] = []
+    for idx, content in enumerate(documents):
+        meta = metadatas[idx] if idx < len(metadatas) and metadatas[idx] else {}
+        docs.append(Document(page_content=str(content or ""), metadata=dict(meta)))
+    return docs
+
+
+def _legacy_fallback(
+    docs: List[Document], terms: List[str], project_hint: str | None, usage_intent: bool, limit: int
+) -> List[Tuple[float, Document]]:
+    scored: List[Tuple[float, Document]] = []
+    for doc in docs:
+        lex = rag_service._lexical_overlap_score(doc.page_content, terms)
+        if lex <= 0:
+            continue
+        source_boost = rag_service._source_path_boost(doc, terms)
+        project_boost = rag_service._project_hint_boost(doc, project_hint)
+        example_boost = rag_service._example_source_boost(doc)
+        example_weight = 0.15 if usage_intent else 0.05
+        score = lex * 0.65 + source_boost * 0.08 + project_boost * 0.12 + example_boost * example_weight
+        scored.append((score, doc))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[: max(1, limit)]
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, float, float]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current / 1024 / 1024, peak / 1024 / 1024
+
+
+def _ranking(rows: List[Tuple[float, Document]]) -> List[Tuple[float, str]]:
+    return [(round(score, 9), rag_service._doc_key(doc)) for score, doc in rows]
+
+
+def main() -> int:
+    settings.RETRIEVAL_LEXICAL_PAGE_SIZE = PAGE_SIZE
+    failures: List[str] = []
+
+    collection = _FakeCollection()
+    legacy, legacy_mb, legacy_peak_mb = _measure(lambda: _legacy_docs(collection))
+    collection.calls.clear()
+    rag = RAGService(_FakeVectorStore(collection), llm=_FakeLlm())  # type: ignore[arg-type]
+    corpus, corpus_mb, corpus_peak_mb = _measure(rag._get_lexical_corpus)
+    print(
+        f"[verify_lexical_corpus] chunks={CORPUS_SIZE} documents: retained={legacy_mb:.1f}MiB peak={legacy_peak_mb:.1f}MiB"
+    )
+    print(
+        f"[verify_lexical_corpus] chunks={len(corpus)} columnar: retained={corpus_mb:.1f}MiB "
+        f"peak={corpus_peak_mb:.1f}MiB buffers={corpus.nbytes / 1024 / 1024:.1f}MiB"
+    )
+    if len(corpus) != CORPUS_SIZE:
+        failures.append(f"corpus loaded {len(corpus)} chunks, expected {CORPUS_SIZE}")
+    if corpus_mb > legacy_mb * 0.7:
+        failures.append(f"columnar corpus retains {corpus_mb:.1f}MiB, not much below {legacy_mb:.1f}MiB")
+    if corpus_peak_mb > legacy_peak_mb:
+        failures.append(f"columnar load peaks at {corpus_peak_mb:.1f}MiB, above {legacy_peak_mb:.1f}MiB")
+
+    pages = [call for call in collection.calls if call["ids"] is None]
+    if not pages or any(call["limit"] != PAGE_SIZE for call in pages):
+        failures.append(f"corpus not loaded in pages of {PAGE_SIZE}: {pages[:3]}")
+
+    for query in QUERIES:
+        terms = rag_service._extract_query_terms(query)
+        hint = rag_service._extract_project_hint(query)
+        usage = rag_service.is_usage_query(query)
+        expected = _ranking(_legacy_fallback(legacy, terms, hint, usage, 24))
+        collection.calls.clear()
+        actual_rows = rag._lexical_fallback(terms, hint, usage_intent=usage, limit=24)
+        actual = _ranking(actual_rows)
+        fetched = [call for call in collection.calls if call["ids"] is not None]
+        if actual != expected:
+            failures.append(f"ranking differs from the per-Document scan for {query!r}")
+        if len(fetched) != 1 or len(fetched[0]["ids"]) != len(actual_rows):
+            failures.append(f"expected one fetch of the top-k by id for {query!r}, got {len(fetched)}")
+        if actual_rows and actual_rows[0][1].metadata.get("file_name") is None:
+            failures.append("materialized Document lost its metadata")
+
+    unpaged = _FakeCollection(honor_paging=False)
+    rag_unpaged = RAGService(_FakeVectorStore(unpaged), llm=_FakeLlm())  # type: ignore[arg-type]
+    if len(rag_unpaged._get_lexical_corpus()) != CORPUS_SIZE or len(unpaged.calls) != 1:
+        failures.append("collection ignoring limit/offset was not loaded exactly once")
+
+    if failures:
+        print("[verify_lexical_corpus] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_lexical_corpus] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Check multi-upstream LLM routing against two local mock providers.
+
+1) Latency-aware balancing: the faster upstream receives most of the traffic.
+2) Failover: when one upstream returns 5xx, requests still succeed via the other
+   and its circuit breaker opens, so it stops receiving requests.
+3) Recovery: after LLM_BREAKER_OPEN_SECONDS a half-open probe closes the breaker.
+4) Streams fail over before the first token when an upstream exceeds
+   LLM_FIRST_TOKEN_TIMEOUT_SECONDS.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.core.llm import build_chat_model, stream_chat  # noqa: E402
+
+
+def main() -> int:
+    failures: List[str] = []
+    fast = MockOpenAIProvider(base_ms=10.0).start()
+    slow = MockOpenAIProvider(base_ms=80.0).start()
+    settings.OPENAI_API_KEY = "mock-key"
+    settings.LLM_MAX_RETRIES = 0
+    settings.LLM_FIRST_TOKEN_TIMEOUT_SECONDS = 0.3
+    settings.LLM_BREAKER_FAILURE_THRESHOLD = 3
+    settings.LLM_BREAKER_OPEN_SECONDS = 5.0
+    settings.HEDGE_LLM_STREAM_ENABLED = False
+    settings.LLM_UPSTREAMS = json.dumps(
+        [
+            {"name": "fast", "base_url": fast.base_url, "weight": 1},
+            {"name": "slow", "base_url": slow.base_url, "weight": 1},
+        ]
+    )
+
+    try:
+        router = build_chat_model()
+
+        for _ in range(60):
+            router.invoke("hi")
+        health = router.health()
+        share = health["fast"]["requests"] / 60
+        print(f"[verify_llm_router] balancing fast_share={share:.2f}")
+        if share < 0.7:
+            failures.append(f"balancing: fast upstream got only {share:.0%} of requests")
+
+        fast.fail_status = 500
+        fast_before = fast.requests
+        for index in range(20):
+            try:
+                router.invoke("hi")
+            except Exception as e:
+                failures.append(f"failover: request {index} failed: {e}")
+                break
+        health = router.health()
+        hits = fast.requests - fast_before
+        print(f"[verify_llm_router] outage fast_state={health['fast']['state']} fast_hits={hits}")
+        if health["fast"]["state"] != "open":
+            failures.append(f"breaker: expected fast upstream open, got {health['fast']['state']}")
+        if hits > settings.LLM_BREAKER_FAILURE_THRESHOLD + 1:
+            failures.append(f"breaker: open upstream kept receiving requests ({hits})")
+
+        fast.fail_status = 0
+        # 缩短熔断窗口，下一次选路即进入半开探测。
+        settings.LLM_BREAKER_OPEN_SECONDS = 0.2
+        time.sleep(0.3)
+        for _ in range(10):
+            router.invoke("hi")
+        health = router.health()
+        print(f"[verify_llm_router] recovery fast_state={health['fast']['state']}")
+        if health["fast"]["state"] != "closed":
+            failures.append(f"recovery: expected fast upstream closed, got {health['fast']['state']}")
+
+        fast.base_ms = 1000.0
+
+        async def _streams() -> None:
+            for index in range(5):
+                pieces = [chunk.content async for chunk in stream_chat(router, "hi") if chunk.content]
+                if "".join(pieces) != "".join(slow.stream_pieces):
+                    failures.append(f"stream failover: request {index} got {pieces!r}")
+
+        asyncio.run(_streams())
+        health = router.health()
+        print(
+            f"[verify_llm_router] stream fast_state={health['fast']['state']} "
+            f"fast_failures={health['fast']['failures']} slow_requests={health['slow']['requests']}"
+        )
+        if health["fast"]["failures"] < 1:
+            failures.append("stream failover: first-token timeout not recorded as a failure")
+        print(f"[verify_llm_router] health={json.dumps(health)}")
+    finally:
+        fast.stop()
+        slow.stop()
+
+    if failures:
+        print("[verify_llm_router] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_llm_router] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
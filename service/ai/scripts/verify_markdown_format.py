@@ -42,66 +42,67 @@ def _assert(cond: bool, message: str) -> None:
         raise AssertionError(message)
 
 
-def run_synthetic_cases() -> None:
-    cases: List[Tuple[str, str, Dict[str, str]]] = [
-        (
-            "raw_cmake",
-            (
-                "1. 环境要求：\n"
-                "- C++20 编译器（GCC 11+/Clang 14+）\n"
-                "- CMake 3.20+ 构建系统\n"
-                "2. 安装步骤：git clone https://github.com/galay/galay.git 使用 CMake 构建：\n"
-                "cmake -S . -B build\n"
-                "cmake --build build -j\n"
-                "3. 编译运行命令：g++ -std=c++20 main.cpp -o demo ./demo\n"
-            ),
-            {
-                "must_contain_1": "## 环境要求",
-                "must_contain_2": "## 安装步骤",
-                "must_contain_3": "使用 CMake 构建：",
-                "must_contain_4": "cmake --build build --parallel",
-                "must_contain_5": "## 编译运行命令",
-                "must_contain_6": "```bash\ng++ -std=c++20 main.cpp -o demo ./demo\n```",
-                "must_not_contain_1": "```bash\nGCC 11+/Clang 14+）",
-            },
-        ),
-        (
-            "portable_parallel",
-            (
-                "```bash\n"
-                "cmake --build build -j\"$(nproc)\"\n"
-                "make -j$(nproc 2>/dev/null || sysctl -n hw.ncpu)\n"
-                "```\n"
-            ),
-            {
-                "must_contain_1": "cmake --build build --parallel",
-                "must_contain_2": "make -j",
-                "must_not_contain_1": "$(nproc",
-                "must_not_contain_2": "sysctl -n hw.ncpu",
-                "must_not_contain_3": " -j\"$(nproc)\"",
-            },
-        ),
+SYNTHETIC_CASES: List[Tuple[str, str, Dict[str, str]]] = [
+    (
+        "raw_cmake",
         (
-            "quoted_fence",
-            "\"```bash\npython3 -m venv .venv\nsource .venv/bin/activate\npip install -r requirements.txt\n```\"",
-            {
-                "must_contain_1": "```bash\npython3 -m venv .venv",
-                "must_not_contain_1": "\"```",
-                "must_not_contain_2": "```\"",
-            },
+            "1. 环境要求：\n"
+            "- C++20 编译器（GCC 11+/Clang 14+）\n"
+            "- CMake 3.20+ 构建系统\n"
+            "2. 安装步骤：git clone https://github.com/galay/galay.git 使用 CMake 构建：\n"
+            "cmake -S . -B build\n"
+            "cmake --build build -j\n"
+            "3. 编译运行命令：g++ -std=c++20 main.cpp -o demo ./demo\n"
         ),
+        {
+            "must_contain_1": "## 环境要求",
+            "must_contain_2": "## 安装步骤",
+            "must_contain_3": "使用 CMake 构建：",
+            "must_contain_4": "cmake --build build --parallel",
+            "must_contain_5": "## 编译运行命令",
+            "must_contain_6": "```bash\ng++ -std=c++20 main.cpp -o demo ./demo\n```",
+            "must_not_contain_1": "```bash\nGCC 11+/Clang 14+）",
+        },
+    ),
+    (
+        "portable_parallel",
         (
-            "repeated_ol",
-            "1. 第一项\n1. 第二项\n1. 第三项\n",
-            {
-                "must_contain_1": "1. 第一项",
-                "must_contain_2": "1. 第二项",
-                "must_contain_3": "1. 第三项",
-            },
+            "```bash\n"
+            "cmake --build build -j\"$(nproc)\"\n"
+            "make -j$(nproc 2>/dev/null || sysctl -n hw.ncpu)\n"
+            "```\n"
         ),
-    ]
+        {
+            "must_contain_1": "cmake --build build --parallel",
+            "must_contain_2": "make -j",
+            "must_not_contain_1": "$(nproc",
+            "must_not_contain_2": "sysctl -n hw.ncpu",
+            "must_not_contain_3": " -j\"$(nproc)\"",
+        },
+    ),
+    (
+        "quoted_fence",
+        "\"```bash\npython3 -m venv .venv\nsource .venv/bin/activate\npip install -r requirements.txt\n```\"",
+        {
+            "must_contain_1": "```bash\npython3 -m venv .venv",
+            "must_not_contain_1": "\"```",
+            "must_not_contain_2": "```\"",
+        },
+    ),
+    (
+        "repeated_ol",
+        "1. 第一项\n1. 第二项\n1. 第三项\n",
+        {
+            "must_contain_1": "1. 第一项",
+            "must_contain_2": "1. 第二项",
+            "must_contain_3": "1. 第三项",
+        },
+    ),
+]
 
-    for name, raw, rules in cases:
+
+def run_synthetic_cases() -> None:
+    for name, raw, rules in SYNTHETIC_CASES:
         normalized = normalize_markdown_content(raw, target="answer", strip_decorative=True)
         blocks = markdown_to_blocks(normalized)
         for key, value in rules.items():
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Differential check: streaming markdown normalizer vs multi-pass reference.
+
+`normalize_markdown_content` runs every stage as one line pipeline, while
+`_normalize_markdown_content_multipass` keeps the original pass-by-pass
+implementation. Both must produce byte-identical output for:
+1) All managed docs and repository markdown files (plus derived variants).
+2) Synthetic cases from `verify_markdown_format.py`.
+"""
+
+from __future__ import annotations
+
+import difflib
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+REPO_ROOT = Path(__file__).resolve().parents[3]
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from src.core.markdown_normalizer import (  # noqa: E402
+    _normalize_markdown_content_multipass,
+    normalize_markdown_content,
+)
+from verify_markdown_format import SYNTHETIC_CASES  # noqa: E402
+
+
+SKIP_DIR_NAMES = {".git", "node_modules", "venv", ".venv", "__pycache__"}
+PREFIX_CUTS = (0.25, 0.5, 0.75)
+
+
+def _resolve_docs_root() -> Path:
+    raw = os.getenv("GALAY_DOCS_ROOT_PATH", "service/ai/managed_docs")
+    path = Path(raw)
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def _iter_markdown_files() -> Iterable[Path]:
+    seen = set()
+    for root in (_resolve_docs_root(), REPO_ROOT):
+        if not root.exists():
+            continue
+        for path in sorted(root.rglob("*.md")):
+            if any(part in SKIP_DIR_NAMES for part in path.parts):
+                continue
+            resolved = path.resolve()
+            if resolved in seen:
+                continue
+            seen.add(resolved)
+            yield path
+
+
+def _variants(name: str, text: str) -> Iterable[Tuple[str, str]]:
+    yield name, text
+    # 模拟模型输出把多行压成一段的情况。
+    yield f"{name}#run_on", text.replace("\n\n", "\n").replace("\n", " ")
+    yield f"{name}#crlf", text.replace("\n", "\r\n")
+    # 模拟流式预览：对文本前缀反复规范化。
+    for ratio in PREFIX_CUTS:
+        cut = int(len(text) * ratio)
+        yield f"{name}#prefix{int(ratio * 100)}", text[:cut]
+
+
+def _collect_cases() -> List[Tuple[str, str]]:
+    cases: List[Tuple[str, str]] = []
+    for case_name, raw, _ in SYNTHETIC_CASES:
+        cases.extend(_variants(f"synthetic:{case_name}", raw))
+    for path in _iter_markdown_files():
+        try:
+            label = path.relative_to(REPO_ROOT).as_posix()
+        except ValueError:
+            label = str(path)
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        cases.extend(_variants(label, text))
+    return cases
+
+
+def _first_diff(expected: str, actual: str) -> str:
+    diff = difflib.unified_diff(
+        expected.split("\n"),
+        actual.split("\n"),
+        fromfile="multipass",
+        tofile="streaming",
+        lineterm="",
+        n=1,
+    )
+    return "\n".join(list(diff)[:12])
+
+
+def main() -> int:
+    cases = _collect_cases()
+    if not cases:
+        print("[verify_markdown_normalizer_equivalence] ERROR: no cases collected")
+        return 1
+
+    mismatches: List[str] = []
+    checked = 0
+    for name, text in cases:
+        for target in ("index", "answer"):
+            for strip_decorative in (True, False):
+                expected = _normalize_markdown_content_multipass(
+                    text, target=target, strip_decorative=strip_decorative
+                )
+                actual = normalize_markdown_content(text, target=target, strip_decorative=strip_decorative)
+                checked += 1
+                if actual != expected:
+                    mismatches.append(
+                        f"- {name} target={target} strip_decorative={strip_decorative}\n"
+                        f"{_first_diff(expected, actual)}"
+                    )
+
+    print(f"[verify_markdown_normalizer_equivalence] inputs={len(cases)} checks={checked} mismatches={len(mismatches)}")
+    if mismatches:
+        for row in mismatches[:20]:
+            print(row)
+        return 1
+
+    print("[verify_markdown_normalizer_equivalence] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Check complexity-based routing between the fast and the strong model.
+
+Runs ChatService against local mock providers (fake retrieval, scores chosen
+per case). Checks that:
+1) choose_model_route / ChatService._select_model pick the expected route and
+   reason for usage, setup, follow-up, long, low-confidence and simple lookup
+   questions, and count each decision.
+2) A simple lookup reaches the provider with FAST_MODEL_NAME, a usage question
+   with MODEL_NAME, through both query and chat_stream.
+3) chat.model_route.<route>.requests / prompt_tokens / completion_tokens /
+   latency_ms (and ttft_ms for streams) are recorded per route.
+4) With LLM_UPSTREAMS, each upstream serves its own fast_model; upstreams with
+   their own model and no fast_model stay out of the fast route, and without
+   any fast model everything goes to the strong route.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_MAX_RETRIES = 0
+settings.LLM_UPSTREAMS = ""
+settings.MODEL_NAME = "mock-strong"
+settings.FAST_MODEL_NAME = "mock-fast"
+settings.HEDGE_LLM_STREAM_ENABLED = False
+settings.HISTORY_SUMMARY_ENABLED = False
+settings.ANSWER_CACHE_ENABLED = False
+settings.EXTRACTIVE_ANSWER_ENABLED = False
+settings.MODEL_ROUTER_MAX_FAST_CHARS = 40
+settings.MODEL_ROUTER_MIN_FAST_CONFIDENCE = 0.6
+
+from langchain_core.documents import Document  # noqa: E402
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.core.llm_router import fast_upstreams  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.services.model_router import ROUTE_FAST, ROUTE_STRONG  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+SIMPLE = "galay-redis 支持 pipeline 吗"
+USAGE = "怎么用 galay-http 写一个 HTTP 服务器示例？"
+SETUP = "galay-rpc 需要哪些依赖"
+FOLLOW_UP = "那超时呢？"
+LONG = "galay-redis 的 RedisClient 在连接断开、服务端返回错误以及命令超时这几种情况下分别会抛出什么异常类型，调用方应该如何区分"
+HISTORY = [{"role": "user", "content": SIMPLE}, {"role": "assistant", "content": "支持。"}]
+HIGH = (0.95, 0.9)
+LOW = (0.4, 0.3)
+
+
+def _docs(*scores: float) -> List[Tuple[Document, float]]:
+    return [
+        (
+            Document(
+                page_content=f"galay-redis 的 RedisPipeline 支持批量提交命令（第 {index} 篇）。",
+                metadata={"project": "galay-redis", "source": f"galay-redis/docs/pipeline-{index}.md"},
+            ),
+            score,
+        )
+        for index, score in enumerate(scores)
+    ]
+
+
+def _check_decisions(service: ChatService, failures: List[str]) -> None:
+    cases = [
+        ("usage", USAGE, HIGH, [], ROUTE_STRONG, "usage_query"),
+        ("setup", SETUP, HIGH, [], ROUTE_STRONG, "setup_intent"),
+        ("follow-up", FOLLOW_UP, HIGH, HISTORY, ROUTE_STRONG, "follow_up"),
+        ("long query", LONG, HIGH, [], ROUTE_STRONG, "long_query"),
+        ("low confidence", SIMPLE, LOW, [], ROUTE_STRONG, "low_confidence"),
+        ("simple lookup", SIMPLE, HIGH, [], ROUTE_FAST, "simple_lookup"),
+    ]
+    for name, message, scores, history, expected_route, expected_reason in cases:
+        before = metrics.snapshot()["counters"].get(f"chat.model_route.decisions.{expected_reason}", 0)
+        llm = service._select_model(message, _docs(*scores), history)
+        after = metrics.snapshot()["counters"].get(f"chat.model_route.decisions.{expected_reason}", 0)
+        print(f"[verify_model_router] {name}: route={llm.route} reason_counted={after - before:.0f}")
+        if llm.route != expected_route:
+            failures.append(f"{name}: routed to {llm.route}, expected {expected_route}")
+        if after - before != 1:
+            failures.append(f"{name}: chat.model_route.decisions.{expected_reason} not incremented")
+
+
+async def _stream_both(service: ChatService) -> None:
+    # 共享的异步连接池绑定在事件循环上，两条流放在同一个循环里跑
+    async for _ in service.query_stream(SIMPLE):
+        pass
+    async for _ in service.chat_stream(USAGE, "verify-model-router"):
+        pass
+
+
+def _check_end_to_end(
+    service: ChatService, provider: MockOpenAIProvider, retrieved: list, failures: List[str]
+) -> None:
+    retrieved[0] = _docs(*HIGH)
+    provider.chat_models.clear()
+    service.query(SIMPLE)
+    service.query(USAGE)
+    asyncio.run(_stream_both(service))
+    seen = list(provider.chat_models)
+    expected = [settings.FAST_MODEL_NAME, settings.MODEL_NAME] * 2
+    print(f"[verify_model_router] provider saw models={seen}")
+    if seen != expected:
+        failures.append(f"simple lookups / usage questions did not reach the provider as {expected}: {seen}")
+
+    snapshot = metrics.snapshot()
+    for route in (ROUTE_FAST, ROUTE_STRONG):
+        prefix = f"chat.model_route.{route}"
+        requests = snapshot["counters"].get(f"{prefix}.requests", 0)
+        prompt_tokens = snapshot["counters"].get(f"{prefix}.prompt_tokens", 0)
+        completion_tokens = snapshot["counters"].get(f"{prefix}.completion_tokens", 0)
+        latency = snapshot["histograms"].get(f"{prefix}.latency_ms", {})
+        ttft = snapshot["histograms"].get(f"{prefix}.ttft_ms", {})
+        print(
+            f"[verify_model_router] {route}: requests={requests:.0f} prompt_tokens={prompt_tokens:.0f} "
+            f"completion_tokens={completion_tokens:.0f} latency_p50={latency.get('p50', 0):.0f}ms "
+            f"ttft_count={ttft.get('count', 0)}"
+        )
+        if requests != 2 or not prompt_tokens or not completion_tokens:
+            failures.append(f"{prefix}.requests / token counters not recorded")
+        if latency.get("count") != 2 or ttft.get("count") != 1:
+            failures.append(f"{prefix}.latency_ms / ttft_ms not recorded for every call")
+
+
+def _check_upstreams(providers: List[MockOpenAIProvider], failures: List[str]) -> None:
+    shared, own_fast, own_only = providers
+    settings.LLM_UPSTREAMS = json.dumps(
+        [
+            {"name": "shared", "base_url": shared.base_url},
+            {"name": "own-fast", "base_url": own_fast.base_url, "model": "other-strong", "fast_model": "other-fast"},
+            {"name": "own-only", "base_url": own_only.base_url, "model": "third-strong"},
+        ]
+    )
+    try:
+        configs = {config.name: config.model for config in fast_upstreams()}
+        service = ChatService(vector_store=None)
+        for provider in providers:
+            provider.chat_models.clear()
+        for _ in range(12):
+            service._fast_llm.invoke("galay-redis 支持 pipeline 吗")  # type: ignore[union-attr]
+        seen = {name: set(p.chat_models) for name, p in zip(("shared", "own-fast", "own-only"), providers)}
+        print(f"[verify_model_router] fast upstreams={configs} models seen={seen}")
+        if configs != {"shared": settings.FAST_MODEL_NAME, "own-fast": "other-fast"}:
+            failures.append(f"fast route upstreams/models wrong: {configs}")
+        if not seen["shared"] <= {settings.FAST_MODEL_NAME} or not seen["own-fast"] <= {"other-fast"}:
+            failures.append(f"an upstream was sent another upstream's fast model: {seen}")
+        if seen["own-only"]:
+            failures.append("upstream without a fast model received fast-route traffic")
+
+        settings.FAST_MODEL_NAME = ""
+        settings.LLM_UPSTREAMS = json.dumps([{"name": "shared", "base_url": shared.base_url}])
+        if ChatService(vector_store=None)._fast_llm is not None:
+            failures.append("fast route built although no upstream has a fast model")
+    finally:
+        settings.LLM_UPSTREAMS = ""
+        settings.FAST_MODEL_NAME = "mock-fast"
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    providers = [MockOpenAIProvider(base_ms=5.0, chunk_interval_ms=1.0).start() for _ in range(3)]
+    settings.OPENAI_API_BASE = providers[0].base_url
+    try:
+        retrieved = [_docs(*HIGH)]
+        service = ChatService(vector_store=None)
+        service._retrieve = lambda message, deadline, profile: retrieved[0]  # type: ignore[method-assign]
+        service._retrieve_for_session = lambda *args, **kwargs: retrieved[0]  # type: ignore[method-assign]
+        _check_decisions(service, failures)
+        _check_end_to_end(service, providers[0], retrieved, failures)
+        _check_upstreams(providers, failures)
+    finally:
+        for provider in providers:
+            provider.stop()
+
+    if failures:
+        print("[verify_model_router] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_model_router] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
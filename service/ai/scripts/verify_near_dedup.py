@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Check near-duplicate chunk elimination during ingestion.
+
+Builds a docs tree where every project repeats the same quick-start README
+(only the project name differs) and an identical contributing guide, next to
+project-specific API pages written from a shared template. Checks that:
+1) Repeated README / guide chunks collapse into the first project's copy, whose
+   metadata lists the other copies in alternate_sources and their projects in
+   alternate_projects; a project hint for a dropped copy's project still
+   boosts the kept chunk (dense ranking and the lexical corpus).
+2) Project-specific chunks that merely share a template are all kept.
+3) DEDUP_THRESHOLD=1.0 only drops exact copies; DEDUP_ENABLED=false drops none.
+4) The index build report counts the dropped chunks and Chroma stores only the
+   kept ones.
+No network access or real embedding model needed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.core.document_loader import GalayDocumentLoader  # noqa: E402
+from src.core.near_dedup import NearDuplicateDetector  # noqa: E402
+from src.core.vector_store import VectorStoreManager  # noqa: E402
+from src.services.lexical_corpus import LexicalCorpus  # noqa: E402
+from src.services.rag_service import _project_hint_boost  # noqa: E402
+
+PROJECTS = ["galay-http", "galay-redis", "galay-rpc"]
+README_SECTIONS = ["环境要求", "安装步骤", "最小示例", "运行与验证"]
+VOCABULARY = (
+    "协程 调度器 编译器 子模块 CMake 依赖 epoll io_uring kqueue 运行时 示例程序 头文件 静态库 动态库 "
+    "处理函数 co_await 超时 连接池 日志 基准测试 吞吐 延迟 配置文件 环境变量 容器 端口 证书 "
+    "OpenSSL spdlog vcpkg 发行版 单元测试 构建目录 安装前缀 版本号 兼容性 线程池 内存池"
+).split()
+API_CLASSES = {
+    "galay-http": ["HttpServer", "HttpRouter", "HttpClient"],
+    "galay-redis": ["RedisClient", "RedisPipeline", "RedisConfig"],
+    "galay-rpc": ["RpcServer", "RpcClient", "RpcStream"],
+}
+
+
+class _HashEmbeddings(Embeddings):
+    def _embed(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:16]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _readme(project: str) -> str:
+    sections = []
+    for title in README_SECTIONS:
+        # 每节一段固定的伪随机正文（各项目相同），节与节之间不相似
+        rng = random.Random(title)
+        text = "，".join("".join(rng.choice(VOCABULARY) for _ in range(4)) for _ in range(24))
+        body = f"本节介绍 {project} 的{title}。{text}。"
+        sections.append(f"## {title}\n\n{body}")
+    return f"# {project} 快速开始\n\n" + "\n\n".join(sections) + "\n"
+
+
+def _guide() -> str:
+    body = "提交 PR 前请运行 clang-format 与全部单元测试，提交信息使用祈使句，一个 PR 只做一件事。" * 6
+    return f"# 贡献指南\n\n## 提交流程\n\n{body}\n\n## 代码风格\n\n{body[::-1]}\n"
+
+
+def _api(project: str) -> str:
+    sections = []
+    for name in API_CLASSES[project]:
+        body = (
+            f"{name} 是 {project} 中的核心类型。构造 {name} 时传入配置对象，"
+            f"调用 {name}::start 启动，{name}::stop 停止；{name} 的全部方法都返回可 co_await 的协程任务。"
+            f"{name} 不是线程安全的，跨调度器使用时需要通过消息投递。"
+        ) * 3
+        sections.append(f"## {name}\n\n{body}")
+    return f"# {project} API\n\n" + "\n\n".join(sections) + "\n"
+
+
+def _write_tree(root: Path) -> None:
+    for project in PROJECTS:
+        project_dir = root / project
+        project_dir.mkdir(parents=True)
+        (project_dir / "README.md").write_text(_readme(project), encoding="utf-8")
+        (project_dir / "贡献指南.md").write_text(_guide(), encoding="utf-8")
+        (project_dir / "api.md").write_text(_api(project), encoding="utf-8")
+
+
+def _count(docs, name: str) -> int:
+    return sum(1 for doc in docs if doc.metadata.get("file_name") == name)
+
+
+def main() -> int:
+    failures: List[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "docs"
+        _write_tree(root)
+        settings.GALAY_DOCS_ROOT_PATH = str(root)
+        settings.GALAY_DOCS_PATH = ""
+        settings.GALAY_DOCS_PATHS_FILE = ""
+        settings.VECTOR_STORE_PATH = str(Path(tmp) / "chroma")
+
+        settings.DEDUP_ENABLED = False
+        baseline = GalayDocumentLoader().load_all()
+        settings.DEDUP_ENABLED = True
+        loader = GalayDocumentLoader()
+        started = time.perf_counter()
+        deduped = loader.load_all()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = loader.last_stats
+        readme_per_project = _count(baseline, "README.md") // len(PROJECTS)
+        guide_per_project = _count(baseline, "贡献指南.md") // len(PROJECTS)
+        print(
+            f"[verify_near_dedup] chunks={len(baseline)} kept={len(deduped)} "
+            f"dropped={stats.get('near_duplicates_dropped')} load={elapsed_ms:.0f}ms"
+        )
+
+        if _count(deduped, "README.md") != readme_per_project or _count(deduped, "贡献指南.md") != guide_per_project:
+            failures.append("repeated README / guide chunks were not collapsed to one copy")
+        if _count(deduped, "api.md") != _count(baseline, "api.md"):
+            failures.append("project-specific chunks sharing a template were dropped")
+        expected_dropped = (readme_per_project + guide_per_project) * (len(PROJECTS) - 1)
+        if stats.get("near_duplicates_dropped") != expected_dropped or len(deduped) != len(baseline) - expected_dropped:
+            failures.append(f"dropped count {stats.get('near_duplicates_dropped')} != expected {expected_dropped}")
+
+        for doc in deduped:
+            if doc.metadata.get("file_name") != "README.md":
+                continue
+            alternates = str(doc.metadata.get("alternate_sources", ""))
+            if doc.metadata.get("project") != PROJECTS[0] or alternates != "galay-redis/README.md; galay-rpc/README.md":
+                failures.append(f"canonical README chunk has wrong project / alternates: {alternates!r}")
+                break
+            if doc.metadata.get("duplicate_count") != len(PROJECTS) - 1:
+                failures.append("canonical README chunk has wrong duplicate_count")
+                break
+            if doc.metadata.get("alternate_projects") != "galay-redis; galay-rpc":
+                projects = doc.metadata.get("alternate_projects")
+                failures.append(f"canonical README chunk has wrong alternate_projects: {projects!r}")
+                break
+            if _project_hint_boost(doc, PROJECTS[1]) != 1.0 or _project_hint_boost(doc, PROJECTS[0]) != 1.0:
+                failures.append("project hint for a dropped copy's project does not boost the kept chunk")
+                break
+
+        settings.DEDUP_THRESHOLD = 1.0
+        strict = GalayDocumentLoader()
+        strict.load_all()
+        settings.DEDUP_THRESHOLD = 0.9
+        strict_dropped = strict.last_stats.get("near_duplicates_dropped", 0)
+        exact_dropped = guide_per_project * (len(PROJECTS) - 1)
+        print(f"[verify_near_dedup] threshold=1.0 dropped={strict_dropped} (exact copies={exact_dropped})")
+        if not exact_dropped <= strict_dropped < expected_dropped:
+            failures.append("DEDUP_THRESHOLD=1.0 should drop exact copies only")
+
+        detector = NearDuplicateDetector()
+        readme_a, readme_b = detector.signature(_readme(PROJECTS[0])), detector.signature(_readme(PROJECTS[1]))
+        api_a, api_b = detector.signature(_api(PROJECTS[0])), detector.signature(_api(PROJECTS[1]))
+        print(
+            f"[verify_near_dedup] estimated jaccard readme={float((readme_a == readme_b).mean()):.2f} "
+            f"api={float((api_a == api_b).mean()):.2f}"
+        )
+
+        vs = VectorStoreManager()
+        vs._embedding_mgr._embeddings = _HashEmbeddings()  # noqa: SLF001
+        vs.initialize(force_rebuild=True)
+        stored = vs.store._collection.count()  # noqa: SLF001
+        print(f"[verify_near_dedup] build report={vs.build_report} stored={stored}")
+        if vs.build_report.get("near_duplicates_dropped") != expected_dropped:
+            failures.append("build report does not show the dropped duplicates")
+        if stored != len(deduped):
+            failures.append(f"Chroma stored {stored} chunks, expected {len(deduped)}")
+
+        # 关键词兜底的列式语料同样认 alternate_projects
+        corpus = LexicalCorpus.load(vs.store._collection, 500, lambda source: 0.0)  # noqa: SLF001
+        redis_id = corpus.project_id(PROJECTS[1])
+        canonical_id = corpus.project_id(PROJECTS[0])
+        readme_rows = [
+            row
+            for row in range(len(corpus))
+            if corpus.row_project_id(row) == canonical_id and corpus.sources[corpus.row_source_id(row)] == "readme.md"
+        ]
+        matched = [row for row in readme_rows if corpus.row_matches_project(row, redis_id)]
+        print(f"[verify_near_dedup] lexical corpus: readme rows={len(readme_rows)} matching {PROJECTS[1]}={len(matched)}")
+        if not readme_rows or len(matched) != len(readme_rows):
+            failures.append("lexical corpus does not match the kept README chunks to the dropped copies' project")
+
+    if failures:
+        print("[verify_near_dedup] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_near_dedup] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
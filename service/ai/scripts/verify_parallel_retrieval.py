@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Check that the lexical fallback runs concurrently with the dense stage.
+
+A fake vector store simulates the query-embedding round trip with a sleep and
+serves a synthetic corpus for the (real) lexical fallback. Checks that:
+1) With RETRIEVAL_PARALLEL_STAGES on, retrieval latency is close to the slower
+   stage instead of the sum of both.
+2) Parallel and sequential runs return the same ranking.
+3) Per-stage timings are exported.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.services.rag_service import RAGService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+EMBED_SECONDS = 0.15
+CORPUS_SIZE = 6000
+ROUNDS = 5
+QUERY = "galay-http HttpServer 路由 示例"
+
+
+class _FakeCollection:
+    def __init__(self) -> None:
+        projects = ["galay-http", "galay-rpc", "galay-redis", "galay-kernel"]
+        self.documents = [
+            f"{projects[i % 4]} 第 {i} 段：HttpServer 路由 配置 与 协程 调度 说明 " * 3 for i in range(CORPUS_SIZE)
+        ]
+        self.metadatas = [
+            {"project": projects[i % 4], "source": f"{projects[i % 4]}/docs/{i // 50}.md", "chunk": i}
+            for i in range(CORPUS_SIZE)
+        ]
+
+        self.ids = [f"chunk-{i}" for i in range(CORPUS_SIZE)]
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        if ids is not None:
+            rows = [int(chunk_id.split("-")[1]) for chunk_id in ids]
+        else:
+            rows = list(range(CORPUS_SIZE))[offset : None if limit is None else offset + limit]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
+
+
+class _FakeVectorStore:
+    def __init__(self) -> None:
+        self.store = SimpleNamespace(_collection=_FakeCollection())
+
+    def search_with_score(self, query: str, k: int = 4):
+        # 模拟 query embedding 的网络往返
+        time.sleep(EMBED_SECONDS)
+        docs = [
+            Document(page_content=f"galay-http HttpServer 片段 {i}", metadata={"source": f"dense/{i}.md", "chunk": i})
+            for i in range(8)
+        ]
+        return [(doc, 0.3 + 0.05 * i) for i, doc in enumerate(docs)]
+
+
+class _FakeLlm:
+    def invoke(self, messages, **kwargs):
+        raise AssertionError("not used")
+
+
+def _measure(rag: RAGService, parallel: bool) -> tuple[float, List[str]]:
+    settings.RETRIEVAL_PARALLEL_STAGES = parallel
+    latencies: List[float] = []
+    keys: List[str] = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        ranked = rag.retrieve_with_score(QUERY, k=4)
+        latencies.append((time.perf_counter() - started) * 1000)
+        keys = [f"{doc.metadata.get('source')}:{score:.6f}" for doc, score in ranked]
+    return statistics.median(latencies), keys
+
+
+def main() -> int:
+    rag = RAGService(_FakeVectorStore(), llm=_FakeLlm())  # type: ignore[arg-type]
+    # 预热：首次调用构建关键词语料缓存
+    rag.retrieve_with_score(QUERY, k=4)
+    metrics.reset()
+    failures: List[str] = []
+
+    sequential_ms, sequential_keys = _measure(rag, parallel=False)
+    parallel_ms, parallel_keys = _measure(rag, parallel=True)
+    histograms = metrics.snapshot()["histograms"]
+    dense_ms = histograms.get("retrieval.stage.dense_ms", {}).get("p50", 0.0)
+    lexical_ms = histograms.get("retrieval.stage.lexical_ms", {}).get("p50", 0.0)
+    print(
+        f"[verify_parallel_retrieval] dense_p50={dense_ms:.1f}ms lexical_p50={lexical_ms:.1f}ms "
+        f"sequential={sequential_ms:.1f}ms parallel={parallel_ms:.1f}ms"
+    )
+
+    if parallel_keys != sequential_keys:
+        failures.append("parallel and sequential retrieval returned different rankings")
+    stage_sum = dense_ms + lexical_ms
+    slower = max(dense_ms, lexical_ms)
+    if lexical_ms < 20:
+        failures.append(f"synthetic lexical stage too fast to measure overlap ({lexical_ms:.1f}ms)")
+    elif parallel_ms > slower + (stage_sum - slower) * 0.5:
+        failures.append(f"parallel retrieval ({parallel_ms:.1f}ms) not close to the slower stage ({slower:.1f}ms)")
+    for name in ("retrieval.stage.dense_ms", "retrieval.stage.lexical_ms", "retrieval.stage.lexical_wait_ms"):
+        if name not in histograms:
+            failures.append(f"stage timing not exported: {name}")
+
+    if failures:
+        print("[verify_parallel_retrieval] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_parallel_retrieval] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
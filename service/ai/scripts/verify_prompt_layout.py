@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Check the prefix-cache friendly prompt layout against a local mock provider.
+
+Runs the same multi-turn conversations with PROMPT_LAYOUT=legacy and
+PROMPT_LAYOUT=prefix_cache and checks that:
+1) prefix_cache keeps the system message byte-identical across requests,
+   whatever the retrieved context or guardrails are.
+2) Each turn's messages (minus the last user message) are an exact prefix of
+   the next turn's messages.
+3) Cached-token counts reported by the provider are recorded, and the cached
+   share of prompt tokens is higher with prefix_cache.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.HISTORY_SUMMARY_ENABLED = False
+settings.LLM_STREAM_USAGE = True
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.services.rag_service import SYSTEM_PROMPT  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+SESSIONS = 4
+TURNS = 4
+# 用法类问题且无示例来源时会追加补充约束，用来检验约束变化不影响前缀
+QUESTIONS = [
+    "galay-http 是什么？",
+    "怎么用 galay-http 写一个 HTTP 服务器示例？",
+    "它支持 HTTP/2 吗？",
+    "那 WebSocket 呢，给个示例代码",
+]
+
+
+def _docs(session: int, turn: int) -> List[Document]:
+    body = f"galay-http 文档片段 session={session} turn={turn}。" + "HttpRouter 注册路由，HttpServer 启动服务。" * 40
+    return [
+        Document(
+            page_content=body,
+            metadata={"project": "galay-http", "file_path": f"docs/{session}-{turn}.md", "source": "docs"},
+        )
+    ]
+
+
+async def _run_layout(layout: str, failures: List[str]) -> Dict[str, float]:
+    settings.PROMPT_LAYOUT = layout
+    metrics.reset()
+    service = ChatService(vector_store=None)
+    for session in range(SESSIONS):
+        session_id = f"{layout}-{session}"
+        history: List[dict] = []
+        previous: list = []
+        for turn in range(TURNS):
+            message = QUESTIONS[turn % len(QUESTIONS)]
+            messages = service._build_messages(message, _docs(session, turn), history, session_id)
+            if layout == "prefix_cache" and messages[0].content != SYSTEM_PROMPT:
+                failures.append(f"{layout}: system message is not the static SYSTEM_PROMPT (turn {turn})")
+            if layout == "prefix_cache" and previous and messages[: len(previous)] != previous:
+                failures.append(f"{layout}: turn {turn} does not extend the previous prompt prefix")
+            parts: List[str] = []
+            async for chunk in service._llm.astream(messages):
+                parts.append(chunk.content)
+            answer = "".join(parts)
+            history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": answer}])
+            # 下一轮应以“本轮去掉最后一条用户消息 + 本轮原始问题与回答”开头
+            previous = [*messages[:-1], HumanMessage(content=message), AIMessage(content=answer)]
+    counters = metrics.snapshot()["counters"]
+    return {
+        "reported": counters.get("chat.prompt_cache.reported", 0),
+        "prompt_tokens": counters.get("chat.prompt_cache.prompt_tokens", 0),
+        "cached_tokens": counters.get("chat.prompt_cache.cached_tokens", 0),
+    }
+
+
+def main() -> int:
+    failures: List[str] = []
+    provider = MockOpenAIProvider(base_ms=1.0, chunk_interval_ms=0.0).start()
+    # 回答足够长，历史轮次才会在提示词里占有分量
+    provider.stream_pieces = ["galay-http 提供 HttpRouter 与 HttpServer。"] * 20
+    settings.OPENAI_API_BASE = provider.base_url
+    try:
+
+        async def _both() -> tuple:
+            # 共享的异步连接池绑定事件循环，两种布局放在同一个循环里跑。
+            return await _run_layout("legacy", failures), await _run_layout("prefix_cache", failures)
+
+        legacy, prefix = asyncio.run(_both())
+    finally:
+        provider.stop()
+
+    ratios = {}
+    for name, stats in (("legacy", legacy), ("prefix_cache", prefix)):
+        ratios[name] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        print(
+            f"[verify_prompt_layout] {name:<12} requests={stats['reported']:.0f} "
+            f"prompt_tokens={stats['prompt_tokens']:.0f} cached_tokens={stats['cached_tokens']:.0f} "
+            f"cached_ratio={ratios[name]:.2f}"
+        )
+        if stats["reported"] != SESSIONS * TURNS:
+            failures.append(f"{name}: cached tokens recorded for {stats['reported']:.0f}/{SESSIONS * TURNS} requests")
+    if ratios["prefix_cache"] <= ratios["legacy"] + 0.1:
+        failures.append(
+            f"prefix_cache did not raise the cached share ({ratios['legacy']:.2f} -> {ratios['prefix_cache']:.2f})"
+        )
+
+    if failures:
+        print("[verify_prompt_layout] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_prompt_layout] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Check token-bucket rate limiting behind a trusted gateway.
+
+Through the real FastAPI app (the test client connects from 127.0.0.1, which is
+configured as the trusted gateway) checks that:
+1) Users behind the gateway get separate buckets via X-Forwarded-For; each may
+   burst RATE_LIMIT_BURST requests, then gets 429 + Retry-After.
+2) Spoofed left-most X-Forwarded-For entries are ignored.
+3) Buckets refill at RATE_LIMIT_PER_MINUTE.
+4) RATE_LIMIT_KEY=session keys on session_id (the shared "default" session
+   falls back to the client IP), and rotating session_ids from one IP still
+   hits the per-IP RATE_LIMIT_IP_BURST ceiling.
+5) The Redis script reads the clock from the server (TIME), not from the
+   calling worker.
+6) The SQLite backend shares one bucket across several limiter instances
+   (workers) without over-admitting under concurrency.
+7) /api/chat and /api/chat/stream keep separate buckets: exhausting one does
+   not throttle the other.
+8) Rejections are counted in metrics.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+# 限流器在 create_app 时按配置创建，先写好测试配置。
+settings.RATE_LIMIT_ENABLED = True
+settings.RATE_LIMIT_BACKEND = "memory"
+settings.RATE_LIMIT_PER_MINUTE = 600.0
+settings.RATE_LIMIT_BURST = 5
+settings.RATE_LIMIT_KEY = "ip"
+settings.RATE_LIMIT_IP_PER_MINUTE = 6.0
+settings.RATE_LIMIT_IP_BURST = 12
+settings.RATE_LIMIT_TRUSTED_PROXIES = "127.0.0.1/32, 10.0.0.0/8"
+
+import httpx  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from src.services import rate_limiter as rate_limiter_module  # noqa: E402
+from src.services.rate_limiter import RateLimiter, SqliteTokenBuckets  # noqa: E402
+from src.utils.exceptions import RateLimitedError  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+BURST = settings.RATE_LIMIT_BURST
+IP_BURST = settings.RATE_LIMIT_IP_BURST
+
+
+class _FakeVectorStore:
+    is_ready = True
+
+
+class _FakeChatService:
+    def query(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None) -> dict:
+        return {"success": True, "response": "ok", "sources": []}
+
+    def chat(
+        self, message: str, session_id: str = "default", allow_extractive: bool = False, deadline=None, retrieval_profile=None
+    ) -> dict:
+        return {"success": True, "response": "ok", "sources": [], "session_id": session_id}
+
+    async def query_stream(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None):
+        yield {"done": True, "sources": []}
+
+    async def chat_stream(
+        self, message: str, session_id: str = "default", allow_extractive: bool = False, deadline=None, retrieval_profile=None
+    ):
+        yield {"done": True, "sources": []}
+
+
+async def _run_http(failures: List[str]) -> None:
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+
+        async def send(count: int, headers: dict, session_id: str = "default") -> List[httpx.Response]:
+            body = {"message": "galay-http 是什么", "session_id": session_id, "use_memory": session_id != "default"}
+            return [await client.post("/api/chat", json=body, headers=headers) for _ in range(count)]
+
+        user_a = await send(BURST + 2, {"X-Forwarded-For": "203.0.113.7, 10.0.0.2"})
+        user_b = await send(BURST, {"X-Forwarded-For": "198.51.100.9"})
+        codes_a = [r.status_code for r in user_a]
+        print(f"[verify_rate_limit] user_a={codes_a} user_b={[r.status_code for r in user_b]}")
+        if codes_a != [200] * BURST + [429, 429]:
+            failures.append(f"user A: expected {BURST} ok then 429, got {codes_a}")
+        if any(r.status_code != 200 for r in user_b):
+            failures.append("user B was throttled by user A's bucket (keyed on gateway IP?)")
+        if not user_a[-1].headers.get("Retry-After"):
+            failures.append("429 response is missing Retry-After")
+
+        # 流式接口有自己的桶：用户 A 的 /api/chat 桶已空，/api/chat/stream 仍可突发 BURST 次
+        stream_body = {"message": "galay-http 是什么", "session_id": "default", "use_memory": False}
+        stream_codes = [
+            (await client.post("/api/chat/stream", json=stream_body, headers={"X-Forwarded-For": "203.0.113.7"})).status_code
+            for _ in range(BURST + 1)
+        ]
+        print(f"[verify_rate_limit] user_a stream={stream_codes}")
+        if stream_codes != [200] * BURST + [429]:
+            failures.append(f"/api/chat/stream does not have its own bucket: {stream_codes}")
+
+        # 客户端伪造的最左侧条目不可信：按最右侧非受信地址（仍是用户 A）计
+        spoofed = await send(1, {"X-Forwarded-For": "1.1.1.1, 203.0.113.7"})
+        if spoofed[0].status_code != 429:
+            failures.append("spoofed X-Forwarded-For escaped user A's bucket")
+
+        await asyncio.sleep(60.0 / settings.RATE_LIMIT_PER_MINUTE * 1.5)
+        refilled = await send(1, {"X-Forwarded-For": "203.0.113.7"})
+        if refilled[0].status_code != 200:
+            failures.append("bucket did not refill at RATE_LIMIT_PER_MINUTE")
+
+        settings.RATE_LIMIT_KEY = "session"
+        try:
+            headers = {"X-Forwarded-For": "192.0.2.44"}
+            first = await send(BURST, headers, session_id="s-1")
+            second = await send(BURST, headers, session_id="s-2")
+            shared = await send(BURST + 1, headers)
+            # 每个请求换一个新 session_id：会话桶永远是满的，只能靠 IP 桶拦住
+            rotating = [
+                (await send(1, {"X-Forwarded-For": "192.0.2.45"}, session_id=f"rotate-{i}"))[0]
+                for i in range(IP_BURST + 3)
+            ]
+        finally:
+            settings.RATE_LIMIT_KEY = "ip"
+        if any(r.status_code != 200 for r in first + second):
+            failures.append("session key: sessions behind one IP did not get separate buckets")
+        if shared[-1].status_code != 429:
+            failures.append("session key: default session did not fall back to the IP bucket")
+        rotating_codes = [r.status_code for r in rotating]
+        print(f"[verify_rate_limit] rotating session_ids from one IP: {rotating_codes}")
+        if rotating_codes != [200] * IP_BURST + [429] * 3:
+            failures.append(f"session key: rotating session_ids bypassed the per-IP bucket: {rotating_codes}")
+        if not rotating[-1].headers.get("Retry-After"):
+            failures.append("per-IP 429 response is missing Retry-After")
+
+
+def _check_redis_clock(failures: List[str]) -> None:
+    script = rate_limiter_module._REDIS_TOKEN_BUCKET_LUA
+    if "redis.call('TIME')" not in script or "ARGV[4]" in script:
+        failures.append("redis token bucket still takes the clock from the worker instead of Redis TIME")
+
+
+def _check_sqlite_shared(failures: List[str]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "rate_limit.db")
+        # 每个 worker 各自一个 limiter 实例，共享同一个库文件
+        workers = [RateLimiter(SqliteTokenBuckets(path), per_minute=0.6, burst=BURST) for _ in range(4)]
+        allowed: List[int] = []
+        lock = threading.Lock()
+
+        def hammer(limiter: RateLimiter) -> None:
+            for _ in range(10):
+                try:
+                    limiter.check("chat", "ip:203.0.113.7")
+                except RateLimitedError:
+                    continue
+                with lock:
+                    allowed.append(1)
+
+        threads = [threading.Thread(target=hammer, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"[verify_rate_limit] sqlite workers=4 attempts=40 allowed={len(allowed)}")
+        if len(allowed) != BURST:
+            failures.append(f"sqlite: expected {BURST} allowed across workers, got {len(allowed)}")
+
+
+def main() -> int:
+    app_module._vector_store = _FakeVectorStore()  # type: ignore[assignment]
+    app_module._chat_service = _FakeChatService()  # type: ignore[assignment]
+    metrics.reset()
+    failures: List[str] = []
+    started = time.perf_counter()
+    asyncio.run(_run_http(failures))
+    _check_redis_clock(failures)
+    _check_sqlite_shared(failures)
+
+    counters = metrics.snapshot()["counters"]
+    rejected = counters.get("rate_limit.chat.rejected", 0)
+    stream_rejected = counters.get("rate_limit.chat_stream.rejected", 0)
+    print(
+        f"[verify_rate_limit] rejected={rejected:.0f} stream_rejected={stream_rejected:.0f} "
+        f"elapsed={time.perf_counter() - started:.2f}s"
+    )
+    if rejected < 4 or stream_rejected != 1:
+        failures.append(f"rejections not counted per endpoint in metrics: chat={rejected} chat_stream={stream_rejected}")
+
+    if failures:
+        print("[verify_rate_limit] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_rate_limit] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Check per-request retrieval profiles (fast / balanced / thorough).
+
+Through the real FastAPI app and RAGService (with a fake vector store) checks that:
+1) Each profile controls the candidate over-fetch and whether the lexical
+   fallback runs; `balanced` keeps the previous behaviour.
+2) Chat uses the profile's context chunk count.
+3) RETRIEVAL_PROFILES overrides built-in profiles and adds new ones; invalid
+   overrides are rejected at load time.
+4) An unknown profile in a request is a 400.
+5) Latency is exported per profile.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+settings.RATE_LIMIT_ENABLED = False
+
+import httpx  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from src.services.rag_service import RAGService  # noqa: E402
+from src.services.retrieval_profiles import get_retrieval_profile  # noqa: E402
+from src.utils.exceptions import ConfigurationError  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+
+class _FakeVectorStore:
+    is_ready = True
+
+    def __init__(self) -> None:
+        self.candidate_ks: List[int] = []
+
+    def search_with_score(self, query: str, k: int = 4):
+        self.candidate_ks.append(k)
+        return [
+            (Document(page_content=f"galay-http HttpServer 片段 {i}", metadata={"source": f"doc-{i}.md"}), 0.1 * i)
+            for i in range(8)
+        ]
+
+
+class _FakeLlm:
+    def invoke(self, messages, **kwargs):
+        raise AssertionError("not used")
+
+
+class _FakeChatService:
+    def __init__(self, rag: RAGService) -> None:
+        self.rag_service = rag
+        self.profiles: List[str] = []
+
+    def query(self, message: str, allow_extractive: bool = False, deadline=None, retrieval_profile=None) -> dict:
+        self.profiles.append(retrieval_profile)
+        k = get_retrieval_profile(retrieval_profile).context_k
+        docs = self.rag_service.retrieve_with_score(message, k, deadline, retrieval_profile)
+        return {"success": True, "response": f"{len(docs)} chunks", "sources": []}
+
+
+async def _run_http(store: _FakeVectorStore, lexical_calls: List[int], failures: List[str]) -> None:
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai.test") as client:
+        fetched = {}
+        for profile in ("fast", "balanced", "thorough"):
+            before = len(lexical_calls)
+            body = {"query": "galay-http HttpServer", "k": 3, "retrieval_profile": profile}
+            response = await client.post("/api/search", json=body)
+            if response.status_code != 200:
+                failures.append(f"search {profile}: HTTP {response.status_code}")
+            fetched[profile] = (store.candidate_ks[-1], len(lexical_calls) - before)
+        print(f"[verify_retrieval_profiles] search candidate_k/lexical={fetched}")
+        if fetched["balanced"] != (96, 1):
+            failures.append(f"balanced changed the previous retrieval behaviour: {fetched['balanced']}")
+        if not fetched["fast"][0] < fetched["balanced"][0] < fetched["thorough"][0]:
+            failures.append("profiles do not scale the candidate over-fetch")
+        if fetched["fast"][1] != 0:
+            failures.append("fast profile still ran the lexical fallback")
+
+        default = await client.post("/api/search", json={"query": "galay-http HttpServer", "k": 3})
+        if default.status_code != 200 or store.candidate_ks[-1] != fetched["balanced"][0]:
+            failures.append("search without a profile did not use RETRIEVAL_DEFAULT_PROFILE")
+
+        chunks = {}
+        for profile in ("fast", "thorough"):
+            body = {"message": "galay-http HttpServer", "use_memory": False, "retrieval_profile": profile}
+            chunks[profile] = (await client.post("/api/chat", json=body)).json().get("response")
+        print(f"[verify_retrieval_profiles] chat context={chunks}")
+        if chunks != {"fast": "3 chunks", "thorough": "6 chunks"}:
+            failures.append(f"chat did not use the profile's context_k: {chunks}")
+
+        bad_search = await client.post("/api/search", json={"query": "galay", "retrieval_profile": "nope"})
+        bad_chat = await client.post("/api/chat", json={"message": "galay", "retrieval_profile": "nope"})
+        if bad_search.status_code != 400 or bad_chat.status_code != 400:
+            failures.append(f"unknown profile: expected 400, got {bad_search.status_code}/{bad_chat.status_code}")
+
+
+def _check_overrides(failures: List[str]) -> None:
+    settings.RETRIEVAL_PROFILES = '{"fast": {"candidate_max": 32}, "docs": {"dense_weight": 0.7, "context_k": 5}}'
+    try:
+        fast, docs = get_retrieval_profile("fast"), get_retrieval_profile("docs")
+        if fast.candidate_max != 32 or fast.lexical_fallback:
+            failures.append("override: fast profile lost its built-in fields or ignored the override")
+        if docs.dense_weight != 0.7 or docs.context_k != 5 or docs.candidate_max != 256:
+            failures.append("override: new profile is not based on balanced")
+        for raw in ('{"fast": {"bogus": 1}}', "[1]", '{"fast": {"candidate_min": 0}}'):
+            settings.RETRIEVAL_PROFILES = raw
+            try:
+                get_retrieval_profile("fast")
+                failures.append(f"override: invalid RETRIEVAL_PROFILES accepted: {raw}")
+            except ConfigurationError:
+                pass
+    finally:
+        settings.RETRIEVAL_PROFILES = ""
+
+
+def main() -> int:
+    metrics.reset()
+    store = _FakeVectorStore()
+    rag = RAGService(store, llm=_FakeLlm())  # type: ignore[arg-type]
+    lexical_calls: List[int] = []
+    rag._lexical_fallback = lambda terms, *args, **kwargs: lexical_calls.append(1) or []  # type: ignore[method-assign]
+    app_module._vector_store = store  # type: ignore[assignment]
+    app_module._chat_service = _FakeChatService(rag)  # type: ignore[assignment]
+
+    failures: List[str] = []
+    asyncio.run(_run_http(store, lexical_calls, failures))
+    _check_overrides(failures)
+
+    histograms = metrics.snapshot()["histograms"]
+    exported = sorted(name for name in histograms if name.startswith("retrieval.profile."))
+    print(f"[verify_retrieval_profiles] histograms={exported}")
+    for profile in ("fast", "balanced", "thorough"):
+        if f"retrieval.profile.{profile}.latency_ms" not in histograms:
+            failures.append(f"latency not exported for profile {profile}")
+
+    if failures:
+        print("[verify_retrieval_profiles] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_retrieval_profiles] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
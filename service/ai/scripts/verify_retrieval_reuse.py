@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Check retrieval reuse for follow-up questions within a session.
+
+Drives ChatService.chat with a real RAGService over a fake vector store and a
+fake LLM, and checks that:
+1) The first question in a session runs a full (balanced) retrieval.
+2) A follow-up ("websocket 呢") runs one narrow retrieval with the earlier
+   project name carried over, merged with the cached chunks.
+3) Naming a different project, an index reload, or a new session falls back
+   to a full retrieval.
+4) Full and follow-up retrieval latency are reported separately.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.services.rag_service import RAGService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+
+class _FakeVectorStore:
+    def __init__(self) -> None:
+        self.searches: List[Tuple[str, int]] = []
+
+    def search_with_score(self, query: str, k: int = 4):
+        self.searches.append((query, k))
+        slug = query.replace(" ", "_")
+        return [
+            (Document(page_content=f"{query} 片段 {i}", metadata={"source": f"{slug}/doc-{i}.md", "chunk": i}), 0.2 * i)
+            for i in range(3)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [1.0, 0.0]
+
+
+class _FakeLlm:
+    def invoke(self, messages, **kwargs):
+        return AIMessage(content="好的。")
+
+    def health(self) -> dict:
+        return {}
+
+
+def main() -> int:
+    settings.HISTORY_SUMMARY_ENABLED = False
+    settings.SESSION_STORE_BACKEND = "memory"
+    metrics.reset()
+    store = _FakeVectorStore()
+    service = ChatService(store)  # type: ignore[arg-type]
+    service._llm = _FakeLlm()  # type: ignore[assignment]
+    service._fast_llm = None
+    service._rag = RAGService(store, llm=service._llm)  # type: ignore[arg-type]
+    service._rag._lexical_fallback = lambda *args, **kwargs: []  # type: ignore[method-assign]
+    failures: List[str] = []
+
+    def ask(message: str, session_id: str = "s1") -> Tuple[str, int, List[str]]:
+        before = len(store.searches)
+        result = service.chat(message, session_id)
+        searches = store.searches[before:]
+        if len(searches) != 1:
+            failures.append(f"{message!r}: expected one vector search, got {len(searches)}")
+        query, k = searches[-1]
+        return query, k, [source["file"] for source in result["sources"]]
+
+    full_query, full_k, first_sources = ask("galay-http 怎么快速开始")
+    follow_query, follow_k, follow_sources = ask("websocket 呢")
+    print(f"[verify_retrieval_reuse] full query={full_query!r} k={full_k}")
+    print(f"[verify_retrieval_reuse] follow-up query={follow_query!r} k={follow_k} sources={follow_sources}")
+    if follow_query != "galay-http websocket 呢":
+        failures.append(f"follow-up: project name not carried over: {follow_query!r}")
+    if follow_k >= full_k:
+        failures.append(f"follow-up: expected a narrower candidate fetch than {full_k}, got {follow_k}")
+    if not any(src.startswith("galay-http_websocket") for src in follow_sources):
+        failures.append("follow-up: merged context lost the fresh chunks")
+    if not any(src in first_sources for src in follow_sources):
+        failures.append("follow-up: merged context lost the cached chunks")
+    if len(follow_sources) != 4:
+        failures.append(f"follow-up: expected context_k=4 merged chunks, got {len(follow_sources)}")
+
+    counters = metrics.snapshot()["counters"]
+    if counters.get("chat.retrieval_reuse.hit") != 1:
+        failures.append("follow-up: reuse hit not counted")
+
+    switch_query, switch_k, _ = ask("那 galay-rpc 呢")
+    if switch_query != "那 galay-rpc 呢" or switch_k != full_k:
+        failures.append(f"topic switch: expected a full retrieval, got {switch_query!r} k={switch_k}")
+
+    service.on_index_reloaded()
+    reload_query, reload_k, _ = ask("那 HTTP2 呢")
+    if reload_k != full_k:
+        failures.append(f"index reload: cached chunks reused after reload (k={reload_k})")
+
+    other_query, other_k, _ = ask("websocket 呢", session_id="s2")
+    if other_query != "websocket 呢" or other_k != full_k:
+        failures.append("new session: reused another session's retrieval")
+
+    snapshot = metrics.snapshot()
+    counters, histograms = snapshot["counters"], snapshot["histograms"]
+    print(
+        f"[verify_retrieval_reuse] hit={counters.get('chat.retrieval_reuse.hit', 0):.0f} "
+        f"miss={counters.get('chat.retrieval_reuse.miss', 0):.0f} "
+        f"topic_switch={counters.get('chat.retrieval_reuse.topic_switch', 0):.0f} "
+        f"full_ms={histograms.get('chat.retrieval.full_ms', {}).get('count', 0)} "
+        f"follow_up_ms={histograms.get('chat.retrieval.follow_up_ms', {}).get('count', 0)}"
+    )
+    if histograms.get("chat.retrieval.follow_up_ms", {}).get("count") != 1:
+        failures.append("follow-up latency not reported separately")
+    if histograms.get("chat.retrieval.full_ms", {}).get("count") != 4:
+        failures.append("full retrieval latency not reported")
+
+    if failures:
+        print("[verify_retrieval_reuse] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_retrieval_reuse] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
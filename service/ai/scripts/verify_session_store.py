@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Contract checks for chat session stores.
+
+Runs the same checks against:
+1) InMemorySessionStore
+2) SqliteSessionStore (temp file, two instances = two workers)
+3) RedisSessionStore against a local RESP stand-in (or a real server via --redis-url)
+
+No network or LLM required.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.services.session_store import (  # noqa: E402
+    InMemorySessionStore,
+    RedisSessionStore,
+    SessionStore,
+    SqliteSessionStore,
+)
+
+
+ROUNDS = 3
+TTL_SECONDS = 1
+
+
+class _RespStandInHandler(socketserver.StreamRequestHandler):
+    """只实现会话存储用到的命令：RPUSH/LTRIM/LRANGE/GET/SET/EXPIRE/TTL/DEL/SCAN/SELECT/AUTH/PING"""
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            count = int(line[1:-2])
+            args: List[str] = []
+            for _ in range(count):
+                size = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+            self.wfile.write(self.server.dispatch(args))  # type: ignore[attr-defined]
+
+
+class _RespStandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _RespStandInHandler)
+        self._lists: Dict[str, List[str]] = {}
+        self._strings: Dict[str, str] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def dispatch(self, args: List[str]) -> bytes:
+        cmd, rest = args[0].upper(), args[1:]
+        with self._lock:
+            self._expire_keys()
+            if cmd in ("PING", "SELECT", "AUTH"):
+                return b"+OK\r\n"
+            if cmd == "RPUSH":
+                items = self._lists.setdefault(rest[0], [])
+                items.extend(rest[1:])
+                return f":{len(items)}\r\n".encode()
+            if cmd == "LTRIM":
+                items = self._lists.get(rest[0], [])
+                self._lists[rest[0]] = _slice(items, int(rest[1]), int(rest[2]))
+                return b"+OK\r\n"
+            if cmd == "LRANGE":
+                return _encode_array(_slice(self._lists.get(rest[0], []), int(rest[1]), int(rest[2])))
+            if cmd == "GET":
+                value = self._strings.get(rest[0])
+                if value is None:
+                    return b"$-1\r\n"
+                data = value.encode("utf-8")
+                return f"${len(data)}\r\n".encode() + data + b"\r\n"
+            if cmd == "SET":
+                self._strings[rest[0]] = rest[1]
+                self._expires.pop(rest[0], None)
+                if len(rest) >= 4 and rest[2].upper() == "EX":
+                    self._expires[rest[0]] = time.time() + int(rest[3])
+                return b"+OK\r\n"
+            if cmd == "EXPIRE":
+                if rest[0] not in self._lists and rest[0] not in self._strings:
+                    return b":0\r\n"
+                self._expires[rest[0]] = time.time() + int(rest[1])
+                return b":1\r\n"
+            if cmd == "TTL":
+                if rest[0] not in self._lists and rest[0] not in self._strings:
+                    return b":-2\r\n"
+                if rest[0] not in self._expires:
+                    return b":-1\r\n"
+                return f":{max(0, round(self._expires[rest[0]] - time.time()))}\r\n".encode()
+            if cmd == "DEL":
+                removed = int(self._lists.pop(rest[0], None) is not None)
+                removed += int(self._strings.pop(rest[0], None) is not None)
+                self._expires.pop(rest[0], None)
+                return f":{removed}\r\n".encode()
+            if cmd == "SCAN":
+                pattern = rest[rest.index("MATCH") + 1] if "MATCH" in rest else "*"
+                keys = [key for key in self._lists if fnmatch.fnmatchcase(key, pattern)]
+                return b"*2\r\n$1\r\n0\r\n" + _encode_array(keys)
+        return f"-ERR unknown command '{cmd}'\r\n".encode()
+
+    def _expire_keys(self) -> None:
+        now = time.time()
+        for key in [key for key, at in self._expires.items() if at <= now]:
+            self._lists.pop(key, None)
+            self._strings.pop(key, None)
+            self._expires.pop(key, None)
+
+
+def _slice(items: List[str], start: int, stop: int) -> List[str]:
+    size = len(items)
+    start = max(0, start + size if start < 0 else start)
+    stop = stop + size if stop < 0 else min(stop, size - 1)
+    return items[start : stop + 1] if start <= stop else []
+
+
+def _encode_array(items: List[str]) -> bytes:
+    parts = [f"*{len(items)}\r\n".encode()]
+    for item in items:
+        data = item.encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+def _check_store(name: str, make_store: Callable[[], SessionStore], shared: bool) -> List[str]:
+    failures: List[str] = []
+    store = make_store()
+    other = make_store() if shared else store
+
+    def expect(cond: bool, message: str) -> None:
+        if not cond:
+            failures.append(f"{name}: {message}")
+
+    store.clear("s1")
+    store.clear("s2")
+    for i in range(ROUNDS + 2):
+        store.append_turn("s1", f"q{i}", f"回答 {i}")
+    history = store.get_history("s1")
+    expect(len(history) == ROUNDS * 2, f"history not bounded: {len(history)} entries")
+    expect(history[0] == {"role": "user", "content": "q2"}, f"oldest turn not evicted: {history[:1]}")
+    expect(history[-1] == {"role": "assistant", "content": f"回答 {ROUNDS + 1}"}, "last turn missing")
+
+    history.append({"role": "user", "content": "mutated"})
+    expect(len(store.get_history("s1")) == ROUNDS * 2, "get_history must return a snapshot")
+
+    if shared:
+        expect(other.get_history("s1") == store.get_history("s1"), "second worker sees different history")
+        other.append_turn("s2", "from-worker-2", "ok")
+        expect(store.get_history("s2")[0]["content"] == "from-worker-2", "append from second worker not visible")
+    else:
+        store.append_turn("s2", "from-worker-2", "ok")
+
+    expect({"s1", "s2"} <= set(store.list_sessions()), f"list_sessions missing ids: {store.list_sessions()}")
+
+    summary = {"text": "用户在问 galay-http", "covered": "abc"}
+    store.set_summary("s1", summary)
+    expect(other.get_summary("s1") == summary, f"summary not readable: {other.get_summary('s1')}")
+    store.set_summary("missing", summary)
+    expect(store.get_summary("missing") is None, "summary written for unknown session")
+    expect(set(store.list_sessions()) == {"s1", "s2"}, f"summary leaked into list_sessions: {store.list_sessions()}")
+
+    store.clear("s2")
+    expect(store.get_history("s2") == [], "clear did not remove history")
+
+    time.sleep(TTL_SECONDS + 1.1)
+    expect(store.get_history("s1") == [], "session did not expire after TTL")
+    expect(store.get_summary("s1") is None, "summary did not expire with session")
+    store.append_turn("s1", "fresh", "start")
+    expect(len(store.get_history("s1")) == 2, "expired session should restart empty")
+
+    store.close()
+    if other is not store:
+        other.close()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verify session store backends")
+    parser.add_argument("--redis-url", default="", help="Use a real Redis server instead of the stand-in")
+    args = parser.parse_args()
+
+    stand_in = None
+    redis_url = args.redis_url
+    if not redis_url:
+        stand_in = _RespStandInServer()
+        threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+        redis_url = f"redis://127.0.0.1:{stand_in.server_address[1]}/0"
+
+    failures: List[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "sessions.db")
+        backends: List[Tuple[str, Callable[[], SessionStore], bool]] = [
+            ("memory", lambda: InMemorySessionStore(10, ROUNDS, TTL_SECONDS), False),
+            ("sqlite", lambda: SqliteSessionStore(db_path, ROUNDS, TTL_SECONDS), True),
+            ("redis", lambda: RedisSessionStore(redis_url, ROUNDS, TTL_SECONDS), True),
+        ]
+        for name, make_store, shared in backends:
+            backend_failures = _check_store(name, make_store, shared)
+            status = "OK" if not backend_failures else "FAIL"
+            print(f"[verify_session_store] {name:<7} {status}")
+            failures.extend(backend_failures)
+
+    evicting = InMemorySessionStore(2, ROUNDS, TTL_SECONDS)
+    for sid in ("a", "b", "c"):
+        evicting.append_turn(sid, "q", "a")
+    if evicting.list_sessions() != ["b", "c"]:
+        failures.append(f"memory: LRU eviction expected ['b', 'c'], got {evicting.list_sessions()}")
+
+    if stand_in is not None:
+        stand_in.shutdown()
+
+    if failures:
+        print("[verify_session_store] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_session_store] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
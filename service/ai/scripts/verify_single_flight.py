@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Check single-flight coalescing of identical memoryless queries.
+
+Uses a fake RAG service (no network, no LLM) and verifies:
+1) Concurrent ChatService.query calls for one normalized question run one retrieval.
+2) Concurrent query_stream subscribers share one upstream stream and end with the same answer.
+3) One subscriber leaving early does not cancel the stream for the others.
+4) When every subscriber leaves, the upstream stream is cancelled.
+5) A late subscriber starts from the latest replace snapshot instead of replaying
+   every partial event.
+6) A slow subscriber's queue stays within its bound and it still gets the final
+   answer and done event, without slowing the upstream or a fast subscriber.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.services.single_flight import StreamSingleFlight  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+
+class _FakeVectorStore:
+    def embed_query(self, text: str) -> List[float]:
+        return [1.0, 0.0]
+
+
+class _FakeRag:
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = {"retrieve": 0, "stream": 0, "stream_closed": 0}
+
+    def retrieve_with_score(self, message: str, k: int = 4, deadline=None, profile=None):
+        self.calls["retrieve"] += 1
+        time.sleep(0.1)
+        return [(Document(page_content="galay-http 用法", metadata={"source": "README.md"}), 0.9)]
+
+    def generate(self, message: str, docs: list, llm=None, deadline=None) -> str:
+        return "galay-http 是协程 HTTP 库。"
+
+    async def generate_stream(self, message: str, docs: list, llm=None, deadline=None):
+        self.calls["stream"] += 1
+        try:
+            for index in range(6):
+                await asyncio.sleep(0.05)
+                yield f"第 {index} 段：galay-http 的使用说明足够长，可以触发增量输出。"
+        finally:
+            self.calls["stream_closed"] += 1
+
+    def invalidate_cache(self) -> None:
+        pass
+
+
+PARTIALS = 200
+QUEUE_MAXSIZE = 8
+
+
+async def _check_stream_fanout(failures: List[str]) -> None:
+    coalescer = StreamSingleFlight("fanout", QUEUE_MAXSIZE)
+    upstream: Dict[str, float] = {}
+
+    async def factory():
+        started = time.perf_counter()
+        text = ""
+        for index in range(PARTIALS):
+            await asyncio.sleep(0.001)
+            text += f"第 {index} 段。"
+            yield {"replace": text, "blocks": [], "partial": True}
+        yield {"replace": text, "blocks": []}
+        yield {"done": True, "sources": []}
+        upstream["elapsed"] = time.perf_counter() - started
+
+    max_pending = 0
+
+    async def consume(delay: float, per_event: float) -> List[dict]:
+        nonlocal max_pending
+        await asyncio.sleep(delay)
+        events: List[dict] = []
+        async for event in coalescer.subscribe("q", factory):
+            events.append(event)
+            for flight in coalescer._flights.values():
+                for subscriber in flight.subscribers:
+                    max_pending = max(max_pending, len(subscriber.pending))
+            if per_event:
+                await asyncio.sleep(per_event)
+        return events
+
+    fast, slow, late = await asyncio.gather(consume(0, 0), consume(0, 0.02), consume(0.15, 0))
+    final = fast[-2:]
+    print(
+        f"[verify_single_flight] fanout: fast={len(fast)} slow={len(slow)} late={len(late)} "
+        f"max_pending={max_pending} upstream={upstream.get('elapsed', 0) * 1000:.0f}ms"
+    )
+    if len(fast) != PARTIALS + 2:
+        failures.append(f"fanout: fast subscriber got {len(fast)} events, expected {PARTIALS + 2}")
+    if slow[-2:] != final or late[-2:] != final:
+        failures.append("fanout: slow / late subscriber missed the final answer or done event")
+    if max_pending > QUEUE_MAXSIZE:
+        failures.append(f"fanout: subscriber queue grew to {max_pending}, bound is {QUEUE_MAXSIZE}")
+    if len(slow) >= len(fast):
+        failures.append("fanout: slow subscriber was not fast-forwarded to the latest snapshot")
+    if upstream.get("elapsed", 1.0) * 1000 > PARTIALS * 0.02 * 1000 / 4:
+        failures.append("fanout: the slow subscriber slowed the upstream stream down")
+    texts = [event["replace"] for event in slow if "replace" in event]
+    if any(len(b) < len(a) for a, b in zip(texts, texts[1:])):
+        failures.append("fanout: slow subscriber saw snapshots out of order")
+    first_late = late[0] if late else {}
+    if not first_late.get("replace") or first_late["replace"] == fast[0]["replace"] or len(late) >= len(fast):
+        failures.append("fanout: late subscriber replayed from the start instead of the latest snapshot")
+
+
+def main() -> int:
+    # 关闭答案缓存，只观察单飞本身。
+    settings.ANSWER_CACHE_ENABLED = False
+    metrics.reset()
+    rag = _FakeRag()
+    service = ChatService(_FakeVectorStore())  # type: ignore[arg-type]
+    service._rag = rag  # type: ignore[assignment]
+    failures: List[str] = []
+
+    results: List[dict] = []
+    threads = [threading.Thread(target=lambda: results.append(service.query("galay-http 是什么？"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if rag.calls["retrieve"] != 1:
+        failures.append(f"query: expected 1 retrieval for 8 callers, got {rag.calls['retrieve']}")
+    if len({result["response"] for result in results}) != 1:
+        failures.append("query: callers received different answers")
+
+    async def run_streams() -> None:
+        async def consume(question: str, delay: float, limit: int = 0) -> List[dict]:
+            await asyncio.sleep(delay)
+            events: List[dict] = []
+            async for event in service.query_stream(question):
+                events.append(event)
+                if limit and len(events) >= limit:
+                    break
+            return events
+
+        shared = await asyncio.gather(*(consume("Galay-HTTP 是什么", i * 0.05) for i in range(5)))
+        if rag.calls["stream"] != 1:
+            failures.append(f"stream: expected 1 upstream stream for 5 subscribers, got {rag.calls['stream']}")
+        if any(events[-2:] != shared[0][-2:] for events in shared[1:]):
+            failures.append("stream: subscribers did not end with the same final answer and done event")
+        if not shared[0] or not shared[0][-1].get("done"):
+            failures.append(f"stream: missing done event: {shared[0][-1:]}")
+
+        early, full = await asyncio.gather(consume("另一个问题", 0, limit=1), consume("另一个问题", 0))
+        if not full or not full[-1].get("done"):
+            failures.append("stream: early leaver cancelled the stream for the remaining subscriber")
+
+        closed_before = rag.calls["stream_closed"]
+        await consume("第三个问题", 0, limit=1)
+        await asyncio.sleep(0.3)
+        if rag.calls["stream_closed"] != closed_before + 1:
+            failures.append("stream: upstream not closed after every subscriber left")
+        if metrics.snapshot()["counters"].get("chat_stream.cancelled.query", 0) < 1:
+            failures.append("stream: cancellation not recorded")
+
+    asyncio.run(run_streams())
+    asyncio.run(_check_stream_fanout(failures))
+
+    snapshot = metrics.snapshot()
+    print(
+        "[verify_single_flight] "
+        f"query_ratio={snapshot['gauges'].get('chat.coalesce.query.ratio', 0):.3f} "
+        f"stream_ratio={snapshot['gauges'].get('chat.coalesce.query_stream.ratio', 0):.3f}"
+    )
+    if failures:
+        print("[verify_single_flight] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_single_flight] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Check incremental streaming of both chat stream modes against a mock provider.
+
+The mock provider streams several sentences with a fixed gap between chunks.
+Checks that:
+1) `query_stream` (memoryless path) yields preview events while the upstream
+   is still streaming: the first visible event arrives long before the final
+   normalized `replace` event, and several previews arrive before it.
+2) `chat_stream` (memory path) streams the same way.
+3) `chat_stream.ttft_ms.query` and `chat_stream.ttft_ms.memory` are recorded
+   once per stream, and each is below the total stream duration.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import AsyncGenerator, List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_MAX_RETRIES = 0
+settings.LLM_UPSTREAMS = ""
+settings.FAST_MODEL_NAME = ""
+settings.HEDGE_LLM_STREAM_ENABLED = False
+settings.HISTORY_SUMMARY_ENABLED = False
+settings.ANSWER_CACHE_ENABLED = False
+
+from langchain_core.documents import Document  # noqa: E402
+
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+CHUNK_INTERVAL_MS = 120.0
+PIECES = [
+    "galay-http 是基于 C++20 协程的 HTTP 库。",
+    "HttpRouter 负责注册路由与处理函数。",
+    "HttpServer 在 Runtime 调度器上运行。",
+    "处理函数返回可 co_await 的协程任务。",
+    "更多细节请参考项目文档中的快速开始。",
+]
+QUESTION = "galay-http 的路由怎么注册？"
+
+
+def _docs() -> List[Tuple[Document, float]]:
+    doc = Document(
+        page_content="galay-http 使用 HttpRouter 注册路由，HttpServer 启动服务。" * 8,
+        metadata={"project": "galay-http", "source": "galay-http/docs/路由.md", "file_path": "docs/路由.md"},
+    )
+    return [(doc, 0.2)]
+
+
+async def _collect(events: AsyncGenerator[dict, None]) -> List[Tuple[float, dict]]:
+    started = time.perf_counter()
+    timeline: List[Tuple[float, dict]] = []
+    async for event in events:
+        timeline.append(((time.perf_counter() - started) * 1000, event))
+    return timeline
+
+
+def _check_timeline(mode: str, timeline: List[Tuple[float, dict]], failures: List[str]) -> float:
+    previews = [at for at, event in timeline if event.get("partial") or "content" in event]
+    finals = [at for at, event in timeline if "replace" in event and not event.get("partial")]
+    done = [event for _, event in timeline if event.get("done")]
+    errors = [event["error"] for _, event in timeline if event.get("error")]
+    final_at = finals[-1] if finals else 0.0
+    first_at = previews[0] if previews else final_at
+    print(
+        f"[verify_stream_answers] {mode}: previews={len(previews)} first={first_at:.0f}ms "
+        f"final={final_at:.0f}ms events={len(timeline)}"
+    )
+    if errors:
+        failures.append(f"{mode}: stream reported an error: {errors[0]}")
+        return final_at
+    if not done or not finals:
+        failures.append(f"{mode}: stream did not end with a final replace + done event")
+    if len(previews) < len(PIECES) - 2:
+        failures.append(f"{mode}: only {len(previews)} preview events before the final answer")
+    # 首个可见内容应在上游还没吐完时就到达，而不是等全文
+    if final_at - first_at < CHUNK_INTERVAL_MS * (len(PIECES) - 2):
+        failures.append(f"{mode}: first preview at {first_at:.0f}ms is not ahead of the final at {final_at:.0f}ms")
+    return final_at
+
+
+async def _run(service: ChatService, failures: List[str]) -> None:
+    timeline = await _collect(service.query_stream(QUESTION))
+    query_total = _check_timeline("query", timeline, failures)
+
+    timeline = await _collect(service.chat_stream(QUESTION, session_id="verify-stream"))
+    memory_total = _check_timeline("memory", timeline, failures)
+
+    histograms = metrics.snapshot().get("histograms", {})
+    for mode, total in (("query", query_total), ("memory", memory_total)):
+        ttft = histograms.get(f"chat_stream.ttft_ms.{mode}") or {}
+        count = ttft.get("count", 0)
+        avg = ttft.get("avg", 0.0)
+        print(f"[verify_stream_answers] ttft_ms.{mode}: count={count} avg={avg:.0f}ms")
+        if count != 1:
+            failures.append(f"chat_stream.ttft_ms.{mode} recorded {count} times, expected once")
+        elif avg >= total - CHUNK_INTERVAL_MS:
+            failures.append(f"chat_stream.ttft_ms.{mode}={avg:.0f}ms is not ahead of the stream end {total:.0f}ms")
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    provider = MockOpenAIProvider(base_ms=20.0, chunk_interval_ms=CHUNK_INTERVAL_MS).start()
+    provider.stream_pieces = list(PIECES)
+    settings.OPENAI_API_BASE = provider.base_url
+    try:
+        service = ChatService(vector_store=None)
+        service._retrieve = lambda message, deadline, profile: _docs()  # type: ignore[method-assign]
+        service._retrieve_for_session = lambda *args, **kwargs: _docs()  # type: ignore[method-assign]
+        asyncio.run(_run(service, failures))
+    finally:
+        provider.stop()
+
+    if failures:
+        print("[verify_stream_answers] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_stream_answers] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Check the chat stream producer task and its bounded queue.
+
+Drives `/api/chat/stream` as a raw ASGI app with a fake chat service whose
+stream stays silent for several heartbeat intervals before its first event,
+then emits events faster than the (deliberately slow) client reads them.
+Checks that:
+1) Heartbeat pings go out while the first upstream event is pending, and the
+   heartbeat timeout does not cancel the upstream read: every event arrives.
+2) The queue between producer and client never holds more than
+   STREAM_QUEUE_MAXSIZE events, and the producer actually blocks on it.
+3) `chat_stream.queue_max_depth`, `chat_stream.producer_blocked_ms`,
+   `chat_stream.backpressure_streams` and `chat_stream.producer_blocked_puts`
+   are emitted; a fast client leaves the backpressure counters untouched.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Any, AsyncGenerator, List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+from src.config import settings  # noqa: E402
+
+settings.RATE_LIMIT_ENABLED = False
+
+import src.app as app_module  # noqa: E402
+from src.api import chat as chat_api  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+HEARTBEAT_SECONDS = 0.1
+FIRST_EVENT_DELAY_SECONDS = 0.6
+EVENTS = 120
+QUEUE_MAXSIZE = 8
+UPSTREAM_EVENT_SECONDS = 0.001
+SLOW_CLIENT_SECONDS = 0.005
+
+
+class _FakeVectorStoreReady:
+    is_ready = True
+
+
+class _SlowStartChatService:
+    """首个事件前长时间无输出，之后连续快速产出事件"""
+
+    def __init__(self) -> None:
+        self.closed_early = False
+        self.max_depth_seen = 0
+        self.queue: asyncio.Queue | None = None
+
+    async def query_stream(
+        self, message: str, allow_extractive=False, deadline=None, retrieval_profile=None
+    ) -> AsyncGenerator[dict, None]:
+        finished = False
+        try:
+            await asyncio.sleep(FIRST_EVENT_DELAY_SECONDS)
+            for index in range(EVENTS):
+                await asyncio.sleep(UPSTREAM_EVENT_SECONDS)
+                self._sample_queue_depth()
+                yield {"content": f"片段 {index}。"}
+            yield {"done": True, "sources": []}
+            finished = True
+        finally:
+            if not finished:
+                self.closed_early = True
+
+    def _sample_queue_depth(self) -> None:
+        if self.queue is not None:
+            self.max_depth_seen = max(self.max_depth_seen, self.queue.qsize())
+
+
+async def _stream(client_delay: float) -> List[dict]:
+    body = json.dumps({"message": "galay-http", "use_memory": False}).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/chat/stream",
+        "raw_path": b"/api/chat/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"ai.test"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("ai.test", 80),
+    }
+    finished = asyncio.Event()
+    body_sent = False
+    events: List[dict] = []
+
+    async def receive() -> dict:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message["type"] != "http.response.body":
+            return
+        for line in message.get("body", b"").decode("utf-8").splitlines():
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: ") :]))
+        # 慢客户端：每写一个事件都要等一会儿
+        if client_delay:
+            await asyncio.sleep(client_delay)
+
+    try:
+        await app_module.app(scope, receive, send)
+    finally:
+        finished.set()
+    return events
+
+
+def _install_queue_probe(svc: _SlowStartChatService) -> None:
+    """记录接口创建的队列，生产端每次产出前采样队列深度"""
+    original = chat_api.asyncio.Queue
+
+    class _ProbeQueue(original):  # type: ignore[misc, valid-type]
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            svc.queue = self
+
+    chat_api.asyncio.Queue = _ProbeQueue  # type: ignore[misc]
+
+
+async def _run(failures: List[str]) -> None:
+    svc = _SlowStartChatService()
+    app_module._chat_service = svc  # type: ignore[assignment]
+    original_queue = asyncio.Queue
+    _install_queue_probe(svc)
+    try:
+        events = await _stream(SLOW_CLIENT_SECONDS)
+    finally:
+        chat_api.asyncio.Queue = original_queue  # type: ignore[misc]
+
+    pings = [event for event in events if event.get("ping") and event.get("stage") != "accepted"]
+    contents = [event for event in events if "content" in event]
+    counters = metrics.snapshot()["counters"]
+    histograms = metrics.snapshot()["histograms"]
+    max_depth = histograms.get("chat_stream.queue_max_depth", {}).get("p99", 0.0)
+    blocked_ms = histograms.get("chat_stream.producer_blocked_ms", {}).get("p99", 0.0)
+    print(
+        f"[verify_stream_backpressure] slow client: pings={len(pings)} events={len(contents)}/{EVENTS} "
+        f"max_depth={max_depth:.0f} sampled_depth={svc.max_depth_seen} "
+        f"blocked_puts={counters.get('chat_stream.producer_blocked_puts', 0):.0f} blocked_ms={blocked_ms:.0f}"
+    )
+    expected_pings = int(FIRST_EVENT_DELAY_SECONDS / HEARTBEAT_SECONDS) - 2
+    if len(pings) < expected_pings:
+        failures.append(f"only {len(pings)} heartbeats during the {FIRST_EVENT_DELAY_SECONDS}s silent start")
+    if svc.closed_early or len(contents) != EVENTS or not any(event.get("done") for event in events):
+        failures.append("heartbeat timeout cancelled the upstream stream before it finished")
+    if svc.queue is None or svc.queue.maxsize != QUEUE_MAXSIZE:
+        failures.append("stream queue is not bounded by STREAM_QUEUE_MAXSIZE")
+    if max_depth > QUEUE_MAXSIZE or svc.max_depth_seen > QUEUE_MAXSIZE:
+        failures.append(f"queue depth {max(max_depth, svc.max_depth_seen)} exceeded maxsize {QUEUE_MAXSIZE}")
+    if max_depth < QUEUE_MAXSIZE - 1:
+        failures.append(f"slow client never filled the queue (max_depth={max_depth})")
+    if counters.get("chat_stream.backpressure_streams") != 1 or not counters.get("chat_stream.producer_blocked_puts"):
+        failures.append("backpressure counters not emitted for the slow client")
+    if blocked_ms <= 0:
+        failures.append("chat_stream.producer_blocked_ms not recorded for the slow client")
+
+    metrics.reset()
+    svc = _SlowStartChatService()
+    app_module._chat_service = svc  # type: ignore[assignment]
+    events = await _stream(0.0)
+    counters = metrics.snapshot()["counters"]
+    histograms = metrics.snapshot()["histograms"]
+    print(
+        f"[verify_stream_backpressure] fast client: events={sum(1 for e in events if 'content' in e)} "
+        f"backpressure_streams={counters.get('chat_stream.backpressure_streams', 0):.0f}"
+    )
+    if "chat_stream.queue_max_depth" not in histograms or "chat_stream.producer_blocked_ms" not in histograms:
+        failures.append("queue depth / blocked time histograms not emitted for the fast client")
+    if counters.get("chat_stream.backpressure_streams"):
+        failures.append("fast client was counted as a backpressure stream")
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    chat_api.STREAM_HEARTBEAT_SECONDS = HEARTBEAT_SECONDS
+    chat_api.STREAM_QUEUE_MAXSIZE = QUEUE_MAXSIZE
+    app_module._vector_store = _FakeVectorStoreReady()  # type: ignore[assignment]
+    asyncio.run(_run(failures))
+
+    if failures:
+        print("[verify_stream_backpressure] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_stream_backpressure] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
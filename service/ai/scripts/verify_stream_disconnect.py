@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Check that an SSE client disconnect cancels the chat stream mid-answer.
+
+Drives `/api/chat/stream` (use_memory=true) as a raw ASGI app against a mock
+provider that pauses between streamed chunks, and disconnects the client right
+after the first preview event. Checks that:
+1) The endpoint returns shortly after the disconnect, without waiting for the
+   next upstream chunk or heartbeat.
+2) The upstream LLM stream is closed (the mock provider sees the aborted
+   connection).
+3) `chat_stream.cancelled` / `chat_stream.cancelled.memory` and the saved-token
+   estimate are incremented.
+4) No partial turn is written to the session history.
+No network access or real LLM needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.config import settings  # noqa: E402
+
+settings.OPENAI_API_KEY = "mock-key"
+settings.LLM_MAX_RETRIES = 0
+settings.LLM_UPSTREAMS = ""
+settings.FAST_MODEL_NAME = ""
+settings.HEDGE_LLM_STREAM_ENABLED = False
+settings.HISTORY_SUMMARY_ENABLED = False
+settings.ANSWER_CACHE_ENABLED = False
+settings.RATE_LIMIT_ENABLED = False
+settings.SESSION_STORE_BACKEND = "memory"
+
+from langchain_core.documents import Document  # noqa: E402
+
+import src.app as app_module  # noqa: E402
+from mock_openai_provider import MockOpenAIProvider  # noqa: E402
+from src.services.chat_service import ChatService  # noqa: E402
+from src.utils.metrics import metrics  # noqa: E402
+
+CHUNK_INTERVAL_MS = 1500.0
+PIECES = [
+    "galay-http 是基于 C++20 协程的 HTTP 库。",
+    "HttpRouter 负责注册路由与处理函数。",
+    "HttpServer 在 Runtime 调度器上运行。",
+    "处理函数返回可 co_await 的协程任务。",
+]
+QUESTION = "galay-http 的路由怎么注册？"
+
+
+class _FakeVectorStoreReady:
+    is_ready = True
+
+
+def _docs() -> List[Tuple[Document, float]]:
+    doc = Document(
+        page_content="galay-http 使用 HttpRouter 注册路由，HttpServer 启动服务。" * 8,
+        metadata={"project": "galay-http", "source": "galay-http/docs/路由.md", "file_path": "docs/路由.md"},
+    )
+    return [(doc, 0.2)]
+
+
+async def _stream(session_id: str, disconnect_after_preview: bool) -> Dict[str, Any]:
+    """以原始 ASGI 调用流式接口；可在收到首个预览事件后模拟客户端断开"""
+    body = json.dumps({"message": QUESTION, "session_id": session_id, "use_memory": True}).encode("utf-8")
+    scope = {
+        "type": "http",
+        # 2.4 起 Starlette 不再自行监听断开，只能靠接口自己发现
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/chat/stream",
+        "raw_path": b"/api/chat/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"ai.test"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("ai.test", 80),
+    }
+    disconnected = asyncio.Event()
+    body_sent = False
+    events: List[dict] = []
+    result: Dict[str, Any] = {"events": events, "disconnected_at": None}
+
+    async def receive() -> dict:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message["type"] != "http.response.body":
+            return
+        for line in message.get("body", b"").decode("utf-8").splitlines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            events.append(event)
+            if disconnect_after_preview and (event.get("partial") or "content" in event) and not disconnected.is_set():
+                result["disconnected_at"] = time.perf_counter()
+                disconnected.set()
+
+    await app_module.app(scope, receive, send)
+    result["returned_at"] = time.perf_counter()
+    return result
+
+
+async def _run(service: ChatService, provider: MockOpenAIProvider, failures: List[str]) -> None:
+    # 先完整跑一轮，让已完成流的平均分片数可用于估算节省的 token
+    completed = await _stream("verify-complete", disconnect_after_preview=False)
+    if not any(event.get("done") for event in completed["events"]):
+        failures.append("baseline stream did not complete")
+
+    result = await _stream("verify-disconnect", disconnect_after_preview=True)
+    if result["disconnected_at"] is None:
+        failures.append("no preview event arrived before the disconnect")
+        return
+    returned_after_ms = (result["returned_at"] - result["disconnected_at"]) * 1000
+    # 桩服务要在连接关闭后再写一两个分片才会收到 BrokenPipe
+    for _ in range(int(3 * CHUNK_INTERVAL_MS / 100)):
+        if provider.aborted_streams:
+            break
+        await asyncio.sleep(0.1)
+    counters = metrics.snapshot()["counters"]
+    history = service._sessions.get_history("verify-disconnect")
+    print(
+        f"[verify_stream_disconnect] returned {returned_after_ms:.0f}ms after disconnect "
+        f"aborted_upstream={provider.aborted_streams} cancelled={counters.get('chat_stream.cancelled', 0):.0f} "
+        f"saved_tokens={counters.get('chat_stream.cancelled_tokens_saved_estimate', 0):.0f} history={len(history)}"
+    )
+    if returned_after_ms > CHUNK_INTERVAL_MS / 2:
+        failures.append(f"endpoint kept running {returned_after_ms:.0f}ms after the client disconnected")
+    if any(event.get("done") for event in result["events"]):
+        failures.append("disconnected stream still ran to completion")
+    if provider.aborted_streams != 1:
+        failures.append(f"upstream stream was not closed (aborted_streams={provider.aborted_streams})")
+    if counters.get("chat_stream.cancelled") != 1 or counters.get("chat_stream.cancelled.memory") != 1:
+        failures.append("chat_stream.cancelled / chat_stream.cancelled.memory not incremented once")
+    if not counters.get("chat_stream.cancelled_tokens_received"):
+        failures.append("chat_stream.cancelled_tokens_received not recorded")
+    if not counters.get("chat_stream.cancelled_tokens_saved_estimate"):
+        failures.append("chat_stream.cancelled_tokens_saved_estimate not incremented")
+    if history:
+        failures.append(f"partial turn written to session history: {history}")
+    if not service._sessions.get_history("verify-complete"):
+        failures.append("completed stream did not write its turn to session history")
+
+
+def main() -> int:
+    metrics.reset()
+    failures: List[str] = []
+    provider = MockOpenAIProvider(base_ms=20.0, chunk_interval_ms=CHUNK_INTERVAL_MS).start()
+    provider.stream_pieces = list(PIECES)
+    settings.OPENAI_API_BASE = provider.base_url
+    try:
+        service = ChatService(vector_store=None)
+        service._retrieve_for_session = lambda *args, **kwargs: _docs()  # type: ignore[method-assign]
+        app_module._vector_store = _FakeVectorStoreReady()  # type: ignore[assignment]
+        app_module._chat_service = service  # type: ignore[assignment]
+        asyncio.run(_run(service, provider, failures))
+    finally:
+        provider.stop()
+
+    if failures:
+        print("[verify_stream_disconnect] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_stream_disconnect] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
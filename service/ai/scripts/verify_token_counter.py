@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Check that token counting never waits for the tiktoken encoding to load.
+
+Replaces the tiktoken loaders with a slow fake (as if the BPE file had to be
+downloaded) and checks that:
+1) The first count_tokens call returns the estimate immediately and starts a
+   single background load.
+2) Once the load finishes, counts come from the encoding; estimates made
+   during the load are not served from the cache afterwards.
+3) Exact counts are cached per (encoding, text digest): repeated texts are
+   encoded once, the cache holds no text, and stays within its size bound.
+4) A failing load (offline, nothing cached) keeps the estimate without
+   blocking or raising.
+No network access needed.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+AI_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(AI_ROOT))
+
+import tiktoken  # noqa: E402
+
+from src.core import token_counter  # noqa: E402
+
+LOAD_SECONDS = 1.0
+TEXT = "galay-http 的路由怎么注册？HttpRouter 负责注册路由与处理函数。"
+
+
+class _FakeEncoding:
+    name = "fake"
+    calls = 0
+
+    def encode(self, text: str, disallowed_special=()) -> List[int]:
+        _FakeEncoding.calls += 1
+        return [0] * 1000
+
+
+def _reset() -> None:
+    token_counter._encoding = None
+    token_counter._encoding_warm_started = False
+    token_counter._count_cache.clear()
+
+
+def _check_cache(failures: List[str]) -> None:
+    history = "galay-redis 的 RedisClient 支持 pipeline。" * 2000
+    _FakeEncoding.calls = 0
+    for _ in range(5):
+        token_counter.count_tokens(history)
+    keys = list(token_counter._count_cache)
+    largest_key = max(len(name) + len(digest) for name, digest in keys)
+    print(f"[verify_token_counter] cache: encodes={_FakeEncoding.calls} entries={len(keys)} key_bytes<={largest_key}")
+    if _FakeEncoding.calls != 1:
+        failures.append(f"repeated text was encoded {_FakeEncoding.calls} times instead of once")
+    if any(history in key or TEXT in key for key in keys) or largest_key > 64:
+        failures.append("count cache keys hold the counted text instead of a digest")
+
+    for index in range(token_counter._COUNT_CACHE_SIZE + 10):
+        token_counter.count_tokens(f"turn {index}")
+    if len(token_counter._count_cache) > token_counter._COUNT_CACHE_SIZE:
+        failures.append(f"count cache grew past its bound: {len(token_counter._count_cache)}")
+
+
+def main() -> int:
+    failures: List[str] = []
+    loads: List[str] = []
+
+    def _slow_loader(name: str) -> _FakeEncoding:
+        loads.append(threading.current_thread().name)
+        time.sleep(LOAD_SECONDS)
+        return _FakeEncoding()
+
+    tiktoken.encoding_for_model = _slow_loader  # type: ignore[assignment]
+    tiktoken.get_encoding = _slow_loader  # type: ignore[assignment]
+    _reset()
+
+    started = time.perf_counter()
+    first = token_counter.count_tokens(TEXT)
+    again = token_counter.count_tokens(TEXT)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    estimate = token_counter._estimate_tokens(TEXT)
+    print(f"[verify_token_counter] loading: count={first} estimate={estimate} took={elapsed_ms:.1f}ms")
+    if elapsed_ms > LOAD_SECONDS * 1000 / 4:
+        failures.append(f"count_tokens waited {elapsed_ms:.0f}ms for the encoding to load")
+    if first != estimate or again != estimate:
+        failures.append("count_tokens did not fall back to the estimate while the encoding loads")
+    if token_counter.warm_encoding() is not None:
+        failures.append("warm_encoding started a second load")
+
+    deadline = time.monotonic() + LOAD_SECONDS * 5
+    while token_counter._encoding is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    exact = token_counter.count_tokens(TEXT)
+    print(f"[verify_token_counter] loaded: count={exact} loads={loads}")
+    if exact != 1000:
+        failures.append(f"count_tokens still returns {exact} after the encoding loaded (estimate was cached?)")
+    if len(loads) != 1 or loads[0] == threading.main_thread().name:
+        failures.append(f"encoding was not loaded exactly once off the calling thread: {loads}")
+
+    _check_cache(failures)
+
+    def _offline_loader(name: str) -> _FakeEncoding:
+        raise OSError("offline")
+
+    tiktoken.encoding_for_model = _offline_loader  # type: ignore[assignment]
+    tiktoken.get_encoding = _offline_loader  # type: ignore[assignment]
+    _reset()
+    thread = token_counter.warm_encoding()
+    if thread is not None:
+        thread.join(timeout=5)
+    offline = token_counter.count_tokens(TEXT)
+    print(f"[verify_token_counter] offline: count={offline}")
+    if offline != estimate:
+        failures.append("offline load failure did not keep the estimate")
+
+    if failures:
+        print("[verify_token_counter] FAIL")
+        for row in failures:
+            print(f"- {row}")
+        return 1
+
+    print("[verify_token_counter] PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
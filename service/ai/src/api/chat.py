@@ -1,46 +1,103 @@
 import json
 import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict
 
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from starlette.concurrency import run_in_threadpool
-
+from src.api.middleware import enforce_rate_limit
+from src.core.bulkhead import BULKHEAD_CHAT, get_bulkhead
+from src.core.deadline import Deadline
 from src.models.request import ChatRequest
 from src.models.response import ChatResponse
+from src.services.chat_service import STREAM_QUEUE_MAXSIZE
+from src.services.retrieval_profiles import get_retrieval_profile
 from src.utils.logger import get_logger
+from src.utils.metrics import metrics
 
 logger = get_logger(__name__)
 
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
+
+# /api/chat 与 /api/chat/stream 各用一个令牌桶，两个接口分别计数
+RATE_LIMIT_SCOPE = "chat"
+STREAM_RATE_LIMIT_SCOPE = "chat_stream"
 
 CHAT_TIMEOUT_SECONDS = 120
 STREAM_QUERY_TIMEOUT_SECONDS = 120
 STREAM_HEARTBEAT_SECONDS = 10
 STREAM_MEMORY_TIMEOUT_SECONDS = 180
 
+# 生产任务正常结束的哨兵
+_STREAM_END = object()
+
+
+async def _produce_stream_events(
+    stream_iter: AsyncGenerator[dict, None], queue: asyncio.Queue, stats: Dict[str, float]
+) -> None:
+    """把服务层事件流写入有界队列；队列满时阻塞上游读取（背压）。"""
+    try:
+        async with aclosing(stream_iter) as events:
+            async for data in events:
+                if queue.full():
+                    blocked_at = time.perf_counter()
+                    await queue.put(data)
+                    stats["blocked_puts"] += 1
+                    stats["blocked_ms"] += (time.perf_counter() - blocked_at) * 1000
+                else:
+                    queue.put_nowait(data)
+                stats["max_depth"] = max(stats["max_depth"], queue.qsize())
+    except Exception as e:
+        logger.error(f"Chat stream producer error: {e}")
+        await queue.put({"error": str(e)})
+    await queue.put(_STREAM_END)
+
+
+async def _watch_disconnect(request: Request) -> None:
+    """收到 http.disconnect 时返回；与队列读取并发等待，断开不必等到下一个事件或心跳。
+
+    请求体已被解析，之后 receive 只会收到断开消息；不用 is_disconnected 轮询，
+    它的立即取消读取在 BaseHTTPMiddleware 之后会吞掉断开消息。
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def _record_stream_backpressure(stats: Dict[str, float]) -> None:
+    metrics.observe("chat_stream.queue_max_depth", stats["max_depth"])
+    metrics.observe("chat_stream.producer_blocked_ms", stats["blocked_ms"])
+    if stats["blocked_puts"]:
+        metrics.incr("chat_stream.backpressure_streams")
+        metrics.incr("chat_stream.producer_blocked_puts", stats["blocked_puts"])
+
 
 @router.post("/chat", response_model=ChatResponse)
-@limiter.limit("30/minute")
 async def chat(payload: ChatRequest, request: Request):
     """聊天接口"""
     from src.app import get_chat_service
 
     if not payload.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
+    await enforce_rate_limit(request, RATE_LIMIT_SCOPE, payload.session_id)
+    profile = get_retrieval_profile(payload.retrieval_profile).name
 
     svc = get_chat_service()
+    # 截止时间从请求到达开始计，隔舱排队时间也算在内；各阶段据此跳过可选步骤、压缩上游超时
+    deadline = Deadline(CHAT_TIMEOUT_SECONDS)
+    bulkhead = get_bulkhead(BULKHEAD_CHAT)
+    allow_extractive = bool(payload.allow_extractive)
     try:
         if payload.use_memory:
             result = await asyncio.wait_for(
-                run_in_threadpool(svc.chat, payload.message, payload.session_id),
+                bulkhead.run(svc.chat, payload.message, payload.session_id, allow_extractive, deadline, profile),
                 timeout=CHAT_TIMEOUT_SECONDS,
             )
         else:
             result = await asyncio.wait_for(
-                run_in_threadpool(svc.query, payload.message),
+                bulkhead.run(svc.query, payload.message, allow_extractive, deadline, profile),
                 timeout=CHAT_TIMEOUT_SECONDS,
             )
     except TimeoutError:
@@ -50,72 +107,99 @@ async def chat(payload: ChatRequest, request: Request):
 
 
 @router.post("/chat/stream")
-@limiter.limit("30/minute")
 async def chat_stream(payload: ChatRequest, request: Request):
     """流式聊天接口（SSE）"""
     from src.app import get_chat_service
 
     if not payload.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
+    await enforce_rate_limit(request, STREAM_RATE_LIMIT_SCOPE, payload.session_id)
+    profile = get_retrieval_profile(payload.retrieval_profile).name
 
     svc = get_chat_service()
+    stream_timeout = STREAM_MEMORY_TIMEOUT_SECONDS if payload.use_memory else STREAM_QUERY_TIMEOUT_SECONDS
+    deadline = Deadline(stream_timeout)
+    # 在返回 200 流之前占用 chat 隔舱名额，排满时直接 503；名额随流结束归还
+    lease = await get_bulkhead(BULKHEAD_CHAT).acquire()
+
     def _event(data: dict) -> str:
         return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
     async def event_generator():
+        stream_iter = None
+        producer: asyncio.Task | None = None
+        watcher: asyncio.Task | None = None
+        pending_get: asyncio.Task | None = None
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_MAXSIZE)
+        stats = {"max_depth": 0, "blocked_puts": 0, "blocked_ms": 0.0}
         try:
             # 首包尽快返回，降低代理/前端连接阶段超时概率。
             yield _event({"ping": True, "stage": "accepted"})
 
+            allow_extractive = bool(payload.allow_extractive)
             if payload.use_memory:
-                stream_iter = svc.chat_stream(payload.message, payload.session_id).__aiter__()
-                start_at = asyncio.get_running_loop().time()
-                while True:
-                    if asyncio.get_running_loop().time() - start_at > STREAM_MEMORY_TIMEOUT_SECONDS:
-                        yield _event({"error": "LLM stream timed out"})
-                        yield _event({"done": True, "sources": []})
-                        break
-
-                    try:
-                        data = await asyncio.wait_for(
-                            stream_iter.__anext__(),
-                            timeout=STREAM_HEARTBEAT_SECONDS,
-                        )
-                    except StopAsyncIteration:
-                        break
-                    except TimeoutError:
-                        # 心跳包，避免长思考场景下前端/代理误判超时。
-                        yield _event({"ping": True})
+                stream_iter = svc.chat_stream(
+                    payload.message, payload.session_id, allow_extractive, deadline, profile
+                )
+            else:
+                stream_iter = svc.query_stream(payload.message, allow_extractive, deadline, profile)
+
+            # LLM 流在独立任务中生产，心跳超时只等待队列，不会打断正在进行的 astream 读取。
+            producer = asyncio.create_task(_produce_stream_events(stream_iter, queue, stats))
+            watcher = asyncio.create_task(_watch_disconnect(request))
+
+            while True:
+                if deadline.expired:
+                    yield _event({"error": "LLM stream timed out"})
+                    yield _event({"done": True, "sources": []})
+                    break
+
+                # 队列读取与断开检测赛跑；心跳超时时保留未完成的读取，下一轮继续等待。
+                if pending_get is None:
+                    pending_get = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {pending_get, watcher},
+                    timeout=min(STREAM_HEARTBEAT_SECONDS, deadline.remaining()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if watcher in done:
+                    # 客户端已断开：finally 中取消生产任务，进而关闭上游 LLM 流。
+                    logger.info(f"Chat stream client disconnected: session={payload.session_id}")
+                    break
+                if pending_get not in done:
+                    if deadline.expired:
                         continue
-
-                    yield _event(data)
-                    if data.get("done") or data.get("error"):
-                        break
-                return
-
-            result = await asyncio.wait_for(
-                run_in_threadpool(svc.query, payload.message),
-                timeout=STREAM_QUERY_TIMEOUT_SECONDS,
-            )
-            response_text = result.get("response", "")
-            sources = result.get("sources", [])
-            blocks = result.get("blocks", [])
-            if response_text:
-                if blocks:
-                    yield _event({"replace": response_text, "blocks": blocks})
-                else:
-                    yield _event({"content": response_text})
-            yield _event({"done": True, "sources": sources, "blocks": blocks})
-        except TimeoutError:
-            yield _event({"error": "LLM request timed out"})
-            yield _event({"done": True, "sources": []})
+                    # 心跳包，避免长思考场景下前端/代理误判超时。
+                    yield _event({"ping": True})
+                    continue
+
+                data = pending_get.result()
+                pending_get = None
+                if data is _STREAM_END:
+                    break
+                yield _event(data)
+                if data.get("done") or data.get("error"):
+                    break
         except Exception as e:
             logger.error(f"Chat stream error: {e}")
             yield _event({"error": str(e)})
             yield _event({"done": True, "sources": []})
+        finally:
+            waiters = [task for task in (pending_get, watcher) if task is not None]
+            for task in waiters:
+                task.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            if producer is not None:
+                if not producer.done():
+                    producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+                _record_stream_backpressure(stats)
+            elif stream_iter is not None:
+                await stream_iter.aclose()
+            lease.release()
 
     return StreamingResponse(
-        event_generator(),
+        lease.bind(event_generator()),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
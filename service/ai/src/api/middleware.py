@@ -1,24 +1,30 @@
+import asyncio
 import time
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
 
-from src.utils.exceptions import AIServiceError
+from src.config import settings
+from src.services.rate_limiter import RateLimiter, build_rate_limiter, parse_trusted_proxies, resolve_client_ip
+from src.utils.exceptions import AIServiceError, OverloadedError, RateLimitedError
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-limiter = Limiter(key_func=get_remote_address)
-
 
 async def error_handler(request: Request, call_next):
     """全局异常处理中间件"""
     try:
         return await call_next(request)
+    except (OverloadedError, RateLimitedError) as e:
+        # 隔舱排满/客户端超限属于正常的过载保护，不按错误记录
+        logger.warning(f"Request rejected ({e.status_code}): {request.url.path} {e.message}")
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"success": False, "error": e.message},
+            headers={"Retry-After": str(e.retry_after_seconds)},
+        )
     except AIServiceError as e:
         logger.error(f"Service error: {e.message}")
         return JSONResponse(
@@ -54,6 +60,51 @@ def setup_cors(app: FastAPI) -> None:
 
 
 def setup_rate_limit(app: FastAPI) -> None:
-    """配置请求限流"""
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    """配置请求限流（令牌桶）；配置错误在启动时暴露"""
+    limiter = build_rate_limiter() if settings.RATE_LIMIT_ENABLED else None
+    app.state.rate_limiter = limiter
+    # 按会话限流时每个 IP 另有一个更宽的桶（与会话桶共用存储），轮换 session_id 绕不过去
+    app.state.ip_rate_limiter = (
+        RateLimiter(limiter.backend, settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST)
+        if limiter is not None
+        else None
+    )
+    app.state.trusted_proxies = parse_trusted_proxies(settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def _client_ip_key(request: Request) -> str:
+    peer = request.client.host if request.client else "unknown"
+    ip = resolve_client_ip(
+        peer,
+        request.headers.get("x-forwarded-for"),
+        request.headers.get("x-real-ip"),
+        request.app.state.trusted_proxies,
+    )
+    return f"ip:{ip}"
+
+
+def client_key(request: Request, session_id: str | None = None) -> str:
+    """限流键：RATE_LIMIT_KEY=session 且带了非默认 session_id 时按会话，否则按（代理后的）客户端 IP"""
+    if settings.RATE_LIMIT_KEY.strip().lower() == "session" and session_id and session_id != "default":
+        return f"session:{session_id}"
+    return _client_ip_key(request)
+
+
+async def enforce_rate_limit(request: Request, scope: str, session_id: str | None = None) -> None:
+    """超限时抛 RateLimitedError（429 + Retry-After）
+
+    按会话限流时先查同一客户端 IP 的桶，再查会话桶：IP 桶超限时不消耗会话令牌。
+    """
+    limiter = getattr(request.app.state, "rate_limiter", None)
+    if limiter is None:
+        return
+    key = client_key(request, session_id)
+    checks = [(limiter, scope, key)]
+    ip_limiter = getattr(request.app.state, "ip_rate_limiter", None)
+    if ip_limiter is not None and key.startswith("session:"):
+        checks.insert(0, (ip_limiter, f"{scope}.ip", _client_ip_key(request)))
+    for checker, check_scope, check_key in checks:
+        if checker.backend.blocking:
+            await asyncio.to_thread(checker.check, check_scope, check_key)
+        else:
+            checker.check(check_scope, check_key)
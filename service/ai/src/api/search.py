@@ -1,7 +1,9 @@
 from fastapi import APIRouter
 
+from src.core.bulkhead import BULKHEAD_SEARCH, get_bulkhead
 from src.models.request import SearchRequest
 from src.models.response import SearchResponse, SearchResult
+from src.services.retrieval_profiles import get_retrieval_profile
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -12,12 +14,15 @@ router = APIRouter()
 @router.post("/search", response_model=SearchResponse)
 async def search(request: SearchRequest):
     """文档搜索接口"""
-    from src.app import get_vector_store
-    from src.services.rag_service import RAGService
-
-    vs = get_vector_store()
-    rag = RAGService(vs)
-    results = rag.retrieve_with_score(request.query, k=request.k)
+    from src.app import get_rag_service
+
+    # 复用常驻 RAGService：不再按请求新建 LLM 客户端，关键词语料缓存也跨请求生效。
+    rag = get_rag_service()
+    profile = get_retrieval_profile(request.retrieval_profile)
+    # 检索在 search 隔舱的线程池中执行，不与 LLM 对话争用线程
+    results = await get_bulkhead(BULKHEAD_SEARCH).run(
+        rag.retrieve_with_score, request.query, request.k, None, profile.name
+    )
 
     items = [
         SearchResult(
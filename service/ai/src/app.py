@@ -5,11 +5,16 @@ from fastapi import FastAPI
 from src.api.middleware import error_handler, request_logger, setup_cors, setup_rate_limit
 from src.api.router import router as api_router
 from src.config import settings
+from src.core.bulkhead import BULKHEAD_ADMIN, bulkhead_stats, get_bulkhead, shutdown_bulkheads
+from src.core.http_clients import aclose_http_clients, http_pool_stats
+from src.core.token_counter import warm_encoding
 from src.core.vector_store import VectorStoreManager
 from src.services.chat_service import ChatService
 from src.services.index_state_watcher import DbIndexStateWatcher
+from src.services.rag_service import RAGService
 from src.utils.exceptions import ServiceUnavailableError
 from src.utils.logger import get_logger, setup_logging
+from src.utils.metrics import metrics
 
 logger = get_logger(__name__)
 
@@ -103,6 +108,10 @@ def get_chat_service() -> ChatService:
     return _chat_service
 
 
+def get_rag_service() -> RAGService:
+    return get_chat_service().rag_service
+
+
 # ------------------------------------------------------------------
 # 生命周期
 # ------------------------------------------------------------------
@@ -125,6 +134,8 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down Galay AI Service...")
         return
 
+    # tiktoken 编码可能要联网下载，放到后台加载，首个对话请求不等它
+    warm_encoding()
     try:
         _vector_store = VectorStoreManager()
         try:
@@ -167,6 +178,8 @@ async def lifespan(app: FastAPI):
     if _index_state_watcher is not None:
         _index_state_watcher.stop()
         _index_state_watcher = None
+    await aclose_http_clients()
+    shutdown_bulkheads()
     logger.info("Shutting down Galay AI Service...")
 
 
@@ -190,28 +203,37 @@ def create_app() -> FastAPI:
 
     app.include_router(api_router)
 
+    # 健康检查与指标走 admin 隔舱，聊天洪峰时仍可快速响应
     @app.get("/", tags=["Health"])
     async def root():
-        return {
-            "status": "ok" if _startup_error is None else "degraded",
-            "service": "Galay AI Service",
-            "version": "2.1.0",
-            "startup_error": _startup_error,
-        }
+        async with get_bulkhead(BULKHEAD_ADMIN).slot():
+            return {
+                "status": "ok" if _startup_error is None else "degraded",
+                "service": "Galay AI Service",
+                "version": "2.1.0",
+                "startup_error": _startup_error,
+            }
 
     @app.get("/health", tags=["Health"])
     async def health():
-        return {
-            "status": "ok" if _startup_error is None else "degraded",
-            "startup_error": _startup_error,
-            "services": {
-                "vector_store_initialized": _vector_store is not None and _vector_store.is_ready,
-                "chat_service_initialized": _chat_service is not None,
-                "index_state_watch_enabled": _index_state_watcher is not None,
-                "index_state_watch_running": _index_state_watcher.is_running if _index_state_watcher else False,
-            },
-            "index_version": _index_version,
-        }
+        async with get_bulkhead(BULKHEAD_ADMIN).slot():
+            return {
+                "status": "ok" if _startup_error is None else "degraded",
+                "startup_error": _startup_error,
+                "services": {
+                    "vector_store_initialized": _vector_store is not None and _vector_store.is_ready,
+                    "chat_service_initialized": _chat_service is not None,
+                    "index_state_watch_enabled": _index_state_watcher is not None,
+                    "index_state_watch_running": _index_state_watcher.is_running if _index_state_watcher else False,
+                },
+                "index_version": _index_version,
+                "llm_upstreams": _chat_service.llm_upstream_health() if _chat_service is not None else {},
+            }
+
+    @app.get("/metrics", tags=["Health"])
+    async def metrics_snapshot():
+        async with get_bulkhead(BULKHEAD_ADMIN).slot():
+            return {**metrics.snapshot(), "http_pools": http_pool_stats(), "bulkheads": bulkhead_stats()}
 
     return app
 
@@ -12,6 +12,22 @@ class Settings(BaseSettings):
     OPENAI_API_BASE: str = "https://api.openai.com/v1"
     MODEL_NAME: str = "gpt-4-turbo-preview"
     TEMPERATURE: float = 0.7
+    # 多上游：JSON 数组 [{"name","base_url","api_key","model","weight","fast_model"}]，为空时只用上面的单一上游
+    LLM_UPSTREAMS: str = ""
+    LLM_MAX_RETRIES: int = 2
+    LLM_FIRST_TOKEN_TIMEOUT_SECONDS: float = 20.0
+    LLM_EWMA_ALPHA: float = 0.2
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0
+    # 流式请求携带 stream_options.include_usage；上游不支持时关闭
+    LLM_STREAM_USAGE: bool = True
+    # Prompt 布局：prefix_cache（system + 历史为稳定前缀，上下文放最后一条用户消息）| legacy
+    PROMPT_LAYOUT: str = "prefix_cache"
+
+    # Model routing（没有上游声明快模型时全部走 MODEL_NAME；自带 model 的上游要在 LLM_UPSTREAMS 里写 fast_model）
+    FAST_MODEL_NAME: str = ""
+    MODEL_ROUTER_MAX_FAST_CHARS: int = 40
+    MODEL_ROUTER_MIN_FAST_CONFIDENCE: float = 0.6
 
     # Embedding
     EMBEDDING_MODEL: str = "text-embedding-3-small"
@@ -19,6 +35,35 @@ class Settings(BaseSettings):
     EMBEDDING_REQUEST_TIMEOUT: int = 120
     EMBEDDING_MAX_RETRIES: int = 6
 
+    # Upstream HTTP pool（LLM / Embedding 按上游 origin 共享）
+    HTTP_POOL_MAX_CONNECTIONS: int = 64
+    HTTP_POOL_MAX_KEEPALIVE: int = 16
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_READ_TIMEOUT_SECONDS: float = 120.0
+    HTTP2_ENABLED: bool = True
+
+    # Bulkheads（chat / search / admin 各自的并发与排队上限，排满时 503 + Retry-After）
+    BULKHEAD_CHAT_CONCURRENCY: int = 16
+    BULKHEAD_CHAT_QUEUE: int = 32
+    BULKHEAD_SEARCH_CONCURRENCY: int = 8
+    BULKHEAD_SEARCH_QUEUE: int = 32
+    BULKHEAD_ADMIN_CONCURRENCY: int = 4
+    BULKHEAD_ADMIN_QUEUE: int = 16
+    BULKHEAD_RETRY_AFTER_SECONDS: int = 2
+
+    # Request deadline（剩余预算低于该值时跳过宽候选召回、关键词兜底等可选检索阶段）
+    DEADLINE_OPTIONAL_STAGE_MIN_SECONDS: float = 30.0
+
+    # Request hedging（默认关闭；延迟阈值取最近延迟的分位数，限制在 MIN/MAX 之间）
+    HEDGE_EMBEDDINGS_ENABLED: bool = False
+    HEDGE_LLM_STREAM_ENABLED: bool = False
+    HEDGE_DELAY_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY_MS: int = 50
+    HEDGE_MAX_DELAY_MS: int = 3000
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_MAX_RATE: float = 0.05
+
     # Vector Store
     VECTOR_STORE_PATH: str = "./vector_store"
     CHUNK_SIZE: int = 1000
@@ -30,6 +75,13 @@ class Settings(BaseSettings):
     ENABLE_CODE_INDEXING: bool = True
     CODE_FILE_EXTENSIONS: str = ".h,.hpp,.hh,.hxx,.c,.cc,.cpp,.cxx,.ixx,.tpp"
     MAX_INDEX_FILE_SIZE_KB: int = 512
+    # 近重复 chunk 去重（MinHash + LSH）：估计 Jaccard ≥ THRESHOLD 的只保留一份，其余来源记入 alternate_sources
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.9
+    # NUM_PERM 须为 LSH_BANDS 的整数倍
+    DEDUP_NUM_PERM: int = 64
+    DEDUP_LSH_BANDS: int = 16
+    DEDUP_SHINGLE_SIZE: int = 5
 
     # Docs (recommended)
     GALAY_DOCS_ROOT_PATH: str = ""
@@ -54,6 +106,60 @@ class Settings(BaseSettings):
     INDEX_STATE_POLL_INTERVAL_SECONDS: float = 2.0
     INDEX_STATE_REQUEST_TIMEOUT_SECONDS: float = 3.0
 
+    # Session store（memory | sqlite | redis）
+    SESSION_STORE_BACKEND: str = "memory"
+    SESSION_STORE_PATH: str = "./session_store/sessions.db"
+    SESSION_STORE_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    SESSION_TTL_SECONDS: int = 86400
+    SESSION_MAX_SESSIONS: int = 100
+    SESSION_MAX_HISTORY_ROUNDS: int = 20
+
+    # Rate limiting（令牌桶：平均 PER_MINUTE 次/分钟，允许突发 BURST 次；backend: memory | sqlite | redis）
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: float = 30.0
+    RATE_LIMIT_BURST: int = 10
+    # ip | session（session_id 缺省或为 default 时退回按 IP）
+    RATE_LIMIT_KEY: str = "ip"
+    # RATE_LIMIT_KEY=session 时每个客户端 IP 另有一个更宽的桶，轮换 session_id 无法绕过
+    RATE_LIMIT_IP_PER_MINUTE: float = 120.0
+    RATE_LIMIT_IP_BURST: int = 40
+    # 受信代理 IP/CIDR（逗号分隔）；只采信来自这些地址的 X-Forwarded-For / X-Real-IP
+    RATE_LIMIT_TRUSTED_PROXIES: str = ""
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_SQLITE_PATH: str = "./session_store/rate_limit.db"
+    RATE_LIMIT_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+
+    # Retrieval profiles（内置 fast | balanced | thorough；RETRIEVAL_PROFILES 为 JSON 对象，按名称覆盖或新增档位）
+    RETRIEVAL_DEFAULT_PROFILE: str = "balanced"
+    RETRIEVAL_PROFILES: str = ""
+    # 关键词兜底与向量召回（含 query embedding）并发执行
+    RETRIEVAL_PARALLEL_STAGES: bool = True
+    RETRIEVAL_LEXICAL_WORKERS: int = 4
+    # 关键词兜底语料按页从向量库读取（collection.get 的 limit）
+    RETRIEVAL_LEXICAL_PAGE_SIZE: int = 2000
+    # 会话追问复用上一轮检索片段，只用 REUSE_PROFILE 做一次窄召回后合并
+    RETRIEVAL_REUSE_ENABLED: bool = True
+    RETRIEVAL_REUSE_PROFILE: str = "fast"
+    RETRIEVAL_REUSE_MAX_SESSIONS: int = 1000
+    RETRIEVAL_REUSE_TTL_SECONDS: float = 1800.0
+
+    # Chat history window
+    HISTORY_TOKEN_BUDGET: int = 3000
+    HISTORY_SUMMARY_ENABLED: bool = True
+    HISTORY_SUMMARY_MAX_CHARS: int = 600
+
+    # Extractive fast path（需请求同时携带 allow_extractive=true）
+    EXTRACTIVE_ANSWER_ENABLED: bool = False
+    EXTRACTIVE_ANSWER_MIN_CONFIDENCE: float = 0.8
+    EXTRACTIVE_ANSWER_MAX_CHUNKS: int = 2
+    EXTRACTIVE_ANSWER_MAX_CHARS: int = 1500
+
+    # Answer cache（无记忆问答）
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    ANSWER_CACHE_SEMANTIC_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
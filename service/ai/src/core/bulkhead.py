@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Tuple, TypeVar
+
+from src.config import settings
+from src.utils.exceptions import OverloadedError
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+BULKHEAD_CHAT = "chat"
+BULKHEAD_SEARCH = "search"
+BULKHEAD_ADMIN = "admin"
+
+
+class Bulkhead:
+    """隔舱：独立的并发上限 + 有界等待队列 + 专用线程池
+
+    并发已满时最多排队 max_queue 个请求，再多直接抛 OverloadedError（503 + Retry-After），
+    避免某类慢请求占满共享线程池、拖垮其它接口。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, retry_after_seconds: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.retry_after_seconds = max(1, retry_after_seconds)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"bulkhead-{name}")
+
+    async def acquire(self) -> "BulkheadLease":
+        """占用一个并发名额；队列已满时立即拒绝"""
+        loop = asyncio.get_running_loop()
+        waiter: asyncio.Future | None = None
+        rejected = False
+        with self._lock:
+            if self._active < self.max_concurrency:
+                self._active += 1
+            elif len(self._waiters) < self.max_queue:
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            else:
+                rejected = True
+            queued = len(self._waiters)
+        if rejected:
+            metrics.incr(f"bulkhead.{self.name}.rejected")
+            raise OverloadedError(f"{self.name} is overloaded, retry later", self.retry_after_seconds)
+
+        started = time.perf_counter()
+        if waiter is not None:
+            metrics.set_gauge(f"bulkhead.{self.name}.queued", queued)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        metrics.observe(f"bulkhead.{self.name}.queue_wait_ms", (time.perf_counter() - started) * 1000)
+        self._publish()
+        return BulkheadLease(self)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        lease = await self.acquire()
+        try:
+            yield
+        finally:
+            lease.release()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """在隔舱专用线程池中执行同步函数；调用方取消时名额在线程真正结束后才归还"""
+        lease = await self.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            lease.release()
+            raise
+        future.add_done_callback(lambda _: lease.release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        with self._lock:
+            # 名额直接交给下一个等待者；等待者已取消时继续往后交
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if waiter.done():
+                    continue
+                loop.call_soon_threadsafe(self._grant, waiter)
+                break
+            else:
+                self._active -= 1
+        self._publish()
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # 交付前等待者已取消，名额继续传递
+            self._release()
+        else:
+            waiter.set_result(None)
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        with self._lock:
+            try:
+                self._waiters.remove(next(item for item in self._waiters if item[1] is waiter))
+                return
+            except StopIteration:
+                pass
+        # 已出队：若名额已交付（结果已设置）则归还，否则由 _grant 负责传递
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+
+    def _publish(self) -> None:
+        with self._lock:
+            active, queued = self._active, len(self._waiters)
+        metrics.set_gauge(f"bulkhead.{self.name}.active", active)
+        metrics.set_gauge(f"bulkhead.{self.name}.queued", queued)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": len(self._waiters),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BulkheadLease:
+    """已占用的名额；release 幂等。流式响应从未开始迭代就被丢弃时，由 GC 兜底归还"""
+
+    def __init__(self, bulkhead: Bulkhead):
+        self._bulkhead = bulkhead
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._bulkhead._release()
+
+    def bind(self, owner: Any) -> Any:
+        weakref.finalize(owner, self.release)
+        return owner
+
+
+_lock = threading.Lock()
+_bulkheads: Dict[str, Bulkhead] = {}
+
+
+def _config(name: str) -> Tuple[int, int]:
+    if name == BULKHEAD_CHAT:
+        return settings.BULKHEAD_CHAT_CONCURRENCY, settings.BULKHEAD_CHAT_QUEUE
+    if name == BULKHEAD_SEARCH:
+        return settings.BULKHEAD_SEARCH_CONCURRENCY, settings.BULKHEAD_SEARCH_QUEUE
+    return settings.BULKHEAD_ADMIN_CONCURRENCY, settings.BULKHEAD_ADMIN_QUEUE
+
+
+def get_bulkhead(name: str) -> Bulkhead:
+    """按名称获取（首次使用时按配置创建）chat / search / admin 隔舱"""
+    with _lock:
+        bulkhead = _bulkheads.get(name)
+        if bulkhead is None:
+            concurrency, queue = _config(name)
+            bulkhead = _bulkheads[name] = Bulkhead(
+                name, concurrency, queue, settings.BULKHEAD_RETRY_AFTER_SECONDS
+            )
+            logger.info(f"Bulkhead {name}: concurrency={bulkhead.max_concurrency} queue={bulkhead.max_queue}")
+        return bulkhead
+
+
+def bulkhead_stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        bulkheads = list(_bulkheads.values())
+    return {bulkhead.name: bulkhead.stats() for bulkhead in bulkheads}
+
+
+def shutdown_bulkheads() -> None:
+    with _lock:
+        bulkheads = list(_bulkheads.values())
+        _bulkheads.clear()
+    for bulkhead in bulkheads:
+        bulkhead.shutdown()
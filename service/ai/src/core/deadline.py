@@ -0,0 +1,67 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from src.config import settings
+from src.utils.exceptions import DeadlineExceededError
+from src.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """请求级截止时间：在检索、embedding、LLM 各阶段间传递，预算不足时跳过可选阶段"""
+
+    __slots__ = ("_expires_at", "timeout_seconds")
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = float(timeout_seconds)
+        self._expires_at = time.monotonic() + self.timeout_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self._expires_at
+
+    def check(self, stage: str) -> None:
+        """已过截止时间时抛 DeadlineExceededError"""
+        if self.expired:
+            metrics.incr(f"deadline.exceeded.{stage}")
+            raise DeadlineExceededError(f"Request deadline exceeded before {stage}")
+
+    def allows(self, stage: str, min_seconds: Optional[float] = None) -> bool:
+        """可选阶段是否还有预算；不足时记一次跳过"""
+        needed = settings.DEADLINE_OPTIONAL_STAGE_MIN_SECONDS if min_seconds is None else min_seconds
+        if self.remaining() >= needed:
+            return True
+        metrics.incr(f"deadline.skipped.{stage}")
+        return False
+
+
+# Chroma 等第三方调用链不透传参数，embedding 通过上下文变量拿到当前请求的 deadline
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[None]:
+    if deadline is None:
+        yield
+        return
+    token = _current.set(deadline)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def call_with_deadline(deadline: Optional[Deadline], fn: Callable[..., T], *args: Any) -> T:
+    """在 deadline 作用域内执行同步函数（用于 asyncio.to_thread）"""
+    with deadline_scope(deadline):
+        return fn(*args)
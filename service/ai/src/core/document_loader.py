@@ -1,10 +1,12 @@
+import hashlib
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set
 
 from langchain_core.documents import Document
 
 from src.config import settings
 from src.core.document_cleaner import clean_document_content
+from src.core.near_dedup import NearDuplicateDetector
 from src.core.text_splitter import GalayCodeSplitter, GalayTextSplitter
 from src.utils.exceptions import DocumentLoadError
 from src.utils.logger import get_logger
@@ -16,6 +18,16 @@ MARKDOWN_SUFFIX = ".md"
 EXCLUDED_DIR_NAMES = {".claude", "todo"}
 
 
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def build_chunk_id(project: str, source: str, ordinal: int, chunk_hash: str) -> str:
+    """确定性 chunk id：project + source 路径哈希 + 文件内序号 + 内容哈希；同一份文档重建索引得到相同 id"""
+    source_hash = hashlib.sha1(source.replace("\\", "/").encode("utf-8")).hexdigest()[:12]
+    return f"{project}:{source_hash}:{ordinal}:{chunk_hash}"
+
+
 class GalayDocumentLoader:
     """Galay 文档加载器"""
 
@@ -23,6 +35,8 @@ class GalayDocumentLoader:
         self._markdown_splitter = GalayTextSplitter()
         self._code_splitter = GalayCodeSplitter()
         self._code_extensions = self._parse_extensions(settings.CODE_FILE_EXTENSIONS)
+        # 最近一次 load_all 的统计，供构建报告使用
+        self.last_stats: Dict[str, int] = {}
 
     def load_file(self, path: str, base_path: Optional[str] = None) -> List[Document]:
         """加载单个文件并分割"""
@@ -49,6 +63,11 @@ class GalayDocumentLoader:
         doc = Document(page_content=cleaned_content, metadata=metadata)
         splitter = self._markdown_splitter if file_type == "markdown" else self._code_splitter
         chunks = splitter.split([doc])
+        for ordinal, chunk in enumerate(chunks):
+            chunk_hash = content_hash(chunk.page_content)
+            chunk.metadata["chunk_index"] = ordinal
+            chunk.metadata["content_hash"] = chunk_hash
+            chunk.metadata["chunk_id"] = build_chunk_id(project, metadata["source"], ordinal, chunk_hash)
         logger.info(
             f"Loaded {len(chunks)} chunks from {metadata['source']} "
             f"(cleaned {len(content)} -> {len(cleaned_content)})"
@@ -80,6 +99,20 @@ class GalayDocumentLoader:
                 except DocumentLoadError as e:
                     logger.warning(str(e))
 
+        loaded = len(all_docs)
+        dropped = 0
+        if settings.DEDUP_ENABLED and all_docs:
+            result = NearDuplicateDetector().deduplicate(all_docs)
+            all_docs, dropped = result.documents, result.dropped
+            logger.info(f"Near-duplicate chunks dropped: {dropped} (collapsed into {result.groups} canonical chunks)")
+
+        self.last_stats = {
+            "markdown_files": markdown_files,
+            "code_files": code_files,
+            "chunks_loaded": loaded,
+            "near_duplicates_dropped": dropped,
+            "chunks_indexed": len(all_docs),
+        }
         logger.info(f"Indexed files: markdown={markdown_files}, code={code_files}")
         logger.info(f"Total loaded {len(all_docs)} document chunks")
         return all_docs
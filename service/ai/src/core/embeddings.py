@@ -1,14 +1,23 @@
+import threading
 import time
+from collections import OrderedDict
 from typing import List
 
 from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 
 from src.config import settings
+from src.core.deadline import current_deadline
+from src.core.hedging import embedding_hedge, hedged_call
+from src.core.http_clients import get_async_http_client, get_http_client
+from src.utils.exceptions import DeadlineExceededError
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 同一请求内答案缓存查询与检索会各 embed 一次问题，缓存后只请求一次
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
 
 class SafeEmbeddingAdapter(Embeddings):
     """Provider-safe wrapper for embedding batch failures."""
@@ -16,9 +25,35 @@ class SafeEmbeddingAdapter(Embeddings):
     def __init__(self, base: OpenAIEmbeddings, batch_size: int = 32):
         self._base = base
         self._batch_size = max(1, int(batch_size or 1))
+        self._query_cache: OrderedDict[str, List[float]] = OrderedDict()
+        self._query_cache_lock = threading.Lock()
 
     def embed_query(self, text: str) -> List[float]:
-        return self._base.embed_query(text)
+        with self._query_cache_lock:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                self._query_cache.move_to_end(text)
+                return cached
+        deadline = current_deadline()
+        kwargs = {}
+        if deadline is not None:
+            deadline.check("embedding")
+            # 单次请求超时不超过请求剩余预算
+            kwargs["timeout"] = max(0.1, deadline.remaining())
+        try:
+            if settings.HEDGE_EMBEDDINGS_ENABLED:
+                vector = hedged_call(embedding_hedge, lambda: self._base.embed_query(text, **kwargs))
+            else:
+                vector = self._base.embed_query(text, **kwargs)
+        except Exception as e:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceededError("Request deadline exceeded during query embedding") from e
+            raise
+        with self._query_cache_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vector
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         if not texts:
@@ -87,6 +122,8 @@ class EmbeddingManager:
                 max_retries=max(1, settings.EMBEDDING_MAX_RETRIES),
                 request_timeout=max(1, settings.EMBEDDING_REQUEST_TIMEOUT),
                 model_kwargs={"encoding_format": "float"},
+                http_client=get_http_client(settings.OPENAI_API_BASE),
+                http_async_client=get_async_http_client(settings.OPENAI_API_BASE),
             )
             self._embeddings = SafeEmbeddingAdapter(
                 base=base,
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, List, Optional, Tuple, TypeVar
+
+from src.config import settings
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+HEDGE_LATENCY_SAMPLES = 256
+# 对冲令牌上限：每个请求积累 HEDGE_MAX_RATE 个令牌，每次补发消耗 1 个
+HEDGE_TOKEN_CAP = 10.0
+# 每积累 N 个新样本重新计算一次延迟阈值
+_DELAY_RECOMPUTE_EVERY = 16
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+class HedgePolicy:
+    """对冲策略：按最近延迟的分位数决定何时补发请求，并限制补发比例"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=HEDGE_LATENCY_SAMPLES)
+        self._observed = 0
+        self._delay_ms = float(settings.HEDGE_MAX_DELAY_MS)
+        self._tokens = 1.0
+
+    def delay_seconds(self) -> float:
+        with self._lock:
+            return self._delay_ms / 1000.0
+
+    def observe(self, latency_ms: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self._observed += 1
+            if len(self._latencies) >= settings.HEDGE_MIN_SAMPLES and self._observed % _DELAY_RECOMPUTE_EVERY == 0:
+                ordered = sorted(self._latencies)
+                index = min(len(ordered) - 1, round(settings.HEDGE_DELAY_PERCENTILE / 100 * (len(ordered) - 1)))
+                self._delay_ms = min(
+                    float(settings.HEDGE_MAX_DELAY_MS),
+                    max(float(settings.HEDGE_MIN_DELAY_MS), ordered[index]),
+                )
+                metrics.set_gauge(f"hedge.{self.name}.delay_ms", round(self._delay_ms, 1))
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._tokens = min(HEDGE_TOKEN_CAP, self._tokens + settings.HEDGE_MAX_RATE)
+        metrics.incr(f"hedge.{self.name}.requests")
+
+    def try_acquire_hedge(self) -> bool:
+        """令牌不足（补发比例超过 HEDGE_MAX_RATE）时拒绝补发"""
+        with self._lock:
+            allowed = self._tokens >= 1.0
+            if allowed:
+                self._tokens -= 1.0
+        metrics.incr(f"hedge.{self.name}.{'fired' if allowed else 'suppressed'}")
+        return allowed
+
+    def record_win(self, hedged_won: bool) -> None:
+        if hedged_won:
+            metrics.incr(f"hedge.{self.name}.won")
+
+
+def hedged_call(policy: HedgePolicy, fn: Callable[[], T]) -> T:
+    """同步对冲：主请求超过延迟阈值仍未返回时补发一次，取先成功的结果
+
+    线程中的同步 HTTP 请求无法中途取消，落败的请求结果直接丢弃。
+    """
+    policy.record_request()
+    started = time.perf_counter()
+    primary = _executor.submit(_timed, fn)
+    attempts: List[Future] = [primary]
+    try:
+        done, _ = wait_futures(attempts, timeout=policy.delay_seconds())
+        if not done and policy.try_acquire_hedge():
+            attempts.append(_executor.submit(_timed, fn))
+
+        pending = set(attempts)
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, elapsed_ms = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                policy.observe(elapsed_ms)
+                policy.record_win(future is not primary)
+                for other in pending:
+                    other.cancel()
+                return result
+        assert last_error is not None
+        raise last_error
+    finally:
+        metrics.observe(f"hedge.{policy.name}.latency_ms", (time.perf_counter() - started) * 1000)
+
+
+def _timed(fn: Callable[[], T]) -> Tuple[T, float]:
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def hedged_astream(
+    policy: HedgePolicy,
+    factory: Callable[[], AsyncIterator[Any]],
+) -> AsyncGenerator[Any, None]:
+    """流式对冲：只在首个分片阶段对冲，首个分片先到的流胜出，另一条立即关闭"""
+    policy.record_request()
+    started = time.perf_counter()
+    primary = factory()
+    first_tasks = {asyncio.ensure_future(primary.__anext__()): primary}
+    winner: Optional[AsyncIterator[Any]] = None
+    first: Any = None
+    exhausted = False
+    try:
+        done, _ = await asyncio.wait(first_tasks, timeout=policy.delay_seconds())
+        if not done and policy.try_acquire_hedge():
+            secondary = factory()
+            first_tasks[asyncio.ensure_future(secondary.__anext__())] = secondary
+
+        last_error: Optional[BaseException] = None
+        pending = set(first_tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                except Exception as e:
+                    last_error = e
+                    continue
+                winner = first_tasks[task]
+                break
+        if winner is None:
+            assert last_error is not None
+            raise last_error
+
+        policy.observe((time.perf_counter() - started) * 1000)
+        policy.record_win(winner is not primary)
+    finally:
+        # 关闭落败（或全部，异常/取消时）的上游流，释放连接
+        for task, stream in first_tasks.items():
+            if stream is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await _aclose(stream)
+
+    try:
+        if exhausted:
+            return
+        yield first
+        async for chunk in winner:
+            yield chunk
+    finally:
+        await _aclose(winner)
+
+
+async def _aclose(stream: Any) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception as e:
+            logger.debug(f"Closing hedged stream failed: {e}")
+
+
+embedding_hedge = HedgePolicy("embed_query")
+llm_stream_hedge = HedgePolicy("llm_first_token")
@@ -0,0 +1,146 @@
+import threading
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.config import settings
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_lock = threading.Lock()
+_sync_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_request_counts: Dict[str, int] = {}
+_http2_checked = False
+_http2_available = False
+
+
+def _origin(base_url: str) -> str:
+    """连接池按 scheme://host:port 共享，同一上游的不同路径前缀共用连接"""
+    parts = urlsplit(str(base_url or "").strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port or _DEFAULT_PORTS.get(scheme, 443)
+    return f"{scheme}://{host}:{port}"
+
+
+def _use_http2() -> bool:
+    global _http2_checked, _http2_available
+    if not settings.HTTP2_ENABLED:
+        return False
+    if not _http2_checked:
+        _http2_checked = True
+        try:
+            import h2  # noqa: F401
+
+            _http2_available = True
+        except ImportError:
+            logger.warning("HTTP2_ENABLED=true but 'h2' is not installed, falling back to HTTP/1.1")
+    return _http2_available
+
+
+def http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.HTTP_READ_TIMEOUT_SECONDS,
+        connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max(1, settings.HTTP_POOL_MAX_CONNECTIONS),
+        max_keepalive_connections=max(0, settings.HTTP_POOL_MAX_KEEPALIVE),
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _count_request(origin: str) -> None:
+    with _lock:
+        _request_counts[origin] = _request_counts.get(origin, 0) + 1
+
+
+def get_http_client(base_url: str) -> httpx.Client:
+    """按上游 origin 共享的同步客户端（keep-alive 连接池）"""
+    origin = _origin(base_url)
+    with _lock:
+        client = _sync_clients.get(origin)
+        if client is None:
+            client = _sync_clients[origin] = httpx.Client(
+                http2=_use_http2(),
+                limits=_limits(),
+                timeout=http_timeout(),
+                event_hooks={"request": [lambda request: _count_request(origin)]},
+            )
+            logger.info(f"Created shared HTTP client for {origin}")
+        return client
+
+
+def get_async_http_client(base_url: str) -> httpx.AsyncClient:
+    """按上游 origin 共享的异步客户端；只在服务的主事件循环内使用"""
+    origin = _origin(base_url)
+
+    async def _on_request(request: httpx.Request) -> None:
+        _count_request(origin)
+
+    with _lock:
+        client = _async_clients.get(origin)
+        if client is None:
+            client = _async_clients[origin] = httpx.AsyncClient(
+                http2=_use_http2(),
+                limits=_limits(),
+                timeout=http_timeout(),
+                event_hooks={"request": [_on_request]},
+            )
+            logger.info(f"Created shared async HTTP client for {origin}")
+        return client
+
+
+def _pool_connections(client: Any) -> List[Any]:
+    # httpx 未公开连接池，读取 transport 内部的 httpcore 连接池；取不到时按空池处理。
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", None) or [])
+
+
+def _pool_stats(client: Any) -> Dict[str, Any]:
+    connections = _pool_connections(client)
+    idle = sum(1 for conn in connections if conn.is_idle())
+    active = len(connections) - idle
+    max_connections = max(1, settings.HTTP_POOL_MAX_CONNECTIONS)
+    return {
+        "connections": len(connections),
+        "active": active,
+        "idle": idle,
+        "max_connections": max_connections,
+        "utilization": round(active / max_connections, 4),
+    }
+
+
+def http_pool_stats() -> Dict[str, Any]:
+    """各上游连接池的连接数、活跃/空闲连接与利用率"""
+    with _lock:
+        clients: List[Tuple[str, str, Any]] = [
+            *(("sync", origin, client) for origin, client in _sync_clients.items()),
+            *(("async", origin, client) for origin, client in _async_clients.items()),
+        ]
+        counts = dict(_request_counts)
+    stats: Dict[str, Any] = {}
+    for kind, origin, client in clients:
+        entry = stats.setdefault(origin, {"requests": counts.get(origin, 0), "http2": _http2_available})
+        entry[kind] = _pool_stats(client)
+    return stats
+
+
+async def aclose_http_clients() -> None:
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        async_clients = list(_async_clients.values())
+        _sync_clients.clear()
+        _async_clients.clear()
+    for client in sync_clients:
+        client.close()
+    for client in async_clients:
+        await client.aclose()
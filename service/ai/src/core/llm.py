@@ -0,0 +1,42 @@
+from typing import Any, AsyncIterator, Optional
+
+from langchain_openai import ChatOpenAI
+
+from src.config import settings
+from src.core.deadline import Deadline
+from src.core.hedging import hedged_astream, llm_stream_hedge
+from src.core.http_clients import get_async_http_client, get_http_client, http_timeout
+from src.core.llm_router import LLMRouter, UpstreamConfig, build_llm_router, fast_upstreams
+
+
+def _build_upstream_model(upstream: UpstreamConfig) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=upstream.model,
+        temperature=settings.TEMPERATURE,
+        openai_api_key=upstream.api_key,
+        openai_api_base=upstream.base_url,
+        request_timeout=http_timeout(),
+        max_retries=max(0, settings.LLM_MAX_RETRIES),
+        # 流式响应末尾附带用量（含前缀缓存命中的 cached_tokens）
+        stream_usage=settings.LLM_STREAM_USAGE,
+        http_client=get_http_client(upstream.base_url),
+        http_async_client=get_async_http_client(upstream.base_url),
+    )
+
+
+def build_chat_model() -> LLMRouter:
+    """按配置构建对话模型（LLM_UPSTREAMS 多上游路由），HTTP 连接走按上游共享的连接池"""
+    return build_llm_router(_build_upstream_model)
+
+
+def build_fast_chat_model() -> Optional[LLMRouter]:
+    """快模型路由：各上游使用自己的 fast_model（默认 FAST_MODEL_NAME），没有上游声明时返回 None"""
+    configs = fast_upstreams()
+    return build_llm_router(_build_upstream_model, configs) if configs else None
+
+
+def stream_chat(llm: Any, messages: Any, deadline: Optional[Deadline] = None) -> AsyncIterator[Any]:
+    """流式调用模型；开启 HEDGE_LLM_STREAM_ENABLED 时对首个分片阶段做请求对冲"""
+    if not settings.HEDGE_LLM_STREAM_ENABLED:
+        return llm.astream(messages, deadline=deadline)
+    return hedged_astream(llm_stream_hedge, lambda: llm.astream(messages, deadline=deadline))
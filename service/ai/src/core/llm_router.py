@@ -0,0 +1,364 @@
+import asyncio
+import dataclasses
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from src.config import settings
+from src.core.deadline import Deadline, current_deadline
+from src.utils.exceptions import ConfigurationError, DeadlineExceededError, ServiceUnavailableError
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+# 错误率对选路代价的放大系数：错误率 50% 时代价约为 3 倍
+_ERROR_COST_FACTOR = 4.0
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    weight: float = 1.0
+    # 快模型路由在该上游上使用的模型；为空时该上游不参与快模型路由
+    fast_model: str = ""
+
+
+def parse_upstreams() -> List[UpstreamConfig]:
+    """解析 LLM_UPSTREAMS（JSON 数组）；为空时退回单一 OPENAI_API_BASE / MODEL_NAME
+
+    fast_model 未填写时，只有沿用默认 MODEL_NAME 的上游才取 FAST_MODEL_NAME；
+    自带 model 的上游需要自己声明 fast_model，否则不参与快模型路由。
+    """
+    raw = settings.LLM_UPSTREAMS.strip()
+    if not raw:
+        return [
+            UpstreamConfig(
+                name="default",
+                base_url=settings.OPENAI_API_BASE,
+                api_key=settings.OPENAI_API_KEY,
+                model=settings.MODEL_NAME,
+                fast_model=settings.FAST_MODEL_NAME.strip(),
+            )
+        ]
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ConfigurationError(f"LLM_UPSTREAMS is not valid JSON: {e}")
+    if not isinstance(items, list) or not items:
+        raise ConfigurationError("LLM_UPSTREAMS must be a non-empty JSON array")
+
+    upstreams: List[UpstreamConfig] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not str(item.get("base_url", "")).strip():
+            raise ConfigurationError(f"LLM_UPSTREAMS[{index}] requires base_url")
+        weight = float(item.get("weight", 1.0))
+        # FAST_MODEL_NAME 与 MODEL_NAME 配套，自带 model 的上游不套用
+        default_fast_model = "" if item.get("model") else settings.FAST_MODEL_NAME
+        if weight <= 0:
+            raise ConfigurationError(f"LLM_UPSTREAMS[{index}] weight must be positive")
+        upstreams.append(
+            UpstreamConfig(
+                name=str(item.get("name") or f"upstream-{index}"),
+                base_url=str(item["base_url"]).strip(),
+                api_key=str(item.get("api_key") or settings.OPENAI_API_KEY),
+                model=str(item.get("model") or settings.MODEL_NAME),
+                weight=weight,
+                fast_model=str(item.get("fast_model") or default_fast_model).strip(),
+            )
+        )
+    names = [upstream.name for upstream in upstreams]
+    if len(set(names)) != len(names):
+        raise ConfigurationError(f"LLM_UPSTREAMS names must be unique: {names}")
+    return upstreams
+
+
+class _Upstream:
+    """单个上游的 EWMA 延迟/错误率与熔断状态"""
+
+    def __init__(self, config: UpstreamConfig, llm: Any):
+        self.config = config
+        self.llm = llm
+        self._lock = threading.Lock()
+        # 流式首 token 与非流式整体耗时量级不同，分开统计
+        self.ewma_ttft_ms: Optional[float] = None
+        self.ewma_latency_ms: Optional[float] = None
+        self.ewma_error = 0.0
+        self.consecutive_failures = 0
+        self.state = BREAKER_CLOSED
+        self.opened_at = 0.0
+        self.probe_inflight = False
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        with self._lock:
+            if self.state == BREAKER_OPEN and now - self.opened_at >= settings.LLM_BREAKER_OPEN_SECONDS:
+                self.state = BREAKER_HALF_OPEN
+                self.probe_inflight = False
+            if self.state == BREAKER_CLOSED:
+                return True
+            # 半开：只放行一个探测请求
+            return self.state == BREAKER_HALF_OPEN and not self.probe_inflight
+
+    def try_acquire(self) -> bool:
+        """真正发出请求前占用；半开状态下只有一个调用方能拿到探测机会"""
+        with self._lock:
+            if self.state == BREAKER_OPEN:
+                return False
+            if self.state == BREAKER_HALF_OPEN:
+                if self.probe_inflight:
+                    return False
+                self.probe_inflight = True
+            self.requests += 1
+            return True
+
+    def cost(self, streaming: bool) -> float:
+        latency = self.ewma_ttft_ms if streaming else self.ewma_latency_ms
+        # 尚无样本时按 0 处理，让新上游先得到流量
+        return (latency or 0.0) * (1.0 + _ERROR_COST_FACTOR * self.ewma_error) / self.config.weight
+
+    def record_success(self, latency_ms: float, *, streaming: bool) -> None:
+        alpha = settings.LLM_EWMA_ALPHA
+        with self._lock:
+            if streaming:
+                self.ewma_ttft_ms = latency_ms if self.ewma_ttft_ms is None else _ewma(self.ewma_ttft_ms, latency_ms, alpha)
+            else:
+                self.ewma_latency_ms = (
+                    latency_ms if self.ewma_latency_ms is None else _ewma(self.ewma_latency_ms, latency_ms, alpha)
+                )
+            self.ewma_error = _ewma(self.ewma_error, 0.0, alpha)
+            self.consecutive_failures = 0
+            if self.state != BREAKER_CLOSED:
+                logger.info(f"LLM upstream {self.config.name} recovered, circuit closed")
+            self.state = BREAKER_CLOSED
+            self.probe_inflight = False
+        metrics.observe(f"llm.upstream.{self.config.name}.{'ttft' if streaming else 'latency'}_ms", latency_ms)
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.ewma_error = _ewma(self.ewma_error, 1.0, settings.LLM_EWMA_ALPHA)
+            self.consecutive_failures += 1
+            should_open = self.state == BREAKER_HALF_OPEN or (
+                self.state == BREAKER_CLOSED and self.consecutive_failures >= settings.LLM_BREAKER_FAILURE_THRESHOLD
+            )
+            if should_open:
+                self.state = BREAKER_OPEN
+                self.opened_at = time.monotonic()
+            self.probe_inflight = False
+        metrics.incr(f"llm.upstream.{self.config.name}.failures")
+        if should_open:
+            metrics.incr(f"llm.upstream.{self.config.name}.breaker_opened")
+            logger.warning(f"LLM upstream {self.config.name} circuit opened: {type(error).__name__}: {error}")
+
+    def release_probe(self) -> None:
+        # 探测请求被调用方取消：不算成功也不算失败，允许下一次探测
+        with self._lock:
+            self.probe_inflight = False
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "base_url": self.config.base_url,
+                "model": self.config.model,
+                "weight": self.config.weight,
+                "state": self.state,
+                "ewma_ttft_ms": _round(self.ewma_ttft_ms),
+                "ewma_latency_ms": _round(self.ewma_latency_ms),
+                "error_rate": round(self.ewma_error, 4),
+                "consecutive_failures": self.consecutive_failures,
+                "requests": self.requests,
+                "failures": self.failures,
+            }
+
+
+def _ewma(previous: float, value: float, alpha: float) -> float:
+    return previous + alpha * (value - previous)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+class LLMRouter:
+    """多上游 LLM 路由：按权重做 power-of-two-choices，比较 EWMA 延迟与错误率；
+
+    每个上游独立熔断。首个 token 产出前的失败（含首 token 超时）自动切换到下一个上游，
+    首 token 之后的失败只记录、不重放。对外提供 invoke / ainvoke / astream。
+
+    带 deadline 时每次尝试前检查截止时间，单次请求超时不超过剩余预算；
+    因截止时间到达而中断的请求不计入上游熔断统计，也不再切换上游。
+    """
+
+    def __init__(self, upstreams: List[_Upstream]):
+        if not upstreams:
+            raise ConfigurationError("LLM router needs at least one upstream")
+        self._upstreams = upstreams
+        self._random = random.Random()
+
+    @property
+    def upstream_names(self) -> List[str]:
+        return [upstream.config.name for upstream in self._upstreams]
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        return {upstream.config.name: upstream.health() for upstream in self._upstreams}
+
+    def invoke(self, messages: Any, deadline: Optional[Deadline] = None, **kwargs: Any) -> Any:
+        deadline = deadline or current_deadline()
+        last_error: Optional[BaseException] = None
+        for upstream in self._candidates(streaming=False):
+            if deadline is not None:
+                deadline.check("llm")
+                # 同步请求无法从外部取消，只能把 HTTP 超时压到剩余预算以内
+                kwargs["timeout"] = max(0.1, deadline.remaining())
+            if not upstream.try_acquire():
+                continue
+            started = time.perf_counter()
+            try:
+                response = upstream.llm.invoke(messages, **kwargs)
+            except Exception as e:
+                if deadline is not None and deadline.expired:
+                    upstream.release_probe()
+                    raise DeadlineExceededError("Request deadline exceeded during LLM call") from e
+                last_error = self._on_failure(upstream, e)
+                continue
+            upstream.record_success((time.perf_counter() - started) * 1000, streaming=False)
+            return response
+        raise self._exhausted(last_error)
+
+    async def ainvoke(self, messages: Any, deadline: Optional[Deadline] = None, **kwargs: Any) -> Any:
+        deadline = deadline or current_deadline()
+        last_error: Optional[BaseException] = None
+        for upstream in self._candidates(streaming=False):
+            if deadline is not None:
+                deadline.check("llm")
+            if not upstream.try_acquire():
+                continue
+            started = time.perf_counter()
+            try:
+                call = upstream.llm.ainvoke(messages, **kwargs)
+                # 截止时间到达时取消上游请求
+                response = await (call if deadline is None else asyncio.wait_for(call, deadline.remaining()))
+            except asyncio.CancelledError:
+                upstream.release_probe()
+                raise
+            except Exception as e:
+                if deadline is not None and deadline.expired:
+                    upstream.release_probe()
+                    raise DeadlineExceededError("Request deadline exceeded during LLM call") from e
+                last_error = self._on_failure(upstream, e)
+                continue
+            upstream.record_success((time.perf_counter() - started) * 1000, streaming=False)
+            return response
+        raise self._exhausted(last_error)
+
+    async def astream(
+        self, messages: Any, deadline: Optional[Deadline] = None, **kwargs: Any
+    ) -> AsyncGenerator[Any, None]:
+        deadline = deadline or current_deadline()
+        last_error: Optional[BaseException] = None
+        for upstream in self._candidates(streaming=True):
+            if deadline is not None:
+                deadline.check("llm")
+            if not upstream.try_acquire():
+                continue
+            started = time.perf_counter()
+            stream = upstream.llm.astream(messages, **kwargs)
+            first_token_timeout = settings.LLM_FIRST_TOKEN_TIMEOUT_SECONDS
+            if deadline is not None:
+                first_token_timeout = min(first_token_timeout, deadline.remaining())
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), first_token_timeout)
+            except StopAsyncIteration:
+                upstream.record_success((time.perf_counter() - started) * 1000, streaming=True)
+                await stream.aclose()
+                return
+            except asyncio.CancelledError:
+                upstream.release_probe()
+                await stream.aclose()
+                raise
+            except Exception as e:
+                await stream.aclose()
+                if deadline is not None and deadline.expired:
+                    upstream.release_probe()
+                    metrics.incr("deadline.exceeded.llm_first_token")
+                    raise DeadlineExceededError("Request deadline exceeded before first token") from e
+                last_error = self._on_failure(upstream, e)
+                continue
+
+            upstream.record_success((time.perf_counter() - started) * 1000, streaming=True)
+            try:
+                yield first
+                async for chunk in stream:
+                    if deadline is not None and deadline.expired:
+                        # 截止时间已到：停止读取，finally 中关闭上游流
+                        metrics.incr("deadline.exceeded.llm_stream")
+                        raise DeadlineExceededError("Request deadline exceeded during LLM stream")
+                    yield chunk
+            except DeadlineExceededError:
+                raise
+            except Exception as e:
+                # 已有输出，不能换上游重放；只计入熔断统计
+                upstream.record_failure(e)
+                raise
+            finally:
+                await stream.aclose()
+            return
+        raise self._exhausted(last_error)
+
+    def _candidates(self, *, streaming: bool) -> List[_Upstream]:
+        """首选上游 + 其余可用上游（按代价升序）作为失败切换顺序"""
+        now = time.monotonic()
+        available = [upstream for upstream in self._upstreams if upstream.available(now)]
+        if not available:
+            return []
+        first = self._pick(available, streaming)
+        rest = sorted((u for u in available if u is not first), key=lambda u: u.cost(streaming))
+        return [first, *rest]
+
+    def _pick(self, available: List[_Upstream], streaming: bool) -> _Upstream:
+        if len(available) == 1:
+            return available[0]
+        weights = [upstream.config.weight for upstream in available]
+        a, b = self._random.choices(available, weights=weights, k=2)
+        return a if a.cost(streaming) <= b.cost(streaming) else b
+
+    def _on_failure(self, upstream: _Upstream, error: BaseException) -> BaseException:
+        upstream.record_failure(error)
+        metrics.incr("llm.router.failover")
+        logger.warning(
+            f"LLM upstream {upstream.config.name} failed before first token, failing over: "
+            f"{type(error).__name__}: {error}"
+        )
+        return error
+
+    def _exhausted(self, last_error: Optional[BaseException]) -> BaseException:
+        metrics.incr("llm.router.exhausted")
+        if last_error is None:
+            return ServiceUnavailableError("All LLM upstreams are unavailable (circuit open)")
+        return last_error
+
+
+def fast_upstreams() -> List[UpstreamConfig]:
+    """快模型路由的上游：只保留声明了 fast_model 的上游，并改用该模型"""
+    return [dataclasses.replace(config, model=config.fast_model) for config in parse_upstreams() if config.fast_model]
+
+
+def build_llm_router(build_model: Any, configs: Optional[List[UpstreamConfig]] = None) -> LLMRouter:
+    """build_model(config) -> ChatOpenAI；configs 为空时按 parse_upstreams()"""
+    configs = parse_upstreams() if configs is None else configs
+    upstreams = [_Upstream(config, build_model(config)) for config in configs]
+    if len(upstreams) > 1:
+        logger.info(f"LLM router upstreams: {[u.config.name for u in upstreams]}")
+    return LLMRouter(upstreams)
+
@@ -1,5 +1,5 @@
 import re
-from typing import List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 
 _DECORATIVE_SYMBOLS_PATTERN = re.compile(
@@ -40,6 +40,56 @@ _CMAKE_LINE_RE = re.compile(
 )
 _COMPILER_COMMANDS = {"gcc", "g++", "clang", "clang++"}
 
+# 逐行判定的热点正则统一预编译，避免每行重复查 re 模块缓存。
+_CN_CHAR_RE = re.compile(r"[一-龥]")
+_FENCE_QUOTE_CHARS = "“”\"'"
+_FENCE_QUOTE_EDGE_RE = re.compile(r"^[“”\"']+|[“”\"']+$")
+_FENCE_LINE_RE = re.compile(r"^```[A-Za-z0-9_-]*\s*$")
+_FENCE_CLOSE_RE = re.compile(r"^```\s*$")
+_FENCE_WITH_LANG_RE = re.compile(r"^```[A-Za-z0-9_-]+\s*$")
+_EMPTY_FENCE_OPEN_LINE_RE = re.compile(r"```[A-Za-z0-9_-]*")
+_EMPTY_FENCE_CLOSE_LINE_RE = re.compile(r"[ \t]*```[ \t]*")
+_TRAILING_COLON_RE = re.compile(r"[：:]\s*$")
+_SHELL_TAIL_START_RE = re.compile(r"^[A-Za-z0-9_./:@=-]")
+_VERSION_TAIL_RE = re.compile(r"^\d+(?:\.\d+)*\+?$")
+_COMPILER_TAIL_RE = re.compile(
+    r"(?:^|\s)(-[-\w=:.+]+|\S+\.(?:c|cc|cpp|cxx|h|hpp|o|so|a))(?:\s|$)",
+    re.IGNORECASE,
+)
+_INCLUDE_LINE_START_RE = re.compile(r"^(?:cpp|c\+\+)?\s*#include\s*<", re.IGNORECASE)
+_DECLARATION_START_RE = re.compile(r"^(template\s*<|class\s+\w+|struct\s+\w+|namespace\s+\w+)")
+_TYPED_STATEMENT_RE = re.compile(r"^\s*(int|void|bool|auto|size_t)\s+\w+.*[;{]\s*$")
+_COROUTINE_KEYWORD_RE = re.compile(r"\bco_(return|await|yield)\b")
+_RETURN_STATEMENT_RE = re.compile(r"^\s*return\b[^一-龥]*[;}]\s*$")
+_ARROW_CALL_RE = re.compile(r"->\s*\w+\(")
+_BRACE_ONLY_RE = re.compile(r"^[{}]+[;,]?$")
+_CLOSER_ONLY_RE = re.compile(r"^[)\]}]+[;,]?$")
+_BRACE_RE = re.compile(r"[{}]")
+_INT_MAIN_RE = re.compile(r"\bint\s+main\s*\(")
+_SHELL_COMMAND_START_RE = re.compile(
+    rf"\$?\s*(?:{_SHELL_COMMAND_PATTERN}|\.\/[^\s]+)(?=\s|$)",
+    re.IGNORECASE,
+)
+# (pattern, 是否命令行模式, 小写必含子串)；必含子串不存在时可直接跳过该模式的扫描。
+_INLINE_CODE_START_PATTERNS = (
+    (re.compile(r"(?:cpp|c\+\+)?\s*#include\s*<", re.IGNORECASE), False, "#include"),
+    (_INT_MAIN_RE, False, "main"),
+    (re.compile(r"\bcmake_minimum_required\s*\(", re.IGNORECASE), False, "cmake_minimum_required"),
+    (re.compile(r"\bproject\s*\(", re.IGNORECASE), False, "project"),
+    (_SHELL_COMMAND_START_RE, True, ""),
+)
+_LANG_HINT_BULLET_RE = re.compile(r"^\s*[-*+]\s*")
+_LANG_HINT_BACKTICK_RE = re.compile(r"^`+|`+$")
+_LANG_HINT_COLON_RE = re.compile(r"[：:]\s*$")
+_LANG_HINT_PREFIX_RE = re.compile(r"^language\s*[：:]\s*")
+_CALL_LIKE_LINE_RE = re.compile(r"^[A-Za-z_]+\s*\(")
+_CPP_COMMENT_LINE_RE = re.compile(r"^\s*(//|/\*|\*|\*/)")
+_EXPLANATORY_END_RE = re.compile(r"[：:。；;!?！？]$")
+_EXPLANATORY_KEYWORD_RE = re.compile(r"(说明|步骤|示例|构建|运行|验证|如下|例如|命令)")
+_LEADING_WS_RE = re.compile(r"^\s*")
+_MAKE_COMMAND_RE = re.compile(r"^make(?:\s|$)", re.IGNORECASE)
+_CMAKE_COMMAND_RE = re.compile(r"^cmake(?:\s|$)", re.IGNORECASE)
+
 
 def normalize_markdown_content(
     content: str,
@@ -54,6 +104,35 @@ def normalize_markdown_content(
     text = str(content).replace("\r\n", "\n").replace("\r", "\n")
     text = _ZERO_WIDTH_PATTERN.sub("", text)
 
+    if strip_decorative:
+        text = _DECORATIVE_SYMBOLS_PATTERN.sub("", text)
+
+    # 行内 fence 修正的正则会跨行匹配，只能整段执行；不含 ``` 时整段跳过。
+    if "```" in text:
+        text = _normalize_inline_fences(text)
+
+    # 其余各阶段串成逐行流水线：每行只切分/拼接一次，依次流过各阶段的状态机。
+    lines: Iterable[str] = _iter_outside_fence_lines(text.split("\n"), target=target)
+    lines = _iter_canonical_code_lines(lines)
+    lines = _iter_normalized_fence_lines(lines)
+    lines = _iter_non_empty_fence_lines(lines)
+    lines = _iter_cleaned_lines(lines)
+    return "\n".join(lines).strip()
+
+
+def _normalize_markdown_content_multipass(
+    content: str,
+    *,
+    target: str = "answer",
+    strip_decorative: bool = True,
+) -> str:
+    """逐阶段整段处理的参考实现，仅用于差分校验与基准对比。"""
+    if not content:
+        return ""
+
+    text = str(content).replace("\r\n", "\n").replace("\r", "\n")
+    text = _ZERO_WIDTH_PATTERN.sub("", text)
+
     if strip_decorative:
         text = _DECORATIVE_SYMBOLS_PATTERN.sub("", text)
 
@@ -66,6 +145,222 @@ def normalize_markdown_content(
     return text.strip()
 
 
+def _iter_outside_fence_lines(lines: Iterable[str], *, target: str) -> Iterator[str]:
+    """流式版 `_normalize_outside_fences`：fence 外的连续普通行合并为段落后规范化。"""
+    plain_buffer: List[str] = []
+    in_fence = False
+
+    for line in lines:
+        fence_candidate = _normalize_fence_token(line)
+        if _is_fence_line(fence_candidate):
+            if plain_buffer:
+                normalized = _normalize_plain_segment("\n".join(plain_buffer), target=target)
+                plain_buffer = []
+                if normalized:
+                    yield from normalized.split("\n")
+            yield fence_candidate
+            if in_fence:
+                if _is_fence_close(fence_candidate):
+                    in_fence = False
+            else:
+                in_fence = True
+            continue
+
+        if in_fence:
+            yield line
+            continue
+
+        plain_buffer.append(line)
+
+    if plain_buffer:
+        normalized = _normalize_plain_segment("\n".join(plain_buffer), target=target)
+        if normalized:
+            yield from normalized.split("\n")
+
+
+def _iter_canonical_code_lines(lines: Iterable[str]) -> Iterator[str]:
+    """流式版 `_canonicalize_code_blocks`。"""
+    in_fence = False
+    synthetic_fence = False
+    pending_language_hint = ""
+
+    for raw_line in lines:
+        line = raw_line.rstrip()
+        stripped = line.strip()
+        fence_candidate = _normalize_fence_token(stripped)
+
+        if _is_fence_line(fence_candidate):
+            if synthetic_fence:
+                yield "```"
+                synthetic_fence = False
+                pending_language_hint = ""
+                if _is_fence_close(fence_candidate):
+                    continue
+                yield fence_candidate
+                in_fence = True
+                continue
+
+            if not in_fence:
+                pending_language_hint = ""
+                yield fence_candidate if _FENCE_WITH_LANG_RE.match(fence_candidate) else "```"
+                in_fence = True
+                continue
+
+            if _is_fence_close(fence_candidate):
+                yield "```"
+                in_fence = False
+                pending_language_hint = ""
+                continue
+
+            nested_hint = fence_candidate[3:].strip()
+            if nested_hint:
+                yield nested_hint
+            continue
+
+        if in_fence:
+            yield line
+            continue
+
+        if not stripped:
+            if synthetic_fence:
+                yield "```"
+                synthetic_fence = False
+            pending_language_hint = ""
+            yield ""
+            continue
+
+        language_hint = _normalize_language_hint(stripped)
+        if language_hint and not synthetic_fence:
+            pending_language_hint = language_hint
+            continue
+
+        inline_start = _find_inline_code_start(stripped)
+        if inline_start > 0:
+            plain_text = stripped[:inline_start].strip()
+            code_text = stripped[inline_start:].strip()
+            if plain_text:
+                if synthetic_fence:
+                    yield "```"
+                    synthetic_fence = False
+                if pending_language_hint:
+                    yield pending_language_hint
+                    pending_language_hint = ""
+                yield plain_text
+
+            if not synthetic_fence:
+                code_lang = pending_language_hint or _guess_code_language(code_text)
+                yield f"```{code_lang}"
+                synthetic_fence = True
+            pending_language_hint = ""
+            for code_line in _split_compact_code_line(code_text):
+                yield _normalize_code_hint_line(code_line)
+            continue
+
+        if _looks_like_code_line(stripped):
+            if not synthetic_fence:
+                code_lang = pending_language_hint or _guess_code_language(stripped)
+                yield f"```{code_lang}"
+                synthetic_fence = True
+            pending_language_hint = ""
+            for code_line in _split_compact_code_line(stripped):
+                yield _normalize_code_hint_line(code_line)
+            continue
+
+        if synthetic_fence:
+            yield "```"
+            synthetic_fence = False
+        if pending_language_hint:
+            yield pending_language_hint
+            pending_language_hint = ""
+        yield stripped
+
+    if synthetic_fence:
+        yield "```"
+    if pending_language_hint:
+        yield pending_language_hint
+
+
+def _iter_normalized_fence_lines(lines: Iterable[str]) -> Iterator[str]:
+    """流式版 `_normalize_fenced_blocks`：缓冲单个 fence 块，闭合时整体清洗输出。"""
+    in_fence = False
+    fence_lang = ""
+    fence_lines: List[str] = []
+
+    for line in lines:
+        fence_candidate = _normalize_fence_token(line)
+
+        if _is_fence_line(fence_candidate):
+            if not in_fence:
+                in_fence = True
+                fence_lang = fence_candidate[3:].strip().lower()
+                fence_lines = []
+                continue
+
+            if _is_fence_close(fence_candidate):
+                yield from _emit_sanitized_fence(fence_lines, fence_lang)
+                in_fence = False
+                fence_lang = ""
+                fence_lines = []
+                continue
+
+            fence_lines.append(fence_candidate)
+            continue
+
+        if in_fence:
+            fence_lines.append(line.rstrip())
+            continue
+
+        yield line
+
+    if in_fence:
+        yield from _emit_sanitized_fence(fence_lines, fence_lang)
+
+
+def _emit_sanitized_fence(fence_lines: List[str], fence_lang: str) -> Iterator[str]:
+    prose_lines, code_lines = _sanitize_fenced_block(fence_lines, fence_lang)
+    yield from prose_lines
+    if code_lines:
+        yield f"```{fence_lang}" if fence_lang else "```"
+        yield from code_lines
+        yield "```"
+
+
+def _iter_non_empty_fence_lines(lines: Iterable[str]) -> Iterator[str]:
+    """流式版 `_drop_empty_fences`：向后看一行，成对丢弃空 fence。"""
+    pending_open: Optional[str] = None
+
+    for line in lines:
+        if pending_open is not None:
+            if _EMPTY_FENCE_CLOSE_LINE_RE.fullmatch(line):
+                pending_open = None
+                continue
+            yield pending_open
+            pending_open = None
+
+        if _EMPTY_FENCE_OPEN_LINE_RE.fullmatch(line):
+            pending_open = line
+            continue
+
+        yield line
+
+    if pending_open is not None:
+        yield pending_open
+
+
+def _iter_cleaned_lines(lines: Iterable[str]) -> Iterator[str]:
+    """流式版 `_cleanup_whitespace`：去行尾空白，连续空行压缩为一行。"""
+    previous_blank = False
+    for line in lines:
+        line = line.rstrip(" \t")
+        if not line:
+            if previous_blank:
+                continue
+            previous_blank = True
+        else:
+            previous_blank = False
+        yield line
+
+
 def _normalize_inline_fences(text: str) -> str:
     normalized = text
     normalized = re.sub(r"([^\n])\s*[“”\"']?\s*```([A-Za-z0-9_-]*)", r"\1\n```\2", normalized)
@@ -314,7 +609,7 @@ def _split_mixed_command_prose_line(line: str) -> Optional[Tuple[str, str]]:
         return None
 
     tail = (match.group("tail") or "").strip()
-    if not tail or not re.search(r"[一-龥]", tail):
+    if not tail or not _CN_CHAR_RE.search(tail):
         return None
 
     prose_match = re.search(
@@ -445,10 +740,10 @@ def _is_code_line_for_language(line: str, language: str) -> bool:
     if lang == "cmake":
         if stripped.startswith("#"):
             return True
-        return _CMAKE_LINE_RE.search(stripped) is not None or bool(re.match(r"^[A-Za-z_]+\s*\(", stripped))
+        return _CMAKE_LINE_RE.search(stripped) is not None or bool(_CALL_LIKE_LINE_RE.match(stripped))
 
     if lang in {"cpp", "c++", "cc", "cxx", "hpp", "h"}:
-        if re.match(r"^\s*(//|/\*|\*|\*/)", stripped):
+        if _CPP_COMMENT_LINE_RE.match(stripped):
             return True
         return _looks_like_code_line(stripped)
 
@@ -463,10 +758,10 @@ def _is_explanatory_line(line: str) -> bool:
     if _looks_like_code_line(stripped):
         return False
 
-    if re.search(r"[一-龥]", stripped):
-        if re.search(r"[：:。；;!?！？]$", stripped):
+    if _CN_CHAR_RE.search(stripped):
+        if _EXPLANATORY_END_RE.search(stripped):
             return True
-        if re.search(r"(说明|步骤|示例|构建|运行|验证|如下|例如|命令)", stripped):
+        if _EXPLANATORY_KEYWORD_RE.search(stripped):
             return True
 
     return False
@@ -485,23 +780,26 @@ def _cleanup_whitespace(text: str) -> str:
 
 
 def _normalize_fence_token(line: str) -> str:
-    return re.sub(r"^[“”\"']+|[“”\"']+$", "", line.strip())
+    stripped = line.strip()
+    if not stripped or (stripped[0] not in _FENCE_QUOTE_CHARS and stripped[-1] not in _FENCE_QUOTE_CHARS):
+        return stripped
+    return _FENCE_QUOTE_EDGE_RE.sub("", stripped)
 
 
 def _is_fence_line(line: str) -> bool:
-    return re.match(r"^```[A-Za-z0-9_-]*\s*$", line) is not None
+    return line.startswith("```") and _FENCE_LINE_RE.match(line) is not None
 
 
 def _is_fence_close(line: str) -> bool:
-    return re.match(r"^```\s*$", line) is not None
+    return line.startswith("```") and _FENCE_CLOSE_RE.match(line) is not None
 
 
 def _normalize_language_hint(line: str) -> str:
     normalized = (line or "").strip().lower()
-    normalized = re.sub(r"^\s*[-*+]\s*", "", normalized)
-    normalized = re.sub(r"^`+|`+$", "", normalized)
-    normalized = re.sub(r"[：:]\s*$", "", normalized)
-    normalized = re.sub(r"^language\s*[：:]\s*", "", normalized)
+    normalized = _LANG_HINT_BULLET_RE.sub("", normalized)
+    normalized = _LANG_HINT_BACKTICK_RE.sub("", normalized)
+    normalized = _LANG_HINT_COLON_RE.sub("", normalized)
+    normalized = _LANG_HINT_PREFIX_RE.sub("", normalized)
     normalized = normalized.strip()
     return _LANG_HINTS.get(normalized, "")
 
@@ -511,10 +809,10 @@ def _looks_like_shell_command(line: str) -> bool:
     if not stripped:
         return False
 
-    if re.search(r"[一-龥]", stripped):
+    if _CN_CHAR_RE.search(stripped):
         return False
 
-    if re.search(r"[：:]\s*$", stripped):
+    if _TRAILING_COLON_RE.search(stripped):
         return False
 
     match = _SHELL_LINE_RE.match(stripped)
@@ -529,19 +827,15 @@ def _looks_like_shell_command(line: str) -> bool:
     if not tail:
         return cmd in {"make", "cmake", "ls", "pwd"}
 
-    if not re.match(r"^[A-Za-z0-9_./:@=-]", tail):
+    if not _SHELL_TAIL_START_RE.match(tail):
         return False
 
-    if re.match(r"^\d+(?:\.\d+)*\+?$", tail):
+    if _VERSION_TAIL_RE.match(tail):
         return False
 
     # 避免把“GCC 11+/Clang 14+”这类环境要求误判成命令。
     if cmd in _COMPILER_COMMANDS:
-        compiler_tail_ok = re.search(
-            r"(?:^|\s)(-[-\w=:.+]+|\S+\.(?:c|cc|cpp|cxx|h|hpp|o|so|a))(?:\s|$)",
-            tail,
-            flags=re.IGNORECASE,
-        )
+        compiler_tail_ok = _COMPILER_TAIL_RE.search(tail)
         if not compiler_tail_ok:
             return False
 
@@ -553,31 +847,31 @@ def _looks_like_code_line(line: str) -> bool:
     if not stripped:
         return False
 
-    has_cn = re.search(r"[一-龥]", stripped) is not None
+    has_cn = _CN_CHAR_RE.search(stripped) is not None
 
-    if re.search(r"^(?:cpp|c\+\+)?\s*#include\s*<", stripped, flags=re.IGNORECASE):
+    if _INCLUDE_LINE_START_RE.search(stripped):
         return True
-    if re.search(r"^(template\s*<|class\s+\w+|struct\s+\w+|namespace\s+\w+)", stripped):
+    if _DECLARATION_START_RE.search(stripped):
         return True
     if _CMAKE_LINE_RE.search(stripped):
         return True
     if _looks_like_shell_command(stripped):
         return True
-    if re.search(r"^\s*(int|void|bool|auto|size_t)\s+\w+.*[;{]\s*$", stripped):
+    if _TYPED_STATEMENT_RE.search(stripped):
         return True
-    if re.search(r"\bco_(return|await|yield)\b", stripped) and not has_cn:
+    if _COROUTINE_KEYWORD_RE.search(stripped) and not has_cn:
         return True
-    if re.search(r"^\s*return\b[^一-龥]*[;}]\s*$", stripped) and not has_cn:
+    if _RETURN_STATEMENT_RE.search(stripped) and not has_cn:
         return True
-    if re.search(r"->\s*\w+\(", stripped) and not has_cn:
+    if _ARROW_CALL_RE.search(stripped) and not has_cn:
         return True
-    if re.search(r"^[{}]+[;,]?$", stripped):
+    if _BRACE_ONLY_RE.search(stripped):
         return True
-    if re.search(r"^[)\]}]+[;,]?$", stripped):
+    if _CLOSER_ONLY_RE.search(stripped):
         return True
     if stripped.endswith(";") and not has_cn and len(stripped) >= 12:
         return True
-    if re.search(r"[{}]", stripped) and re.search(r"\(", stripped) and not has_cn:
+    if _BRACE_RE.search(stripped) and "(" in stripped and not has_cn:
         return True
 
     return False
@@ -590,26 +884,25 @@ def _find_inline_code_start(line: str) -> int:
     if _looks_like_code_line(line):
         return -1
 
-    patterns = [
-        re.compile(r"(?:cpp|c\+\+)?\s*#include\s*<", re.IGNORECASE),
-        re.compile(r"\bint\s+main\s*\("),
-        re.compile(r"\bcmake_minimum_required\s*\(", re.IGNORECASE),
-        re.compile(r"\bproject\s*\(", re.IGNORECASE),
-        re.compile(rf"\$?\s*(?:{_SHELL_COMMAND_PATTERN}|\.\/[^\s]+)(?=\s|$)", re.IGNORECASE),
-    ]
-
+    lowered = line.lower()
+    has_colon = ":" in line or "：" in line
     starts: List[int] = []
-    for pattern in patterns:
+    for pattern, is_shell, needle in _INLINE_CODE_START_PATTERNS:
+        if needle and needle not in lowered:
+            continue
+        # 行内命令只在冒号之后拆分，没有冒号的行不可能命中。
+        if is_shell and not has_colon:
+            continue
         for match in pattern.finditer(line):
             if match.start() <= 0:
                 continue
-            candidate = line[match.start():].strip()
-            if pattern.pattern.startswith(r"\$?") and not _looks_like_shell_command(candidate):
-                continue
-            if pattern.pattern.startswith(r"\$?"):
+            if is_shell:
                 prefix = line[: match.start()].rstrip()
                 # 仅在“说明: 命令”类上下文做行内命令拆分，避免把标题中的 Docker Compose 误判为命令。
-                if not re.search(r"[:：]$", prefix):
+                if not prefix.endswith((":", "：")):
+                    continue
+                candidate = line[match.start():].strip()
+                if not _looks_like_shell_command(candidate):
                     continue
             starts.append(match.start())
 
@@ -621,7 +914,7 @@ def _guess_code_language(line: str) -> str:
     if not stripped:
         return "text"
 
-    if re.search(r"^(?:cpp|c\+\+)?\s*#include\s*<", stripped, flags=re.IGNORECASE) or re.search(r"\bint\s+main\s*\(", stripped):
+    if _INCLUDE_LINE_START_RE.search(stripped) or _INT_MAIN_RE.search(stripped):
         return "cpp"
     if _CMAKE_LINE_RE.search(stripped):
         return "cmake"
@@ -680,7 +973,7 @@ def _normalize_portable_command_line(line: str) -> str:
     if not stripped:
         return raw
 
-    leading_ws_match = re.match(r"^\s*", raw)
+    leading_ws_match = _LEADING_WS_RE.match(raw)
     leading_ws = leading_ws_match.group(0) if leading_ws_match else ""
 
     has_prompt = False
@@ -708,7 +1001,7 @@ def _normalize_portable_command_line(line: str) -> str:
 
 
 def _normalize_make_parallel_flag(command: str) -> str:
-    if not re.match(r"^make(?:\s|$)", command, flags=re.IGNORECASE):
+    if not _MAKE_COMMAND_RE.match(command):
         return command
 
     return re.sub(
@@ -720,7 +1013,7 @@ def _normalize_make_parallel_flag(command: str) -> str:
 
 
 def _normalize_cmake_build_parallel_flag(command: str) -> str:
-    if not re.match(r"^cmake(?:\s|$)", command, flags=re.IGNORECASE):
+    if not _CMAKE_COMMAND_RE.match(command):
         return command
     if re.search(r"(?<!\S)--build(?:\s|$)", command, flags=re.IGNORECASE) is None:
         return command
@@ -0,0 +1,151 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import settings
+from src.utils.exceptions import ConfigurationError
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 固定种子：同一份文档每次构建得到相同签名与相同的保留结果
+_SEED = 0x6A1A7
+_SHINGLE_BASE = np.uint64(1_000_003)
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+# Chroma metadata 只支持标量，多个来源 / 项目用 "; " 拼接
+_ALTERNATE_SEPARATOR = "; "
+
+
+@dataclass
+class DedupResult:
+    documents: List[Document]
+    dropped: int
+    # 吸收了至少一个重复片段的保留 chunk 数
+    groups: int
+
+
+class NearDuplicateDetector:
+    """MinHash + LSH 近重复检测
+
+    正文归一化（小写、折叠空白）后取字符 shingle，MinHash 签名估计 Jaccard 相似度；
+    LSH 分桶只比较同桶候选，估计相似度 ≥ threshold 时视为重复，只保留先出现的一份。
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        num_perm: Optional[int] = None,
+        bands: Optional[int] = None,
+        shingle_size: Optional[int] = None,
+    ):
+        self._threshold = settings.DEDUP_THRESHOLD if threshold is None else float(threshold)
+        num_perm = settings.DEDUP_NUM_PERM if num_perm is None else int(num_perm)
+        self._bands = settings.DEDUP_LSH_BANDS if bands is None else int(bands)
+        self._shingle_size = max(1, settings.DEDUP_SHINGLE_SIZE if shingle_size is None else int(shingle_size))
+        if num_perm < 1 or self._bands < 1 or num_perm % self._bands:
+            raise ConfigurationError(
+                f"DEDUP_NUM_PERM ({num_perm}) must be a positive multiple of DEDUP_LSH_BANDS ({self._bands})"
+            )
+        self._rows = num_perm // self._bands
+        rng = np.random.default_rng(_SEED)
+        # multiply-shift 哈希族：(a * x + b) mod 2^64 取高 32 位，a 为奇数
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash 签名；归一化后短于 shingle 长度的文本返回 None（不参与去重）"""
+        normalized = _WHITESPACE_RE.sub(" ", str(text or "")).strip().lower()
+        codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = self._shingle_size
+        if len(codes) < k:
+            return None
+        count = len(codes) - k + 1
+        rolling = np.zeros(count, dtype=np.uint64)
+        for offset in range(k):
+            rolling = rolling * _SHINGLE_BASE + codes[offset : offset + count]
+        shingles = np.unique((rolling * _SHINGLE_MIX) >> _SHIFT)
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> _SHIFT
+        return hashed.min(axis=1)
+
+    def deduplicate(self, docs: List[Document]) -> DedupResult:
+        """按输入顺序保留每组近重复中的第一份
+
+        其余副本的来源记入保留 chunk 的 alternate_sources，所属的其他项目记入 alternate_projects，
+        检索时针对这些项目的提问同样能命中保留的这一份。
+        """
+        kept: List[Document] = []
+        signatures: Dict[int, np.ndarray] = {}
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        alternates: Dict[int, List[Document]] = {}
+        dropped = 0
+
+        for doc in docs:
+            signature = self.signature(doc.page_content)
+            if signature is None:
+                kept.append(doc)
+                continue
+            keys = [
+                (band, signature[band * self._rows : (band + 1) * self._rows].tobytes()) for band in range(self._bands)
+            ]
+            match = self._find_match(signature, keys, buckets, signatures)
+            if match is not None:
+                alternates.setdefault(match, []).append(doc)
+                dropped += 1
+                continue
+            index = len(kept)
+            kept.append(doc)
+            signatures[index] = signature
+            for key in keys:
+                buckets.setdefault(key, []).append(index)
+
+        for index, copies in alternates.items():
+            canonical = kept[index]
+            own = _source_label(canonical)
+            labels = list(dict.fromkeys(label for label in map(_source_label, copies) if label != own))
+            own_project = _project_key(canonical)
+            projects = list(dict.fromkeys(p for p in map(_project_key, copies) if p and p != own_project))
+            canonical.metadata["duplicate_count"] = len(copies)
+            if labels:
+                canonical.metadata["alternate_sources"] = _ALTERNATE_SEPARATOR.join(labels)
+            if projects:
+                canonical.metadata["alternate_projects"] = _ALTERNATE_SEPARATOR.join(projects)
+        return DedupResult(documents=kept, dropped=dropped, groups=len(alternates))
+
+    def _find_match(
+        self,
+        signature: np.ndarray,
+        keys: List[Tuple[int, bytes]],
+        buckets: Dict[Tuple[int, bytes], List[int]],
+        signatures: Dict[int, np.ndarray],
+    ) -> Optional[int]:
+        checked: Set[int] = set()
+        for key in keys:
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = float(np.mean(signatures[candidate] == signature))
+                if similarity >= self._threshold:
+                    return candidate
+        return None
+
+
+def _source_label(doc: Document) -> str:
+    project = str(doc.metadata.get("project", "")).strip()
+    source = str(doc.metadata.get("source", "")).replace("\\", "/")
+    return f"{project}/{source}" if project else source
+
+
+def _project_key(doc: Document) -> str:
+    return str(doc.metadata.get("project", "")).strip().lower()
+
+
+def alternate_projects(metadata: Mapping[str, Any]) -> List[str]:
+    """去重时并入该 chunk 的其他项目（小写）；未去重过的 chunk 返回空列表"""
+    raw = str(metadata.get("alternate_projects", "") or "")
+    return [project.strip().lower() for project in raw.split(";") if project.strip()]
@@ -0,0 +1,105 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from src.config import settings
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每条消息的固定开销（role/分隔符），与 OpenAI chat 格式的计数方式一致
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_CHAR_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+_COUNT_CACHE_SIZE = 4096
+
+_encoding: Any = None
+_encoding_warm_started = False
+_encoding_lock = threading.Lock()
+
+# 精确计数缓存，键是（编码名，文本摘要）：不持有原文，长历史不会被缓存拖住内存
+_count_cache: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def warm_encoding() -> Optional[threading.Thread]:
+    """在后台线程加载 tiktoken 编码（本地没有缓存时需要联网下载），只启动一次；返回加载线程。
+
+    启动时调用；请求路径上的计数不等待加载，就绪前用估算值。
+    """
+    global _encoding_warm_started
+    with _encoding_lock:
+        if _encoding_warm_started:
+            return None
+        _encoding_warm_started = True
+    thread = threading.Thread(target=_load_encoding, name="tiktoken-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def _load_encoding() -> None:
+    global _encoding
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(settings.MODEL_NAME)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, falling back to estimated token counts: {e}")
+        return
+    _encoding = encoding
+    logger.info(f"tiktoken encoding loaded: {encoding.name}")
+
+
+def _get_encoding() -> Optional[Any]:
+    """已加载的 tiktoken 编码；未就绪（加载中、离线或不支持）时返回 None，退回估算。"""
+    if _encoding is None:
+        warm_encoding()
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    # CJK 字符约 1 token/字，其余按 4 字符/token 估算。
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """统计文本 token 数（同一段历史每轮都会被重复计数，结果缓存）"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return _count_encoded(encoding, text)
+
+
+def _count_encoded(encoding: Any, text: str) -> int:
+    # 只缓存精确计数：编码加载完成前的估算值不进缓存
+    key = (encoding.name, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached is not None:
+            _count_cache.move_to_end(key)
+            return cached
+    count = len(encoding.encode(text, disallowed_special=()))
+    with _count_cache_lock:
+        _count_cache[key] = count
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > _COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+def count_message_tokens(messages: Iterable[Any]) -> int:
+    """统计 LangChain 消息列表或 {"content": ...} 字典列表的 token 数"""
+    total = 0
+    for message in messages:
+        content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(content if isinstance(content, str) else str(content))
+    return total
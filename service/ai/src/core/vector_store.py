@@ -1,6 +1,6 @@
 import shutil
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Set, Tuple
 
 from langchain_core.documents import Document
 from langchain_community.vectorstores import Chroma
@@ -20,6 +20,8 @@ class VectorStoreManager:
         self._embedding_mgr = EmbeddingManager()
         self._store: Chroma | None = None
         self._persist_dir = settings.VECTOR_STORE_PATH
+        # 最近一次全量构建的统计（文件数、chunk 数、去重丢弃数）
+        self.build_report: Dict[str, int] = {}
 
     # ------------------------------------------------------------------
     # 生命周期
@@ -47,14 +49,25 @@ class VectorStoreManager:
         self._ensure_ready()
         return self._store.similarity_search_with_score(query, k=k)
 
+    def embed_query(self, text: str) -> List[float]:
+        return self._embedding_mgr.get_embeddings().embed_query(text)
+
     # ------------------------------------------------------------------
     # 写入
     # ------------------------------------------------------------------
     def add_documents(self, docs: List[Document]) -> None:
+        """写入文档；带 chunk_id 的按 id upsert，重复写入同一 chunk 不会产生副本"""
         self._ensure_ready()
-        self._store.add_documents(docs)
+        docs = _unique_chunks(docs)
+        self._store.add_documents(docs, ids=_chunk_ids(docs))
         logger.info(f"Added {len(docs)} documents to vector store")
 
+    def delete_documents(self, chunk_ids: List[str]) -> None:
+        self._ensure_ready()
+        if chunk_ids:
+            self._store.delete(ids=list(chunk_ids))
+            logger.info(f"Deleted {len(chunk_ids)} documents from vector store")
+
     def rebuild(self) -> None:
         logger.info("Rebuilding vector store...")
         self._clear_persist_dir()
@@ -124,6 +137,7 @@ class VectorStoreManager:
 
         loader = GalayDocumentLoader()
         documents = loader.load_all()
+        self.build_report = dict(loader.last_stats)
         if not documents:
             logger.warning("No documents loaded — creating empty vector store")
             self._store = Chroma(
@@ -132,9 +146,11 @@ class VectorStoreManager:
             )
             return
 
+        documents = _unique_chunks(documents)
         logger.info(f"Creating vector store with {len(documents)} documents...")
         self._store = Chroma.from_documents(
             documents=documents,
+            ids=_chunk_ids(documents),
             embedding=self._embedding_mgr.get_embeddings(),
             persist_directory=self._persist_dir,
         )
@@ -143,3 +159,25 @@ class VectorStoreManager:
     def _ensure_ready(self) -> None:
         if self._store is None:
             raise VectorStoreError("Vector store not initialized — call initialize() first")
+
+
+def _chunk_ids(docs: List[Document]) -> List[str] | None:
+    """用 loader 生成的 chunk_id 作为 Chroma id；有文档缺 id 时交给 Chroma 随机生成"""
+    ids = [str(doc.metadata.get("chunk_id") or "") for doc in docs]
+    return ids if all(ids) else None
+
+
+def _unique_chunks(docs: List[Document]) -> List[Document]:
+    # 同一批次里 id 重复时 Chroma 会整批拒绝；chunk_id 含内容哈希，相同 id 即相同内容
+    seen: Set[str] = set()
+    unique: List[Document] = []
+    for doc in docs:
+        chunk_id = doc.metadata.get("chunk_id")
+        if chunk_id:
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+        unique.append(doc)
+    if len(unique) != len(docs):
+        logger.warning(f"Skipped {len(docs) - len(unique)} chunks with duplicate chunk_id")
+    return unique
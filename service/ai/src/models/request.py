@@ -7,8 +7,14 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = "default"
     use_memory: Optional[bool] = True
+    # 允许在检索置信度足够高时直接返回文档摘录（需同时开启 EXTRACTIVE_ANSWER_ENABLED）
+    allow_extractive: Optional[bool] = False
+    # 检索档位 fast | balanced | thorough（或 RETRIEVAL_PROFILES 中的自定义档位），为空时用默认档位
+    retrieval_profile: Optional[str] = None
 
 
 class SearchRequest(BaseModel):
     query: str
     k: Optional[int] = 3
+    # 联想搜索等对延迟敏感的场景可用 fast
+    retrieval_profile: Optional[str] = None
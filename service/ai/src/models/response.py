@@ -25,6 +25,8 @@ class ChatResponse(BaseModel):
     sources: List[SourceInfo] = Field(default_factory=list)
     blocks: List[ChatBlock] = Field(default_factory=list)
     session_id: Optional[str] = None
+    cached: bool = False
+    extractive: bool = False
     error: Optional[str] = None
 
 
@@ -0,0 +1,147 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？!！。.,，;；~～]+$")
+
+
+def normalize_query(text: str) -> str:
+    """缓存键：NFKC（全角转半角）+ 小写 + 合并空白 + 去掉句尾标点"""
+    normalized = unicodedata.normalize("NFKC", str(text or "")).lower().strip()
+    normalized = _WHITESPACE_RE.sub(" ", normalized)
+    return _TRAILING_PUNCT_RE.sub("", normalized)
+
+
+class _CacheEntry:
+    __slots__ = ("result", "vector", "generation")
+
+    def __init__(self, result: Dict[str, Any], vector: Optional[np.ndarray], generation: int):
+        self.result = result
+        self.vector = vector
+        self.generation = generation
+
+
+class AnswerCache:
+    """无记忆问答的答案缓存（LRU）
+
+    命中规则：先按规范化问题精确匹配；未命中且提供了问题向量时，
+    按余弦相似度找最近邻，超过阈值即命中。条目绑定索引代数，索引重载后整体失效。
+    """
+
+    def __init__(self, max_entries: int, similarity_threshold: float):
+        self._max_entries = max(1, int(max_entries))
+        self._threshold = float(similarity_threshold)
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        # 近邻查询用的向量矩阵，条目变化后懒重建
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+
+    def get(self, key: str, generation: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry.result
+
+    def get_similar(self, vector: Sequence[float], generation: int) -> Optional[Dict[str, Any]]:
+        query = _unit_vector(vector)
+        if query is None:
+            return None
+        with self._lock:
+            matrix = self._ensure_matrix()
+            if matrix is None or matrix.shape[1] != query.shape[0]:
+                return None
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if float(scores[best]) < self._threshold:
+                return None
+            key = self._matrix_keys[best]
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry.result
+
+    def put(
+        self,
+        key: str,
+        generation: int,
+        result: Dict[str, Any],
+        vector: Optional[Sequence[float]] = None,
+    ) -> None:
+        entry = _CacheEntry(dict(result), _unit_vector(vector) if vector is not None else None, generation)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("chat.answer_cache.evicted")
+            self._matrix = None
+            metrics.set_gauge("chat.answer_cache.entries", len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+            metrics.set_gauge("chat.answer_cache.entries", 0)
+
+    def _ensure_matrix(self) -> Optional[np.ndarray]:
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items() if entry.vector is not None]
+            if not keys:
+                return None
+            self._matrix = np.vstack([self._entries[key].vector for key in keys])
+            self._matrix_keys = keys
+        return self._matrix
+
+
+def _unit_vector(vector: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+    if vector is None:
+        return None
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if array.ndim != 1 or norm == 0.0:
+        return None
+    return array / norm
+
+
+def lookup_answer(
+    cache: AnswerCache,
+    message: str,
+    generation: int,
+    embed: Optional[Callable[[str], List[float]]],
+) -> tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """返回 (命中结果, 问题向量)；向量在未命中时留给写入复用"""
+    key = normalize_query(message)
+    result = cache.get(key, generation)
+    if result is not None:
+        metrics.incr("chat.answer_cache.hit_exact")
+        return result, None
+
+    vector: Optional[List[float]] = None
+    if embed is not None:
+        try:
+            vector = embed(message)
+        except Exception as e:
+            logger.warning(f"Answer cache embedding failed, exact match only: {e}")
+        if vector is not None:
+            result = cache.get_similar(vector, generation)
+            if result is not None:
+                metrics.incr("chat.answer_cache.hit_semantic")
+                return result, vector
+
+    metrics.incr("chat.answer_cache.miss")
+    return None, vector
@@ -1,33 +1,58 @@
-from collections import OrderedDict
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from pathlib import Path
 import re
-from typing import Any, AsyncGenerator, Dict, List
+import threading
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List
 from urllib.parse import quote
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 
 from src.config import settings
+from src.core.deadline import Deadline, call_with_deadline, deadline_scope
+from src.core.llm import build_chat_model, build_fast_chat_model, stream_chat
 from src.core.markdown_blocks import markdown_to_blocks
 from src.core.markdown_normalizer import normalize_markdown_content
+from src.core.token_counter import count_message_tokens, count_tokens
 from src.core.vector_store import VectorStoreManager
+from src.services.answer_cache import AnswerCache, lookup_answer, normalize_query
+from src.services.history_window import (
+    SUMMARY_PROMPT,
+    build_summary_input,
+    entry_fingerprint,
+    pending_summary_entries,
+    split_history_by_budget,
+)
 from src.services.rag_service import (
     RAGService,
-    SYSTEM_PROMPT,
+    build_follow_up_query,
+    build_prompt_messages,
     format_context_docs,
     has_example_source,
+    is_topic_switch,
     is_usage_query,
+    merge_follow_up_results,
 )
-from src.utils.exceptions import ChatServiceError
+from src.services.model_router import ROUTE_FAST, ROUTE_STRONG, RoutedModel, RouteSignals, choose_model_route
+from src.services.retrieval_profiles import get_retrieval_profile
+from src.services.retrieval_reuse import SessionRetrievalCache
+from src.services.session_store import SessionStore, build_session_store
+from src.services.single_flight import SingleFlight, StreamSingleFlight
+from src.utils.exceptions import ChatServiceError, DeadlineExceededError
 from src.utils.logger import get_logger
+from src.utils.metrics import metrics
 
 logger = get_logger(__name__)
 
-MAX_SESSIONS = 100
-MAX_HISTORY_ROUNDS = 20
 STREAM_EMIT_MIN_CHARS = 16
 STREAM_EMIT_MAX_CHARS = 120
+# 流式事件的队列上限：接口层生产/消费队列与合并流的每个订阅者队列共用
+STREAM_QUEUE_MAXSIZE = 32
 USAGE_CODE_MIN_CONFIDENCE = 0.45
+_EMPTY_ANSWER_TEXT = "抱歉，模型返回了空内容，请稍后重试。"
+_EXTRACTIVE_ANSWER_LEAD = "以下内容摘自文档原文："
 
 _FORBIDDEN_SCHEDULER_APIS = (
     re.compile(r"\b(?:IoContext|IOContext)\s*::\s*GetInstance\s*\(\s*\)", re.IGNORECASE),
@@ -147,6 +172,10 @@ _SETUP_SECTION_TITLE_RE = re.compile(
 _MARKDOWN_SECTION_BOUNDARY_RE = re.compile(
     r"^(?:#{1,6}\s+.+|\d+\.\s+.+)$"
 )
+_EXTRACTIVE_QUERY_RE = re.compile(
+    r"(是什么|什么是|有哪些|包括哪些|包含哪些|是否支持|支持.{0,24}吗|介绍一下|概述|\bwhat\s+is\b|\bwhich\b|\boverview\b)",
+    re.IGNORECASE,
+)
 _IMPORT_REQUEST_RE = re.compile(r"(?:\bimport\b|模块|module|命名模块)", re.IGNORECASE)
 _INCLUDE_REQUEST_RE = re.compile(r"(?:#include|include 版本|头文件)", re.IGNORECASE)
 _REF_SECTION_TITLE_RE = re.compile(r"^(?:#{1,6}\s*)?(?:参考来源|引用来源)\s*[:：]?\s*$", re.IGNORECASE)
@@ -179,41 +208,89 @@ _GALAY_MODULE_TO_INCLUDE = {
 class ChatService:
     """对话服务（含会话记忆）"""
 
-    def __init__(self, vector_store: VectorStoreManager):
+    def __init__(self, vector_store: VectorStoreManager, session_store: SessionStore | None = None):
         self._vector_store = vector_store
-        self._rag = RAGService(vector_store)
-        self._llm = ChatOpenAI(
-            model=settings.MODEL_NAME,
-            temperature=settings.TEMPERATURE,
-            openai_api_key=settings.OPENAI_API_KEY,
-            openai_api_base=settings.OPENAI_API_BASE,
+        self._llm = RoutedModel(ROUTE_STRONG, build_chat_model())
+        # 有上游声明快模型（FAST_MODEL_NAME 或 LLM_UPSTREAMS 的 fast_model）时，简单查询与历史摘要走快模型
+        fast_llm = build_fast_chat_model()
+        self._fast_llm = RoutedModel(ROUTE_FAST, fast_llm) if fast_llm is not None else None
+        self._rag = RAGService(vector_store, llm=self._llm)
+        self._sessions = session_store or build_session_store()
+        # 滚动摘要在后台线程生成，请求路径只读取已缓存的摘要。
+        self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        # session_id -> 执行期间是否又有新轮次追加（需要再跑一次）
+        self._summary_inflight: Dict[str, bool] = {}
+        self._summary_lock = threading.Lock()
+        self._answer_cache = AnswerCache(
+            settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
         )
-        # session_id -> List[{"role": "user"|"assistant", "content": str}]
-        self._histories: OrderedDict[str, List[dict]] = OrderedDict()
+        # 每个会话最近一次检索的片段，追问时增量检索后合并
+        self._session_retrievals = SessionRetrievalCache(
+            settings.RETRIEVAL_REUSE_MAX_SESSIONS, settings.RETRIEVAL_REUSE_TTL_SECONDS
+        )
+        # 索引代数：热重载后递增，旧代数的缓存答案不再命中
+        self._index_generation = 0
+        # 同一问题并发到达时只跑一次检索 + LLM，键为 (索引代数, 规范化问题)
+        self._query_flight = SingleFlight("query")
+        self._query_stream_flight = StreamSingleFlight("query_stream", STREAM_QUEUE_MAXSIZE)
+
+    @property
+    def rag_service(self) -> RAGService:
+        return self._rag
+
+    def llm_upstream_health(self) -> Dict[str, Dict[str, Any]]:
+        health = self._llm.health()
+        if self._fast_llm is not None:
+            health.update({f"{ROUTE_FAST}/{name}": item for name, item in self._fast_llm.health().items()})
+        return health
 
     def on_index_reloaded(self) -> None:
+        self._index_generation += 1
+        self._answer_cache.clear()
+        self._session_retrievals.clear()
         self._rag.invalidate_cache()
 
     # ------------------------------------------------------------------
     # 公开接口
     # ------------------------------------------------------------------
-    def chat(self, message: str, session_id: str = "default") -> Dict[str, Any]:
+    def chat(
+        self,
+        message: str,
+        session_id: str = "default",
+        allow_extractive: bool = False,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
+    ) -> Dict[str, Any]:
         """带会话记忆的对话"""
         try:
-            docs_with_score = self._rag.retrieve_with_score(message, k=4)
+            history_snapshot = self._sessions.get_history(session_id)
+            docs_with_score = self._retrieve_for_session(
+                message, session_id, history_snapshot, deadline, retrieval_profile
+            )
             docs = [doc for doc, _ in docs_with_score]
             sources = _extract_sources(docs)
-            history_snapshot = list(self._histories.get(session_id, []))
-            messages = self._build_messages(message, docs, session_id)
+            extractive = self._try_extractive_answer(message, docs_with_score, history_snapshot, allow_extractive)
+            if extractive is not None:
+                self._append_history(session_id, message, extractive)
+                return {
+                    "success": True,
+                    "response": extractive,
+                    "blocks": _build_answer_blocks(extractive),
+                    "sources": sources,
+                    "session_id": session_id,
+                    "extractive": True,
+                }
+            messages = self._build_messages(message, docs, history_snapshot, session_id)
 
-            response = self._llm.invoke(messages)
+            llm = self._select_model(message, docs_with_score, history_snapshot)
+            response = llm.invoke(messages, deadline=deadline)
             answer = _normalize_answer_text(_extract_message_text(response), user_message=message)
             answer = _prune_setup_sections_for_followup(answer, message, history_snapshot)
             answer = _downgrade_answer_when_example_missing(answer, message, docs)
             answer = _enforce_confidence_gate_for_code(answer, message, docs_with_score)
             answer = _ensure_source_citations(answer, docs)
             if not answer.strip():
-                answer = "抱歉，模型返回了空内容，请稍后重试。"
+                answer = _EMPTY_ANSWER_TEXT
             blocks = _build_answer_blocks(answer)
 
             self._append_history(session_id, message, answer)
@@ -225,97 +302,198 @@ class ChatService:
                 "sources": sources,
                 "session_id": session_id,
             }
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             logger.error(f"Chat error: {e}")
             raise ChatServiceError(f"Chat failed: {e}")
 
     async def chat_stream(
-        self, message: str, session_id: str = "default"
+        self,
+        message: str,
+        session_id: str = "default",
+        allow_extractive: bool = False,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
     ) -> AsyncGenerator[dict, None]:
         """带会话记忆的流式对话"""
+        started_at = time.perf_counter()
         try:
-            docs_with_score = self._rag.retrieve_with_score(message, k=4)
+            history_snapshot = self._sessions.get_history(session_id)
+            docs_with_score = await asyncio.to_thread(
+                self._retrieve_for_session, message, session_id, history_snapshot, deadline, retrieval_profile
+            )
             docs = [doc for doc, _ in docs_with_score]
             sources = _extract_sources(docs)
-            history_snapshot = list(self._histories.get(session_id, []))
-            messages = self._build_messages(message, docs, session_id)
-
-            raw_answer_parts: List[str] = []
-            streamed_parts: List[str] = []
-            stream_buffer = ""
-            emitted_any = False
-
-            async for chunk in self._llm.astream(messages):
-                text = _extract_message_text(chunk)
-                if text:
-                    raw_answer_parts.append(text)
-                    stream_buffer += _sanitize_stream_fragment(text)
-                    while True:
-                        emit_piece, stream_buffer = _pop_stream_emit_piece(stream_buffer)
-                        if not emit_piece:
-                            break
-                        emitted_any = True
-                        streamed_parts.append(emit_piece)
-                        partial_text, partial_blocks = _build_stream_preview(streamed_parts, user_message=message)
-                        if partial_text:
-                            yield {"replace": partial_text, "blocks": partial_blocks, "partial": True}
-                        else:
-                            yield {"content": emit_piece}
-
-            raw_answer = "".join(raw_answer_parts)
-            if not raw_answer.strip():
-                # 部分 OpenAI 兼容实现可能在 stream 中不给 content，兜底一次同步调用。
-                fallback = self._llm.invoke(messages)
-                raw_answer = _extract_message_text(fallback).strip()
-                normalized_answer = _normalize_answer_text(raw_answer, user_message=message)
-                normalized_answer = _prune_setup_sections_for_followup(normalized_answer, message, history_snapshot)
-                normalized_answer = _downgrade_answer_when_example_missing(normalized_answer, message, docs)
-                normalized_answer = _enforce_confidence_gate_for_code(normalized_answer, message, docs_with_score)
-                normalized_answer = _ensure_source_citations(normalized_answer, docs)
-                if not normalized_answer:
-                    normalized_answer = "抱歉，模型返回了空内容，请稍后重试。"
-                answer_blocks = _build_answer_blocks(normalized_answer)
-                yield {"replace": normalized_answer, "blocks": answer_blocks}
-                answer = normalized_answer
-            else:
-                tail_piece = _finalize_stream_tail(stream_buffer)
-                if tail_piece:
-                    emitted_any = True
-                    streamed_parts.append(tail_piece)
-                    partial_text, partial_blocks = _build_stream_preview(streamed_parts, user_message=message)
-                    if partial_text:
-                        yield {"replace": partial_text, "blocks": partial_blocks, "partial": True}
-                    else:
-                        yield {"content": tail_piece}
-
-                normalized_answer = _normalize_answer_text(raw_answer, user_message=message)
-                normalized_answer = _prune_setup_sections_for_followup(normalized_answer, message, history_snapshot)
-                normalized_answer = _downgrade_answer_when_example_missing(normalized_answer, message, docs)
-                normalized_answer = _enforce_confidence_gate_for_code(normalized_answer, message, docs_with_score)
-                normalized_answer = _ensure_source_citations(normalized_answer, docs)
-                if not normalized_answer:
-                    normalized_answer = "抱歉，模型返回了空内容，请稍后重试。"
-                answer_blocks = _build_answer_blocks(normalized_answer)
-
-                # 防止清洗后无可显示内容时流为空，兜底补发标准分块文本。
-                if not emitted_any:
-                    yield {"replace": normalized_answer, "blocks": answer_blocks}
-                else:
-                    # 统一规则最终落地：始终以规范化后的全文覆盖流式中间态。
-                    yield {"replace": normalized_answer, "blocks": answer_blocks}
-                answer = normalized_answer
+            extractive = self._try_extractive_answer(message, docs_with_score, history_snapshot, allow_extractive)
+            if extractive is not None:
+                blocks = _build_answer_blocks(extractive)
+                _log_first_token("memory", started_at)
+                yield {"replace": extractive, "blocks": blocks}
+                self._append_history(session_id, message, extractive)
+                yield {"done": True, "sources": sources, "blocks": blocks, "extractive": True}
+                return
+            messages = self._build_messages(message, docs, history_snapshot, session_id)
+            llm = self._select_model(message, docs_with_score, history_snapshot)
+
+            async def _llm_text_stream() -> AsyncGenerator[str, None]:
+                async with aclosing(stream_chat(llm, messages, deadline)) as chunks:
+                    async for chunk in chunks:
+                        yield _extract_message_text(chunk)
+
+            async def _fallback() -> str:
+                return _extract_message_text(await llm.ainvoke(messages, deadline=deadline))
+
+            final: Dict[str, Any] = {}
+            # 显式关闭内层生成器，客户端断开时才能把取消传到上游 LLM 流。
+            async with aclosing(
+                self._stream_answer(
+                    message,
+                    docs_with_score,
+                    history_snapshot,
+                    _llm_text_stream(),
+                    _fallback,
+                    mode="memory",
+                    started_at=started_at,
+                )
+            ) as events:
+                async for event in events:
+                    final = event
+                    yield event
+
+            self._append_history(session_id, message, final["replace"])
+
+            yield {"done": True, "sources": sources, "blocks": final["blocks"]}
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            yield {"error": str(e)}
 
-            self._append_history(session_id, message, answer)
+    async def query_stream(
+        self,
+        message: str,
+        allow_extractive: bool = False,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
+    ) -> AsyncGenerator[dict, None]:
+        """无记忆的流式问答；相同问题并发时订阅同一上游流（按首个请求的截止时间执行）"""
+        profile = get_retrieval_profile(retrieval_profile).name
+        key = (self._index_generation, normalize_query(message), allow_extractive, profile)
+        async with aclosing(
+            self._query_stream_flight.subscribe(
+                key, lambda: self._query_stream_uncoalesced(message, allow_extractive, deadline, profile)
+            )
+        ) as events:
+            async for event in events:
+                yield event
+
+    def query(
+        self,
+        message: str,
+        allow_extractive: bool = False,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
+    ) -> Dict[str, Any]:
+        """无记忆的单次问答；相同问题并发时共享同一次结果（按首个请求的截止时间执行）"""
+        profile = get_retrieval_profile(retrieval_profile).name
+        key = (self._index_generation, normalize_query(message), allow_extractive, profile)
+        result, shared = self._query_flight.do(
+            key, lambda: self._query_uncoalesced(message, allow_extractive, deadline, profile)
+        )
+        return dict(result) if shared else result
+
+    async def _query_stream_uncoalesced(
+        self,
+        message: str,
+        allow_extractive: bool,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
+    ) -> AsyncGenerator[dict, None]:
+        """与 chat_stream 共用增量输出流程"""
+        started_at = time.perf_counter()
+        try:
+            cached, query_vector = await asyncio.to_thread(
+                call_with_deadline, deadline, self._lookup_cached_answer, message
+            )
+            if cached is not None:
+                _log_first_token("query", started_at)
+                yield {"replace": cached["response"], "blocks": cached["blocks"]}
+                yield {"done": True, "sources": cached["sources"], "blocks": cached["blocks"], "cached": True}
+                return
+            generation = self._index_generation
+
+            docs_with_score = await asyncio.to_thread(self._retrieve, message, deadline, retrieval_profile)
+            docs = [doc for doc, _ in docs_with_score]
+            if not docs:
+                answer = "抱歉，我在文档中没有找到相关信息。请尝试换个方式提问。"
+                blocks = _build_answer_blocks(answer)
+                _log_first_token("query", started_at)
+                yield {"replace": answer, "blocks": blocks}
+                yield {"done": True, "sources": [], "blocks": blocks}
+                return
+
+            extractive = self._try_extractive_answer(message, docs_with_score, [], allow_extractive)
+            if extractive is not None:
+                blocks = _build_answer_blocks(extractive)
+                _log_first_token("query", started_at)
+                yield {"replace": extractive, "blocks": blocks}
+                yield {"done": True, "sources": _extract_sources(docs), "blocks": blocks, "extractive": True}
+                return
+
+            llm = self._select_model(message, docs_with_score, [])
+
+            async def _rag_text_stream() -> AsyncGenerator[str, None]:
+                async with aclosing(self._rag.generate_stream(message, docs, llm, deadline)) as chunks:
+                    async for chunk in chunks:
+                        yield _coerce_text(chunk)
+
+            async def _fallback() -> str:
+                return await asyncio.to_thread(self._rag.generate, message, docs, llm, deadline)
+
+            final: Dict[str, Any] = {}
+            # 显式关闭内层生成器，客户端断开时才能把取消传到上游 LLM 流。
+            async with aclosing(
+                self._stream_answer(
+                    message,
+                    docs_with_score,
+                    [],
+                    _rag_text_stream(),
+                    _fallback,
+                    mode="query",
+                    started_at=started_at,
+                )
+            ) as events:
+                async for event in events:
+                    final = event
+                    yield event
 
-            yield {"done": True, "sources": sources, "blocks": answer_blocks}
+            sources = _extract_sources(docs)
+            self._store_cached_answer(
+                message,
+                generation,
+                {"success": True, "response": final["replace"], "blocks": final["blocks"], "sources": sources},
+                query_vector,
+            )
+            yield {"done": True, "sources": sources, "blocks": final["blocks"]}
         except Exception as e:
-            logger.error(f"Chat stream error: {e}")
+            logger.error(f"Query stream error: {e}")
             yield {"error": str(e)}
 
-    def query(self, message: str) -> Dict[str, Any]:
-        """无记忆的单次问答"""
+    def _query_uncoalesced(
+        self,
+        message: str,
+        allow_extractive: bool,
+        deadline: Deadline | None = None,
+        retrieval_profile: str | None = None,
+    ) -> Dict[str, Any]:
         try:
-            docs_with_score = self._rag.retrieve_with_score(message, k=4)
+            # 答案缓存查询同样要 embed 问题，受同一截止时间约束
+            with deadline_scope(deadline):
+                cached, query_vector = self._lookup_cached_answer(message)
+            if cached is not None:
+                return cached
+            generation = self._index_generation
+
+            docs_with_score = self._retrieve(message, deadline, retrieval_profile)
             docs = [doc for doc, _ in docs_with_score]
             if not docs:
                 return {
@@ -324,33 +502,237 @@ class ChatService:
                     "blocks": _build_answer_blocks("抱歉，我在文档中没有找到相关信息。请尝试换个方式提问。"),
                     "sources": [],
                 }
-            answer = _normalize_answer_text(self._rag.generate(message, docs), user_message=message)
+            extractive = self._try_extractive_answer(message, docs_with_score, [], allow_extractive)
+            if extractive is not None:
+                # 抽取式回答不写入答案缓存：缓存命中不区分请求是否允许抽取式。
+                return {
+                    "success": True,
+                    "response": extractive,
+                    "blocks": _build_answer_blocks(extractive),
+                    "sources": _extract_sources(docs),
+                    "extractive": True,
+                }
+            llm = self._select_model(message, docs_with_score, [])
+            answer = _normalize_answer_text(
+                self._rag.generate(message, docs, llm, deadline=deadline), user_message=message
+            )
             answer = _downgrade_answer_when_example_missing(answer, message, docs)
             answer = _enforce_confidence_gate_for_code(answer, message, docs_with_score)
             answer = _ensure_source_citations(answer, docs)
             blocks = _build_answer_blocks(answer)
             sources = _extract_sources(docs)
-            return {"success": True, "response": answer, "blocks": blocks, "sources": sources}
+            result = {"success": True, "response": answer, "blocks": blocks, "sources": sources}
+            self._store_cached_answer(message, generation, result, query_vector)
+            return result
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             logger.error(f"Query error: {e}")
             raise ChatServiceError(f"Query failed: {e}")
 
     def clear_session(self, session_id: str) -> None:
-        if session_id in self._histories:
-            del self._histories[session_id]
-            logger.info(f"Cleared memory for session: {session_id}")
+        self._sessions.clear(session_id)
+        self._session_retrievals.discard(session_id)
+        logger.info(f"Cleared memory for session: {session_id}")
 
     def get_active_sessions(self) -> List[str]:
-        return list(self._histories.keys())
+        return self._sessions.list_sessions()
 
     # ------------------------------------------------------------------
     # 内部
     # ------------------------------------------------------------------
-    def _build_messages(self, message: str, docs: list, session_id: str) -> list:
-        """构建 LLM 消息列表：system + context + history + user"""
+    async def _stream_answer(
+        self,
+        message: str,
+        docs_with_score: List[tuple],
+        history_snapshot: List[dict],
+        text_stream: AsyncGenerator[str, None],
+        fallback: Callable[[], Awaitable[str]],
+        *,
+        mode: str,
+        started_at: float,
+    ) -> AsyncGenerator[dict, None]:
+        """增量输出模型文本；最后一个事件总是规范化后的全文 {"replace", "blocks"}。"""
+        docs = [doc for doc, _ in docs_with_score]
+        raw_answer_parts: List[str] = []
+        streamed_parts: List[str] = []
+        stream_buffer = ""
+        first_token_logged = False
+
+        def _preview_event(piece: str) -> dict:
+            streamed_parts.append(piece)
+            partial_text, partial_blocks = _build_stream_preview(streamed_parts, user_message=message)
+            if partial_text:
+                return {"replace": partial_text, "blocks": partial_blocks, "partial": True}
+            return {"content": piece}
+
+        received_chunks = 0
+        upstream_done = False
+        try:
+            async for text in text_stream:
+                if not text:
+                    continue
+                received_chunks += 1
+                raw_answer_parts.append(text)
+                stream_buffer += _sanitize_stream_fragment(text)
+                while True:
+                    emit_piece, stream_buffer = _pop_stream_emit_piece(stream_buffer)
+                    if not emit_piece:
+                        break
+                    if not first_token_logged:
+                        first_token_logged = True
+                        _log_first_token(mode, started_at)
+                    yield _preview_event(emit_piece)
+
+            raw_answer = "".join(raw_answer_parts)
+            if not raw_answer.strip():
+                # 部分 OpenAI 兼容实现可能在 stream 中不给 content，兜底一次同步调用。
+                raw_answer = (await fallback()).strip()
+            else:
+                tail_piece = _finalize_stream_tail(stream_buffer)
+                if tail_piece:
+                    yield _preview_event(tail_piece)
+
+            upstream_done = True
+            if received_chunks:
+                metrics.observe("chat_stream.completion_chunks", received_chunks)
+            answer = _normalize_answer_text(raw_answer, user_message=message)
+            answer = _prune_setup_sections_for_followup(answer, message, history_snapshot)
+            answer = _downgrade_answer_when_example_missing(answer, message, docs)
+            answer = _enforce_confidence_gate_for_code(answer, message, docs_with_score)
+            answer = _ensure_source_citations(answer, docs)
+            if not answer:
+                answer = _EMPTY_ANSWER_TEXT
+
+            if not first_token_logged:
+                _log_first_token(mode, started_at)
+            # 统一规则最终落地：始终以规范化后的全文覆盖流式中间态。
+            yield {"replace": answer, "blocks": _build_answer_blocks(answer)}
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端断开：不再拉取剩余 token，也不做后处理。
+            if not upstream_done:
+                _record_stream_cancelled(mode, received_chunks)
+            raise
+        finally:
+            await text_stream.aclose()
+
+    def _retrieve(
+        self, message: str, deadline: Deadline | None, retrieval_profile: str | None
+    ) -> List[tuple]:
+        """按检索档位取回送入 prompt 的片段（片段数由档位的 context_k 决定）"""
+        profile = get_retrieval_profile(retrieval_profile)
+        return self._rag.retrieve_with_score(message, profile.context_k, deadline, profile.name)
+
+    def _retrieve_for_session(
+        self,
+        message: str,
+        session_id: str,
+        history: List[dict],
+        deadline: Deadline | None,
+        retrieval_profile: str | None,
+    ) -> List[tuple]:
+        """带会话的检索：追问时在上一轮片段基础上做一次窄召回并合并，不再整轮重新检索"""
+        profile = get_retrieval_profile(retrieval_profile)
+        generation = self._index_generation
+        started = time.perf_counter()
+        snapshot = None
+        if settings.RETRIEVAL_REUSE_ENABLED and _is_follow_up_question(message, history):
+            snapshot = self._session_retrievals.get(session_id, generation, profile.name)
+            if snapshot is not None and is_topic_switch(message, snapshot.query):
+                metrics.incr("chat.retrieval_reuse.topic_switch")
+                snapshot = None
+            metrics.incr("chat.retrieval_reuse.hit" if snapshot is not None else "chat.retrieval_reuse.miss")
+
+        if snapshot is None:
+            anchor = message
+            docs_with_score = self._rag.retrieve_with_score(message, profile.context_k, deadline, profile.name)
+            metrics.observe("chat.retrieval.full_ms", (time.perf_counter() - started) * 1000)
+        else:
+            # 短追问直接 embed 效果差：补上锚定问题的项目名，用 RETRIEVAL_REUSE_PROFILE 做窄召回
+            anchor = build_follow_up_query(message, snapshot.query)
+            fresh = self._rag.retrieve_with_score(
+                anchor, profile.context_k, deadline, settings.RETRIEVAL_REUSE_PROFILE
+            )
+            docs_with_score = merge_follow_up_results(fresh, snapshot.docs_with_score, profile.context_k)
+            metrics.observe("chat.retrieval.follow_up_ms", (time.perf_counter() - started) * 1000)
+
+        if settings.RETRIEVAL_REUSE_ENABLED and docs_with_score:
+            self._session_retrievals.put(session_id, generation, profile.name, anchor, docs_with_score)
+        return docs_with_score
+
+    def _try_extractive_answer(
+        self,
+        message: str,
+        docs_with_score: List[tuple],
+        history: List[dict],
+        allow_extractive: bool,
+    ) -> str | None:
+        """检索置信度足够高的定义/查询类问题直接摘录文档原文，不调用 LLM"""
+        if not (allow_extractive and settings.EXTRACTIVE_ANSWER_ENABLED) or not docs_with_score:
+            return None
+        metrics.incr("chat.extractive.considered")
+        if (
+            is_usage_query(message)
+            or _has_setup_intent(message)
+            or _is_follow_up_question(message, history)
+            or not _EXTRACTIVE_QUERY_RE.search(str(message or ""))
+        ):
+            metrics.incr("chat.extractive.skipped_query")
+            return None
+        confidence = _compute_evidence_confidence(docs_with_score)
+        if confidence < settings.EXTRACTIVE_ANSWER_MIN_CONFIDENCE:
+            metrics.incr("chat.extractive.skipped_confidence")
+            return None
+        answer = _build_extractive_answer([doc for doc, _ in docs_with_score])
+        if not answer:
+            return None
+        metrics.incr("chat.extractive.fired")
+        logger.info(f"Extractive answer served: confidence={confidence:.2f}")
+        return answer
+
+    def _select_model(self, message: str, docs_with_score: List[tuple], history: List[dict]) -> RoutedModel:
+        if self._fast_llm is None:
+            return self._llm
+        route, reason = choose_model_route(
+            RouteSignals(
+                chars=len(str(message or "").strip()),
+                usage_query=is_usage_query(message),
+                setup_intent=_has_setup_intent(message),
+                follow_up=_is_follow_up_question(message, history),
+                confidence=_compute_evidence_confidence(docs_with_score),
+            )
+        )
+        metrics.incr(f"chat.model_route.decisions.{reason}")
+        return self._fast_llm if route == ROUTE_FAST else self._llm
+
+    def _lookup_cached_answer(self, message: str) -> tuple[Dict[str, Any] | None, List[float] | None]:
+        if not settings.ANSWER_CACHE_ENABLED:
+            return None, None
+        embed = self._vector_store.embed_query if settings.ANSWER_CACHE_SEMANTIC_ENABLED else None
+        result, query_vector = lookup_answer(self._answer_cache, message, self._index_generation, embed)
+        if result is None:
+            return None, query_vector
+        return {**result, "cached": True}, query_vector
+
+    def _store_cached_answer(
+        self,
+        message: str,
+        generation: int,
+        result: Dict[str, Any],
+        query_vector: List[float] | None,
+    ) -> None:
+        # 生成期间索引已重载的答案、兜底空回答都不缓存。
+        if not settings.ANSWER_CACHE_ENABLED or generation != self._index_generation:
+            return
+        if not result.get("response") or result["response"] == _EMPTY_ANSWER_TEXT:
+            return
+        self._answer_cache.put(normalize_query(message), generation, result, query_vector)
+
+    def _build_messages(self, message: str, docs: list, history: List[dict], session_id: str) -> list:
+        """构建 LLM 消息列表：system + history + (context + user)，布局见 build_prompt_messages"""
+        recent, summary_text = self._window_history(session_id, history)
         context = format_context_docs(docs)
         guardrail = ""
-        history = self._histories.get(session_id, [])
         if is_usage_query(message) and not has_example_source(docs):
             guardrail = (
                 "\n补充约束：当前检索上下文没有命中 demo/example/test/快速开始等示例来源。"
@@ -361,47 +743,109 @@ class ChatService:
                 "\n补充约束：这是对上一轮的追问。默认沿用上一轮已给出的环境要求和安装步骤，"
                 "除非用户明确要求重述；回答只保留与本次追问直接相关的新增信息。"
             )
-
-        system_content = f"""{SYSTEM_PROMPT}
-{guardrail}
-
-请基于以下文档内容回答用户问题：
-
-{context}"""
-
-        messages = [SystemMessage(content=system_content)]
-
-        # 追加历史对话
-        for entry in history:
-            if entry["role"] == "user":
-                messages.append(HumanMessage(content=entry["content"]))
-            else:
-                messages.append(AIMessage(content=entry["content"]))
-
-        messages.append(HumanMessage(content=message))
+        if summary_text:
+            guardrail += f"\n\n此前对话摘要（较早轮次已压缩）：\n{summary_text}"
+
+        # 历史对话（按 token 预算裁剪后的最近轮次）
+        history_messages = [
+            HumanMessage(content=entry["content"]) if entry["role"] == "user" else AIMessage(content=entry["content"])
+            for entry in recent
+        ]
+        messages = build_prompt_messages(message, context, guardrail, history_messages)
+
+        prompt_tokens = count_message_tokens(messages)
+        metrics.observe("chat.prompt_tokens", prompt_tokens)
+        metrics.observe("chat.history_tokens", count_message_tokens(recent) + count_tokens(summary_text))
+        metrics.incr("chat.prompt_tokens_total", prompt_tokens)
+        logger.debug(
+            f"Chat prompt: session={session_id} prompt_tokens={prompt_tokens} "
+            f"history_entries={len(recent)}/{len(history)} summary={'yes' if summary_text else 'no'}"
+        )
         return messages
 
-    def _append_history(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
-        """追加对话记录，维护 LRU 淘汰和轮数限制"""
-        if session_id in self._histories:
-            # 移到末尾（LRU）
-            self._histories.move_to_end(session_id)
-        else:
-            # 淘汰最旧的 session
-            if len(self._histories) >= MAX_SESSIONS:
-                evicted = next(iter(self._histories))
-                del self._histories[evicted]
-                logger.info(f"Evicted oldest session: {evicted}")
-            self._histories[session_id] = []
+    def _window_history(self, session_id: str, history: List[dict]) -> tuple[List[dict], str]:
+        """按 HISTORY_TOKEN_BUDGET 保留最近轮次，更早的轮次由滚动摘要代替"""
+        older, recent = split_history_by_budget(history, settings.HISTORY_TOKEN_BUDGET)
+        if not older:
+            return recent, ""
+        metrics.observe("chat.history_tokens_trimmed", count_message_tokens(older))
+        if not settings.HISTORY_SUMMARY_ENABLED:
+            return recent, ""
+        summary = self._sessions.get_summary(session_id)
+        if summary is None:
+            metrics.incr("chat.history_summary.miss")
+            return recent, ""
+        return recent, str(summary.get("text", ""))
 
-        history = self._histories[session_id]
-        history.append({"role": "user", "content": user_msg})
-        history.append({"role": "assistant", "content": assistant_msg})
-
-        # 保留最近 N 轮（每轮 2 条）
-        max_entries = MAX_HISTORY_ROUNDS * 2
-        if len(history) > max_entries:
-            self._histories[session_id] = history[-max_entries:]
+    def _append_history(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
+        """追加对话记录；条数上限、TTL 与淘汰由会话存储负责"""
+        self._sessions.append_turn(session_id, user_msg, assistant_msg)
+        if settings.HISTORY_SUMMARY_ENABLED:
+            self._schedule_summary_refresh(session_id)
+
+    def _schedule_summary_refresh(self, session_id: str) -> None:
+        with self._summary_lock:
+            if session_id in self._summary_inflight:
+                self._summary_inflight[session_id] = True
+                return
+            self._summary_inflight[session_id] = False
+        self._summary_executor.submit(self._refresh_summary, session_id)
+
+    def _refresh_summary(self, session_id: str) -> None:
+        """把预算外、尚未覆盖的较早轮次并入滚动摘要（后台线程执行）"""
+        try:
+            history = self._sessions.get_history(session_id)
+            older, _ = split_history_by_budget(history, settings.HISTORY_TOKEN_BUDGET)
+            if not older:
+                return
+            summary = self._sessions.get_summary(session_id)
+            pending = pending_summary_entries(older, summary)
+            if not pending:
+                return
+
+            started_at = time.perf_counter()
+            previous = str(summary.get("text", "")) if summary else ""
+            response = (self._fast_llm or self._llm).invoke(
+                [
+                    SystemMessage(content=SUMMARY_PROMPT.format(max_chars=settings.HISTORY_SUMMARY_MAX_CHARS)),
+                    HumanMessage(content=build_summary_input(previous, pending)),
+                ]
+            )
+            text = _extract_message_text(response).strip()[: settings.HISTORY_SUMMARY_MAX_CHARS]
+            if not text:
+                return
+            self._sessions.set_summary(session_id, {"text": text, "covered": entry_fingerprint(older[-1])})
+            metrics.incr("chat.history_summary.refreshed")
+            metrics.observe("chat.history_summary.latency_ms", (time.perf_counter() - started_at) * 1000)
+        except Exception as e:
+            metrics.incr("chat.history_summary.failed")
+            logger.warning(f"History summary refresh failed: session={session_id} error={e}")
+        finally:
+            with self._summary_lock:
+                rerun = self._summary_inflight.pop(session_id, False)
+            if rerun:
+                self._schedule_summary_refresh(session_id)
+
+
+def _log_first_token(mode: str, started_at: float) -> None:
+    """记录首个可见内容的耗时（含检索），用于对比记忆/无记忆两种流式模式。"""
+    ttft_ms = (time.perf_counter() - started_at) * 1000
+    metrics.observe(f"chat_stream.ttft_ms.{mode}", ttft_ms)
+    logger.info(f"Chat stream first token: mode={mode} ttft_ms={ttft_ms:.1f}")
+
+
+def _record_stream_cancelled(mode: str, received_chunks: int) -> None:
+    """记录被取消的流；节省的 token 按已完成流的平均分片数估算（OpenAI 流式约 1 token/分片）。"""
+    expected_chunks = metrics.mean("chat_stream.completion_chunks", default=float(received_chunks))
+    saved = max(0, round(expected_chunks) - received_chunks)
+    metrics.incr("chat_stream.cancelled")
+    metrics.incr(f"chat_stream.cancelled.{mode}")
+    metrics.incr("chat_stream.cancelled_tokens_received", received_chunks)
+    metrics.incr("chat_stream.cancelled_tokens_saved_estimate", saved)
+    logger.info(
+        f"Chat stream cancelled by client: mode={mode} received_chunks={received_chunks} "
+        f"saved_tokens_estimate={saved}"
+    )
 
 
 def _extract_sources(documents: list) -> List[Dict[str, str]]:
@@ -1271,6 +1715,43 @@ def _reindent_cpp_code(code: str) -> str:
     return "\n".join(output).rstrip()
 
 
+def _build_extractive_answer(docs: list) -> str:
+    parts: List[str] = []
+    used: list = []
+    budget = max(200, settings.EXTRACTIVE_ANSWER_MAX_CHARS)
+    for doc in docs[: max(1, settings.EXTRACTIVE_ANSWER_MAX_CHUNKS)]:
+        text = normalize_markdown_content(str(doc.page_content or ""), target="answer", strip_decorative=True).strip()
+        if not text:
+            continue
+        text = _truncate_markdown(text, budget)
+        parts.append(text)
+        used.append(doc)
+        budget -= len(text)
+        if budget <= 0:
+            break
+    if not parts:
+        return ""
+    answer = "\n\n".join([_EXTRACTIVE_ANSWER_LEAD, *parts])
+    return _ensure_source_citations(answer, used)
+
+
+def _truncate_markdown(text: str, limit: int) -> str:
+    """按段落截断，不切断代码块"""
+    if len(text) <= limit:
+        return text
+    kept: List[str] = []
+    size = 0
+    for paragraph in text.split("\n\n"):
+        if kept and size + len(paragraph) > limit:
+            break
+        kept.append(paragraph)
+        size += len(paragraph) + 2
+    result = "\n\n".join(kept)
+    if result.count("```") % 2:
+        result = f"{result}\n```"
+    return result
+
+
 def _build_answer_blocks(text: str) -> List[Dict[str, Any]]:
     if not text:
         return []
@@ -0,0 +1,55 @@
+import hashlib
+from typing import List, Optional, Tuple
+
+from src.core.token_counter import count_message_tokens
+
+SUMMARY_PROMPT = """你负责压缩 Galay 文档问答的历史对话，供后续轮次作为上下文。
+要求：
+- 保留用户关注的组件、已确认的环境/安装结论、已给出的关键 API 与结论。
+- 去掉寒暄、重复内容与完整代码，只保留 API/类名。
+- 使用简体中文要点列表，不超过 {max_chars} 字。"""
+
+
+def entry_fingerprint(entry: dict) -> str:
+    """历史记录指纹：会话存储裁剪后下标会变，用内容定位摘要覆盖到哪一条。"""
+    raw = f"{entry.get('role', '')}\n{entry.get('content', '')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def split_history_by_budget(history: List[dict], budget_tokens: int) -> Tuple[List[dict], List[dict]]:
+    """从最新一轮往前按 token 预算保留完整轮次，返回 (较早部分, 保留部分)。
+
+    最新一轮总是保留（追问最常引用它），即使单轮已超出预算。
+    """
+    cut = len(history)
+    used = 0
+    while cut >= 2:
+        cost = count_message_tokens(history[cut - 2 : cut])
+        if used + cost > budget_tokens and cut < len(history):
+            break
+        used += cost
+        cut -= 2
+    return history[:cut], history[cut:]
+
+
+def pending_summary_entries(older: List[dict], summary: Optional[dict]) -> List[dict]:
+    """较早部分中尚未被摘要覆盖的记录"""
+    if not summary:
+        return list(older)
+    covered = summary.get("covered")
+    for index in range(len(older) - 1, -1, -1):
+        if entry_fingerprint(older[index]) == covered:
+            return older[index + 1 :]
+    # 覆盖点已被存储裁剪掉：摘要比现存记录更旧，全部重新纳入。
+    return list(older)
+
+
+def build_summary_input(previous: str, entries: List[dict]) -> str:
+    lines: List[str] = []
+    if previous:
+        lines.append(f"已有摘要：\n{previous}\n")
+    lines.append("新增对话：")
+    for entry in entries:
+        speaker = "用户" if entry.get("role") == "user" else "助手"
+        lines.append(f"{speaker}：{entry.get('content', '')}")
+    return "\n".join(lines)
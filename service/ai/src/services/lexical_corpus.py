@@ -0,0 +1,182 @@
+import bisect
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from langchain_core.documents import Document
+
+from src.core.near_dedup import alternate_projects
+
+_SEPARATOR = b"\x00"
+_INCLUDE = ["documents", "metadatas"]
+
+
+class LexicalCorpus:
+    """关键词兜底用的列式语料
+
+    全部 chunk 的小写正文按 UTF-8 拼成一个缓冲区（chunk 之间以 \\0 分隔），配合偏移数组定位；
+    project / source 去重后按整数编号存放，示例来源权重按 source 预先算好；
+    近重复去重并入的其他项目（alternate_projects）只有少数行有，按行号稀疏存放。
+    不保留原文与 metadata，命中的前几条按 Chroma id 回库取出后再构造 Document。
+    """
+
+    __slots__ = (
+        "_ids",
+        "_text",
+        "_offsets",
+        "_project_ids",
+        "_alternate_project_ids",
+        "_source_ids",
+        "_projects",
+        "_sources",
+        "_source_example_boosts",
+    )
+
+    def __init__(self) -> None:
+        self._ids: List[str] = []
+        self._text = bytearray()
+        self._offsets = array("Q", [0])
+        self._project_ids = array("I")
+        self._alternate_project_ids: Dict[int, Tuple[int, ...]] = {}
+        self._source_ids = array("I")
+        self._projects: List[str] = []
+        self._sources: List[str] = []
+        self._source_example_boosts = array("d")
+
+    @classmethod
+    def load(
+        cls, collection: Any, page_size: int, example_boost: Callable[[str], float]
+    ) -> "LexicalCorpus":
+        """按页读取 collection（limit/offset），边读边写入列式缓冲区"""
+        corpus = cls()
+        project_index: Dict[str, int] = {}
+        source_index: Dict[str, int] = {}
+        page_size = max(1, int(page_size))
+        offset = 0
+        previous_first: Any = None
+        while True:
+            payload = collection.get(include=_INCLUDE, limit=page_size, offset=offset)
+            ids = payload.get("ids", []) or []
+            # 忽略 offset 的实现会重复返回同一页
+            if not ids or ids[0] == previous_first:
+                break
+            previous_first = ids[0]
+            documents = payload.get("documents", []) or []
+            metadatas = payload.get("metadatas", []) or []
+            for idx, chroma_id in enumerate(ids):
+                content = documents[idx] if idx < len(documents) else ""
+                meta = metadatas[idx] if idx < len(metadatas) and metadatas[idx] else {}
+                corpus._append(
+                    str(chroma_id), str(content or ""), meta, project_index, source_index, example_boost
+                )
+            # 不支持分页的实现会一次返回全部结果
+            if len(ids) != page_size:
+                break
+            offset += page_size
+        return corpus
+
+    def _append(
+        self,
+        chroma_id: str,
+        content: str,
+        meta: Dict[str, Any],
+        project_index: Dict[str, int],
+        source_index: Dict[str, int],
+        example_boost: Callable[[str], float],
+    ) -> None:
+        project_id = self._intern_project(str(meta.get("project", "")).lower(), project_index)
+        alternates = tuple(
+            self._intern_project(project, project_index) for project in alternate_projects(meta)
+        )
+        source = str(meta.get("source", "")).lower()
+        source_id = source_index.get(source)
+        if source_id is None:
+            source_id = source_index[source] = len(self._sources)
+            self._sources.append(source)
+            self._source_example_boosts.append(example_boost(source))
+
+        if alternates:
+            self._alternate_project_ids[len(self._ids)] = alternates
+        self._ids.append(chroma_id)
+        self._project_ids.append(project_id)
+        self._source_ids.append(source_id)
+        self._text += content.lower().encode("utf-8").replace(_SEPARATOR, b" ")
+        self._text += _SEPARATOR
+        self._offsets.append(len(self._text))
+
+    def _intern_project(self, project: str, project_index: Dict[str, int]) -> int:
+        project_id = project_index.get(project)
+        if project_id is None:
+            project_id = project_index[project] = len(self._projects)
+            self._projects.append(project)
+        return project_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        """列式缓冲区大小（不含 id 字符串），用于 /metrics"""
+        arrays = (self._offsets, self._project_ids, self._source_ids, self._source_example_boosts)
+        return len(self._text) + sum(a.itemsize * len(a) for a in arrays)
+
+    @property
+    def sources(self) -> List[str]:
+        """去重后的小写 source，下标即 source_id"""
+        return self._sources
+
+    def project_id(self, project: str | None) -> int:
+        """小写项目名对应的编号，不存在时返回 -1"""
+        if not project:
+            return -1
+        try:
+            return self._projects.index(project)
+        except ValueError:
+            return -1
+
+    def row_project_id(self, row: int) -> int:
+        return self._project_ids[row]
+
+    def row_matches_project(self, row: int, project_id: int) -> bool:
+        """该行属于此项目，或是去重时并入了此项目副本的保留 chunk"""
+        return self._project_ids[row] == project_id or project_id in self._alternate_project_ids.get(row, ())
+
+    def row_source_id(self, row: int) -> int:
+        return self._source_ids[row]
+
+    def source_example_boost(self, source_id: int) -> float:
+        return self._source_example_boosts[source_id]
+
+    def term_hits(self, terms: Iterable[str]) -> Dict[int, int]:
+        """每个词项在缓冲区里逐个查找出现位置，映射回 chunk 行号；返回 行号 -> 命中词项数"""
+        hits: Dict[int, int] = {}
+        text, offsets = self._text, self._offsets
+        for term in terms:
+            needle = str(term).lower().encode("utf-8")
+            if not needle or _SEPARATOR in needle:
+                continue
+            pos = text.find(needle)
+            while pos >= 0:
+                row = bisect.bisect_right(offsets, pos) - 1
+                hits[row] = hits.get(row, 0) + 1
+                # 同一 chunk 只计一次，直接跳到下一个 chunk
+                pos = text.find(needle, offsets[row + 1])
+        return hits
+
+    def documents(self, collection: Any, rows: List[int]) -> Dict[int, Document]:
+        """按 Chroma id 取回指定行的原文与 metadata；已不在库里的行不返回"""
+        if not rows:
+            return {}
+        wanted = {self._ids[row]: row for row in rows}
+        payload = collection.get(ids=list(wanted), include=_INCLUDE)
+        ids = payload.get("ids", []) or []
+        documents = payload.get("documents", []) or []
+        metadatas = payload.get("metadatas", []) or []
+        docs: Dict[int, Document] = {}
+        for idx, chroma_id in enumerate(ids):
+            row = wanted.get(str(chroma_id))
+            if row is None:
+                continue
+            content = documents[idx] if idx < len(documents) else ""
+            meta = metadatas[idx] if idx < len(metadatas) and metadatas[idx] else {}
+            docs[row] = Document(page_content=str(content or ""), metadata=dict(meta))
+        return docs
@@ -0,0 +1,111 @@
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from src.config import settings
+from src.core.token_counter import count_message_tokens, count_tokens
+from src.utils.metrics import metrics
+
+ROUTE_FAST = "fast"
+ROUTE_STRONG = "strong"
+
+
+@dataclass(frozen=True)
+class RouteSignals:
+    chars: int
+    usage_query: bool
+    setup_intent: bool
+    follow_up: bool
+    confidence: float
+
+
+def choose_model_route(signals: RouteSignals) -> tuple[str, str]:
+    """按廉价信号选择模型，返回 (route, reason)
+
+    需要示例代码、环境搭建、依赖上下文的追问、长问题或检索证据不足时走强模型，
+    其余短查询（如“galay-redis 支持 pipeline 吗”）走快模型。
+    """
+    if signals.usage_query:
+        return ROUTE_STRONG, "usage_query"
+    if signals.setup_intent:
+        return ROUTE_STRONG, "setup_intent"
+    if signals.follow_up:
+        return ROUTE_STRONG, "follow_up"
+    if signals.chars > settings.MODEL_ROUTER_MAX_FAST_CHARS:
+        return ROUTE_STRONG, "long_query"
+    if signals.confidence < settings.MODEL_ROUTER_MIN_FAST_CONFIDENCE:
+        return ROUTE_STRONG, "low_confidence"
+    return ROUTE_FAST, "simple_lookup"
+
+
+class RoutedModel:
+    """给某条路由的模型加上延迟与 token 统计，接口与 LLMRouter 一致"""
+
+    def __init__(self, route: str, llm: Any):
+        self.route = route
+        self._llm = llm
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        return self._llm.health()
+
+    def invoke(self, messages: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = self._llm.invoke(messages, **kwargs)
+        self._record(messages, _usage(response), _message_content(response), started)
+        return response
+
+    async def ainvoke(self, messages: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = await self._llm.ainvoke(messages, **kwargs)
+        self._record(messages, _usage(response), _message_content(response), started)
+        return response
+
+    async def astream(self, messages: Any, **kwargs: Any) -> AsyncGenerator[Any, None]:
+        started = time.perf_counter()
+        first_at: Optional[float] = None
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        async with aclosing(self._llm.astream(messages, **kwargs)) as chunks:
+            async for chunk in chunks:
+                if first_at is None:
+                    first_at = time.perf_counter()
+                parts.append(_message_content(chunk))
+                # 开启 stream_usage 时用量在最后一个（空内容）分片上
+                usage = _usage(chunk) or usage
+                yield chunk
+        # 只统计完整结束的流；被取消/对冲落败的流不计入
+        if first_at is not None:
+            metrics.observe(f"chat.model_route.{self.route}.ttft_ms", (first_at - started) * 1000)
+        self._record(messages, usage, "".join(parts), started)
+
+    def _record(self, messages: Any, usage: Dict[str, Any], completion: str, started: float) -> None:
+        prompt_tokens = usage.get("input_tokens") or count_message_tokens(messages if isinstance(messages, list) else [])
+        completion_tokens = usage.get("output_tokens") or count_tokens(completion)
+        prefix = f"chat.model_route.{self.route}"
+        metrics.incr(f"{prefix}.requests")
+        metrics.incr(f"{prefix}.prompt_tokens", prompt_tokens)
+        metrics.incr(f"{prefix}.completion_tokens", completion_tokens)
+        metrics.observe(f"{prefix}.latency_ms", (time.perf_counter() - started) * 1000)
+        _record_prompt_cache(usage)
+
+
+def _record_prompt_cache(usage: Dict[str, Any]) -> None:
+    """记录上游返回的前缀缓存命中 token 数（上游未上报时跳过）"""
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    prompt_tokens = usage.get("input_tokens")
+    if cached is None or not prompt_tokens:
+        return
+    metrics.incr("chat.prompt_cache.reported")
+    metrics.incr("chat.prompt_cache.prompt_tokens", prompt_tokens)
+    metrics.incr("chat.prompt_cache.cached_tokens", cached)
+    metrics.observe("chat.prompt_cache.hit_ratio", cached / prompt_tokens)
+
+
+def _usage(message: Any) -> Dict[str, Any]:
+    return getattr(message, "usage_metadata", None) or {}
+
+
+def _message_content(message: Any) -> str:
+    content = getattr(message, "content", "")
+    return content if isinstance(content, str) else ""
@@ -1,13 +1,24 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import aclosing
+import heapq
 import re
-from typing import AsyncGenerator, Dict, List, Tuple
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, List, Sequence, Tuple
 
 from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
 from src.config import settings
+from src.core.deadline import Deadline, current_deadline, deadline_scope
+from src.core.llm import build_chat_model, stream_chat
+from src.core.near_dedup import alternate_projects
 from src.core.vector_store import VectorStoreManager
+from src.services.lexical_corpus import LexicalCorpus
+from src.services.retrieval_profiles import RetrievalProfile, get_retrieval_profile
+from src.utils.exceptions import ConfigurationError
 from src.utils.logger import get_logger
+from src.utils.metrics import metrics
 
 logger = get_logger(__name__)
 
@@ -90,43 +101,132 @@ _EXAMPLE_SOURCE_WEAK_HINTS = (
 )
 
 
+# 追问合并时上一轮片段的分数折扣：同等相关时优先本次增量召回到的片段
+FOLLOW_UP_CARRY_OVER_WEIGHT = 0.9
+
+PROMPT_LAYOUT_PREFIX_CACHE = "prefix_cache"
+PROMPT_LAYOUT_LEGACY = "legacy"
+_CONTEXT_INSTRUCTION = "请基于以下文档内容回答用户问题："
+
+
+def prompt_layout() -> str:
+    layout = settings.PROMPT_LAYOUT.strip().lower()
+    if layout not in (PROMPT_LAYOUT_PREFIX_CACHE, PROMPT_LAYOUT_LEGACY):
+        raise ConfigurationError(f"Unknown PROMPT_LAYOUT: {settings.PROMPT_LAYOUT}")
+    return layout
+
+
+def build_prompt_messages(
+    query: str,
+    context: str,
+    guardrail: str = "",
+    history: Sequence[BaseMessage] = (),
+) -> List[BaseMessage]:
+    """按 PROMPT_LAYOUT 组装消息列表
+
+    prefix_cache：system 只放固定的 SYSTEM_PROMPT，其后是历史轮次，检索上下文与补充约束
+    放进最后一条用户消息，使“system + 历史”成为字节稳定的前缀，便于上游前缀缓存命中。
+    legacy：旧布局，上下文与补充约束拼在 system 消息里。
+    """
+    if prompt_layout() == PROMPT_LAYOUT_LEGACY:
+        system_content = f"""{SYSTEM_PROMPT}
+{guardrail}
+
+{_CONTEXT_INSTRUCTION}
+
+{context}"""
+        return [SystemMessage(content=system_content), *history, HumanMessage(content=query)]
+
+    parts = [_CONTEXT_INSTRUCTION, context]
+    if guardrail.strip():
+        parts.append(guardrail.strip())
+    parts.append(f"用户问题：{query}")
+    return [SystemMessage(content=SYSTEM_PROMPT), *history, HumanMessage(content="\n\n".join(parts))]
+
+
 class RAGService:
     """RAG 检索增强生成服务"""
 
-    def __init__(self, vector_store: VectorStoreManager):
+    def __init__(self, vector_store: VectorStoreManager, llm: Any = None):
+        prompt_layout()
+        get_retrieval_profile()
         self._vector_store = vector_store
-        self._llm = ChatOpenAI(
-            model=settings.MODEL_NAME,
-            temperature=settings.TEMPERATURE,
-            openai_api_key=settings.OPENAI_API_KEY,
-            openai_api_base=settings.OPENAI_API_BASE,
+        self._llm = llm or build_chat_model()
+        self._lexical_corpus: LexicalCorpus | None = None
+        self._lexical_corpus_lock = threading.Lock()
+        # 关键词兜底与 query embedding + 向量检索并发执行
+        self._lexical_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.RETRIEVAL_LEXICAL_WORKERS), thread_name_prefix="lexical-fallback"
         )
-        self._lexical_cache: List[Document] | None = None
 
     def invalidate_cache(self) -> None:
-        self._lexical_cache = None
+        self._lexical_corpus = None
 
     def retrieve(self, query: str, k: int = 4) -> List[Document]:
         """检索相关文档片段（向量召回 + 关键词重排）"""
         return [doc for doc, _ in self.retrieve_with_score(query, k=k)]
 
-    def retrieve_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
-        """检索相关文档片段并返回重排分数（值越大相关性越高）"""
-        ranked = self._retrieve_ranked(query, k)
+    def retrieve_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        deadline: Deadline | None = None,
+        profile: str | None = None,
+    ) -> List[Tuple[Document, float]]:
+        """检索相关文档片段并返回重排分数（值越大相关性越高）；profile 为空时用默认检索档位"""
+        retrieval_profile = get_retrieval_profile(profile)
+        started = time.perf_counter()
+        ranked = self._retrieve_ranked(query, k, deadline or current_deadline(), retrieval_profile)
+        metrics.observe(
+            f"retrieval.profile.{retrieval_profile.name}.latency_ms", (time.perf_counter() - started) * 1000
+        )
         return [(doc, score) for doc, score in ranked]
 
-    def _retrieve_ranked(self, query: str, k: int) -> List[Tuple[Document, float]]:
+    def _retrieve_ranked(
+        self,
+        query: str,
+        k: int,
+        deadline: Deadline | None = None,
+        profile: RetrievalProfile | None = None,
+    ) -> List[Tuple[Document, float]]:
         if not query.strip():
             return []
 
+        profile = profile or get_retrieval_profile()
         project_hint = _extract_project_hint(query)
         usage_intent = is_usage_query(query)
-        candidate_k = min(max(k * 32, 64), 256)
-        dense = self._vector_store.search_with_score(query, k=candidate_k)
+        candidate_k = profile.candidate_k(k)
+        if deadline is not None:
+            deadline.check("retrieval")
+            # 预算不足时不做宽候选召回，只取重排所需的少量候选
+            if not deadline.allows("wide_fetch"):
+                candidate_k = min(candidate_k, max(k * 4, 16))
+        terms = _extract_query_terms(query)
+        # 关键词兜底：从全量 chunks 再做一次词项匹配，提升明确术语的命中率；预算不足时跳过。
+        run_lexical = (
+            bool(terms) and profile.lexical_fallback and (deadline is None or deadline.allows("lexical_fallback"))
+        )
+        lexical_args = (terms, project_hint, usage_intent, max(24, k * 8))
+        lexical_future: Future | None = None
+        if run_lexical and settings.RETRIEVAL_PARALLEL_STAGES:
+            # 只读内存语料，不依赖向量召回结果：先提交，与 embedding 网络往返重叠
+            lexical_future = self._lexical_executor.submit(self._timed_lexical_fallback, *lexical_args)
+
+        started = time.perf_counter()
+        try:
+            # 向量库内部调用 embed_query，deadline 经上下文变量传到 embedding
+            with deadline_scope(deadline):
+                dense = self._vector_store.search_with_score(query, k=candidate_k)
+        except BaseException:
+            if lexical_future is not None:
+                lexical_future.cancel()
+            raise
+        metrics.observe("retrieval.stage.dense_ms", (time.perf_counter() - started) * 1000)
         if not dense:
+            if lexical_future is not None:
+                lexical_future.cancel()
             return []
 
-        terms = _extract_query_terms(query)
         rank_map: Dict[str, Tuple[float, Document]] = {}
         for doc, distance in dense:
             dense_score = 1.0 / (1.0 + max(float(distance), 0.0))
@@ -135,12 +235,12 @@ class RAGService:
             project_boost = _project_hint_boost(doc, project_hint)
             example_boost = _example_source_boost(doc)
             # dense 为主，关键词为辅；避免被噪声关键词完全盖过语义召回。
-            example_weight = 0.18 if usage_intent else 0.08
+            example_weight = profile.usage_example_weight if usage_intent else profile.example_weight
             final_score = (
-                dense_score * 0.52
-                + lexical_score * 0.16
-                + source_boost * 0.04
-                + project_boost * 0.1
+                dense_score * profile.dense_weight
+                + lexical_score * profile.lexical_weight
+                + source_boost * profile.source_weight
+                + project_boost * profile.project_weight
                 + example_boost * example_weight
             )
             key = _doc_key(doc)
@@ -148,14 +248,14 @@ class RAGService:
             if old is None or final_score > old[0]:
                 rank_map[key] = (final_score, doc)
 
-        # 关键词兜底：从全量 chunks 再做一次词项匹配，提升明确术语的命中率。
-        if terms:
-            for score, doc in self._lexical_fallback(
-                terms,
-                project_hint,
-                usage_intent=usage_intent,
-                limit=max(24, k * 8),
-            ):
+        if run_lexical:
+            if lexical_future is not None:
+                waited = time.perf_counter()
+                fallback = lexical_future.result()
+                metrics.observe("retrieval.stage.lexical_wait_ms", (time.perf_counter() - waited) * 1000)
+            else:
+                fallback = self._timed_lexical_fallback(*lexical_args)
+            for score, doc in fallback:
                 key = _doc_key(doc)
                 old = rank_map.get(key)
                 if old is None or score > old[0]:
@@ -170,7 +270,7 @@ class RAGService:
             if key in seen:
                 continue
             seen.add(key)
-            if project_hint and str(doc.metadata.get("project", "")).lower() == project_hint:
+            if _project_hint_boost(doc, project_hint) > 0:
                 project_first.append((score, doc))
             else:
                 project_fallback.append((score, doc))
@@ -183,6 +283,15 @@ class RAGService:
                 break
         return unique
 
+    def _timed_lexical_fallback(
+        self, terms: List[str], project_hint: str | None, usage_intent: bool, limit: int
+    ) -> List[Tuple[float, Document]]:
+        started = time.perf_counter()
+        try:
+            return self._lexical_fallback(terms, project_hint, usage_intent=usage_intent, limit=limit)
+        finally:
+            metrics.observe("retrieval.stage.lexical_ms", (time.perf_counter() - started) * 1000)
+
     def _lexical_fallback(
         self,
         terms: List[str],
@@ -190,59 +299,79 @@ class RAGService:
         usage_intent: bool = False,
         limit: int = 24,
     ) -> List[Tuple[float, Document]]:
-        docs = self._get_all_docs_for_rerank()
-        if not docs:
+        if not terms:
+            return []
+        corpus = self._get_lexical_corpus()
+        hits = corpus.term_hits(terms)
+        if not hits:
             return []
 
-        scored: List[Tuple[float, Document]] = []
-        for doc in docs:
-            lex = _lexical_overlap_score(doc.page_content, terms)
-            if lex <= 0:
-                continue
-            source_boost = _source_path_boost(doc, terms)
-            project_boost = _project_hint_boost(doc, project_hint)
-            example_boost = _example_source_boost(doc)
-            example_weight = 0.15 if usage_intent else 0.05
+        project_id = corpus.project_id(project_hint)
+        example_weight = 0.15 if usage_intent else 0.05
+        source_boosts: Dict[int, float] = {}
+        scored: List[Tuple[float, int]] = []
+        for row, hit_count in hits.items():
+            source_id = corpus.row_source_id(row)
+            source_boost = source_boosts.get(source_id)
+            if source_boost is None:
+                source_boost = source_boosts[source_id] = _source_terms_boost(corpus.sources[source_id], terms)
+            project_boost = 1.0 if project_id >= 0 and corpus.row_matches_project(row, project_id) else 0.0
+            example_boost = corpus.source_example_boost(source_id)
+            lex = hit_count / len(terms)
             score = lex * 0.65 + source_boost * 0.08 + project_boost * 0.12 + example_boost * example_weight
-            scored.append((score, doc))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored[: max(1, limit)]
-
-    def _get_all_docs_for_rerank(self) -> List[Document]:
-        if self._lexical_cache is not None:
-            return self._lexical_cache
+            scored.append((score, row))
 
+        # 同分按语料顺序，与逐条扫描时的稳定排序一致
+        top = heapq.nlargest(max(1, limit), scored, key=lambda x: (x[0], -x[1]))
         try:
-            collection = self._vector_store.store._collection  # noqa: SLF001
-            payload = collection.get(include=["documents", "metadatas"])
-            documents = payload.get("documents", []) or []
-            metadatas = payload.get("metadatas", []) or []
-            docs: List[Document] = []
-            for idx, content in enumerate(documents):
-                meta = metadatas[idx] if idx < len(metadatas) and metadatas[idx] else {}
-                docs.append(Document(page_content=str(content or ""), metadata=dict(meta)))
-            self._lexical_cache = docs
-            return docs
+            docs = corpus.documents(self._vector_store.store._collection, [row for _, row in top])  # noqa: SLF001
         except Exception as exc:
-            logger.warning(f"lexical fallback cache build failed: {exc}")
-            self._lexical_cache = []
+            logger.warning(f"lexical fallback fetch failed: {exc}")
             return []
+        return [(score, docs[row]) for score, row in top if row in docs]
+
+    def _get_lexical_corpus(self) -> LexicalCorpus:
+        corpus = self._lexical_corpus
+        if corpus is not None:
+            return corpus
+
+        with self._lexical_corpus_lock:
+            if self._lexical_corpus is not None:
+                return self._lexical_corpus
+            started = time.perf_counter()
+            try:
+                collection = self._vector_store.store._collection  # noqa: SLF001
+                corpus = LexicalCorpus.load(collection, settings.RETRIEVAL_LEXICAL_PAGE_SIZE, _example_path_boost)
+            except Exception as exc:
+                logger.warning(f"lexical fallback corpus build failed: {exc}")
+                corpus = LexicalCorpus()
+            metrics.set_gauge("retrieval.lexical_corpus.docs", len(corpus))
+            metrics.set_gauge("retrieval.lexical_corpus.bytes", corpus.nbytes)
+            logger.info(
+                f"lexical corpus loaded: {len(corpus)} chunks, {corpus.nbytes / 1024 / 1024:.1f} MiB "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+            self._lexical_corpus = corpus
+            return corpus
 
-    def generate(self, query: str, context_docs: List[Document]) -> str:
-        """基于检索到的文档生成回答"""
+    def generate(
+        self, query: str, context_docs: List[Document], llm: Any = None, deadline: Deadline | None = None
+    ) -> str:
+        """基于检索到的文档生成回答；llm 为空时用默认模型"""
         messages = self._build_messages(query, context_docs)
-        response = self._llm.invoke(messages)
+        response = (llm or self._llm).invoke(messages, deadline=deadline)
         return response.content
 
     async def generate_stream(
-        self, query: str, context_docs: List[Document]
+        self, query: str, context_docs: List[Document], llm: Any = None, deadline: Deadline | None = None
     ) -> AsyncGenerator[str, None]:
         """流式生成回答"""
         messages = self._build_messages(query, context_docs)
-        async for chunk in self._llm.astream(messages):
-            if chunk.content:
-                yield chunk.content
+        # 调用方提前关闭时同步关闭上游流，停止继续生成。
+        async with aclosing(stream_chat(llm or self._llm, messages, deadline)) as chunks:
+            async for chunk in chunks:
+                if chunk.content:
+                    yield chunk.content
 
     def _build_messages(self, query: str, context_docs: List[Document]) -> list:
         """构建 LLM 消息列表"""
@@ -253,18 +382,7 @@ class RAGService:
                 "\n补充约束：当前检索上下文没有命中 demo/example/test/快速开始等示例来源。"
                 "你必须避免编造 API；若文档未给出可执行示例，明确说明“示例中未提供该写法”。"
             )
-
-        system_content = f"""{SYSTEM_PROMPT}
-{guardrail}
-
-请基于以下文档内容回答用户问题：
-
-{context}"""
-
-        return [
-            SystemMessage(content=system_content),
-            HumanMessage(content=query),
-        ]
+        return build_prompt_messages(query, context, guardrail)
 
 
 _ASCII_TERM_RE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_./:+-]{1,}")
@@ -304,6 +422,39 @@ def _extract_project_hint(query: str) -> str | None:
     return match.group(1).lower()
 
 
+def build_follow_up_query(query: str, anchor_query: str) -> str:
+    """追问的增量检索问句：追问没点名项目时，补上锚定问题中的项目名（“websocket 呢” -> “galay-http websocket 呢”）"""
+    hint = _extract_project_hint(anchor_query)
+    if not hint or _extract_project_hint(query):
+        return query
+    return f"{hint} {query}"
+
+
+def is_topic_switch(query: str, anchor_query: str) -> bool:
+    """追问点名了与锚定问题不同的项目（“那 galay-rpc 呢”），上一轮片段不再适用"""
+    hint = _extract_project_hint(query)
+    return bool(hint) and hint != _extract_project_hint(anchor_query)
+
+
+def merge_follow_up_results(
+    fresh: Sequence[Tuple[Document, float]],
+    previous: Sequence[Tuple[Document, float]],
+    k: int,
+    carry_over_weight: float = FOLLOW_UP_CARRY_OVER_WEIGHT,
+) -> List[Tuple[Document, float]]:
+    """合并增量检索与上一轮片段：上一轮分数按 carry_over_weight 打折，同一片段取较高分，按分数取前 k"""
+    best: Dict[str, Tuple[float, Document]] = {}
+    weighted = [(doc, score) for doc, score in fresh]
+    weighted += [(doc, float(score) * carry_over_weight) for doc, score in previous]
+    for doc, score in weighted:
+        key = _doc_key(doc)
+        old = best.get(key)
+        if old is None or score > old[0]:
+            best[key] = (float(score), doc)
+    ranked = sorted(best.values(), key=lambda item: item[0], reverse=True)
+    return [(doc, score) for score, doc in ranked[: max(1, k)]]
+
+
 def is_usage_query(text: str) -> bool:
     return bool(_USAGE_QUERY_RE.search(str(text or "")))
 
@@ -357,9 +508,12 @@ def _lexical_overlap_score(content: str, terms: List[str]) -> float:
 
 
 def _source_path_boost(doc: Document, terms: List[str]) -> float:
+    return _source_terms_boost(str(doc.metadata.get("source", "")).lower(), terms)
+
+
+def _source_terms_boost(source: str, terms: List[str]) -> float:
     if not terms:
         return 0.0
-    source = str(doc.metadata.get("source", "")).lower()
     if not source:
         return 0.0
     hits = 0
@@ -374,7 +528,10 @@ def _source_path_boost(doc: Document, terms: List[str]) -> float:
 
 
 def _example_source_boost(doc: Document) -> float:
-    source = str(doc.metadata.get("source", ""))
+    return _example_path_boost(str(doc.metadata.get("source", "")))
+
+
+def _example_path_boost(source: str) -> float:
     normalized = source.replace("\\", "/").lower()
     if not normalized:
         return 0.0
@@ -389,13 +546,20 @@ def _project_hint_boost(doc: Document, project_hint: str | None) -> float:
     if not project_hint:
         return 0.0
     project = str(doc.metadata.get("project", "")).lower()
-    return 1.0 if project == project_hint else 0.0
+    # 近重复去重后保留的 chunk 也代表被丢弃副本所属的项目
+    if project == project_hint or project_hint in alternate_projects(doc.metadata):
+        return 1.0
+    return 0.0
 
 
 def _doc_key(doc: Document) -> str:
     meta = doc.metadata or {}
+    chunk_id = meta.get("chunk_id")
+    if chunk_id:
+        return str(chunk_id)
     source = str(meta.get("source", ""))
-    chunk = str(meta.get("chunk", meta.get("chunk_id", meta.get("chunk_index", ""))))
-    if source or chunk:
+    chunk = str(meta.get("chunk", meta.get("chunk_index", "")))
+    if chunk:
         return f"{source}:{chunk}"
-    return str(hash(doc.page_content))
+    # 旧索引里的 chunk 没有序号：按内容区分，避免同一文件的片段合并成一条
+    return f"{source}:{hash(doc.page_content)}"
@@ -0,0 +1,264 @@
+import ipaddress
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from src.config import settings
+from src.services.session_store import _RespConnection
+from src.utils.exceptions import AIServiceError, ConfigurationError, RateLimitedError
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+MEMORY_BUCKETS_MAX_KEYS = 100_000
+SQLITE_PURGE_EVERY_CHECKS = 1024
+
+# HMGET 取出令牌数与上次更新时间，按速率补充后扣减；整个过程在 Redis 内原子执行。
+# 时间取 Redis 服务端的 TIME，各副本时钟漂移不会多发或少发令牌；
+# TIME 是非确定命令，Redis < 5 需先切到按命令复制（新版本里是空操作）
+_REDIS_TOKEN_BUCKET_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {allowed, tostring(tokens)}
+"""
+
+
+class TokenBucketBackend(ABC):
+    """令牌桶存储：take 扣减一个令牌，返回 (是否放行, 桶内剩余令牌)"""
+
+    # 是否涉及阻塞 I/O（需要放到线程里调用）
+    blocking = False
+
+    @abstractmethod
+    def take(self, key: str, rate_per_second: float, capacity: float) -> Tuple[bool, float]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class InMemoryTokenBuckets(TokenBucketBackend):
+    """进程内令牌桶：单 worker；超过 max_keys 时淘汰最久未访问的桶"""
+
+    def __init__(self, max_keys: int = MEMORY_BUCKETS_MAX_KEYS):
+        self._max_keys = max(1, max_keys)
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate_per_second: float, capacity: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, rate_per_second, capacity)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SqliteTokenBuckets(TokenBucketBackend):
+    """SQLite WAL 令牌桶：同一主机上的多个 worker 共享"""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self._path = str(Path(path).expanduser())
+        Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._checks = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "bucket_key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate_per_second: float, capacity: float) -> Tuple[bool, float]:
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE bucket_key = ?", (key,)
+                ).fetchone()
+                tokens = capacity if row is None else _refill(row[0], row[1], now, rate_per_second, capacity)
+                allowed = tokens >= 1.0
+                if allowed:
+                    tokens -= 1.0
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            raise AIServiceError(f"SQLite rate limiter failed: {e}") from e
+
+        self._checks += 1
+        if self._checks % SQLITE_PURGE_EVERY_CHECKS == 0:
+            self._purge(now - capacity / rate_per_second)
+        return allowed, tokens
+
+    def _purge(self, full_before: float) -> None:
+        # 早于 full_before 更新的桶已补满，与不存在等价
+        try:
+            self._connect().execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (full_before,))
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite rate limiter purge failed: {e}")
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisTokenBuckets(TokenBucketBackend):
+    """Redis 协议令牌桶：多副本共享，一次 EVAL 往返完成补充与扣减"""
+
+    blocking = True
+
+    def __init__(self, url: str, *, key_prefix: str = "galay:ratelimit:", timeout_seconds: float = 1.0):
+        self._conn = _RespConnection(url, timeout_seconds)
+        self._prefix = key_prefix
+
+    def take(self, key: str, rate_per_second: float, capacity: float) -> Tuple[bool, float]:
+        ttl = max(1, int(capacity / rate_per_second) + 1)
+        (reply,) = self._conn.pipeline(
+            [["EVAL", _REDIS_TOKEN_BUCKET_LUA, 1, f"{self._prefix}{key}", rate_per_second, capacity, ttl]]
+        )
+        allowed, tokens = reply
+        return bool(allowed), float(tokens)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class RateLimiter:
+    """按客户端键限流的令牌桶：平均 RATE_LIMIT_PER_MINUTE 次/分钟，允许突发 RATE_LIMIT_BURST 次
+
+    存储不可用时放行（fail open）并计数，避免限流组件本身拖垮对话接口。
+    """
+
+    def __init__(self, backend: TokenBucketBackend, per_minute: float, burst: int):
+        if per_minute <= 0:
+            raise ConfigurationError("RATE_LIMIT_PER_MINUTE must be positive")
+        self.backend = backend
+        self._rate = per_minute / 60.0
+        self._capacity = float(max(1, burst))
+
+    def check(self, scope: str, client_key: str) -> None:
+        """放行时返回；超限时抛 RateLimitedError（429 + Retry-After）"""
+        try:
+            allowed, tokens = self.backend.take(f"{scope}:{client_key}", self._rate, self._capacity)
+        except AIServiceError as e:
+            metrics.incr("rate_limit.backend_errors")
+            logger.warning(f"Rate limiter backend failed, allowing request: {e.message}")
+            return
+        if allowed:
+            metrics.incr(f"rate_limit.{scope}.allowed")
+            return
+        metrics.incr(f"rate_limit.{scope}.rejected")
+        retry_after = max(1, int((1.0 - tokens) / self._rate + 0.999))
+        raise RateLimitedError(f"Too many requests for {scope}, retry later", retry_after)
+
+
+def build_rate_limiter() -> RateLimiter:
+    """按 RATE_LIMIT_BACKEND 创建限流器"""
+    backend_name = settings.RATE_LIMIT_BACKEND.strip().lower()
+    if backend_name == "memory":
+        backend: TokenBucketBackend = InMemoryTokenBuckets()
+    elif backend_name == "sqlite":
+        logger.info(f"Rate limiter: sqlite path={settings.RATE_LIMIT_SQLITE_PATH}")
+        backend = SqliteTokenBuckets(settings.RATE_LIMIT_SQLITE_PATH)
+    elif backend_name == "redis":
+        logger.info("Rate limiter: redis")
+        backend = RedisTokenBuckets(settings.RATE_LIMIT_REDIS_URL)
+    else:
+        raise ConfigurationError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+    return RateLimiter(backend, settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST)
+
+
+# ------------------------------------------------------------------
+# 客户端标识
+# ------------------------------------------------------------------
+def parse_trusted_proxies(raw: str) -> List[ipaddress._BaseNetwork]:
+    networks: List[ipaddress._BaseNetwork] = []
+    for item in str(raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError as e:
+            raise ConfigurationError(f"Invalid RATE_LIMIT_TRUSTED_PROXIES entry {item!r}: {e}")
+    return networks
+
+
+def _is_trusted(address: str, trusted: Sequence[ipaddress._BaseNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def resolve_client_ip(
+    peer: str,
+    forwarded_for: Optional[str],
+    real_ip: Optional[str],
+    trusted: Sequence[ipaddress._BaseNetwork],
+) -> str:
+    """只在直连对端是受信代理时才采信 X-Forwarded-For / X-Real-IP
+
+    X-Forwarded-For 从右往左跳过受信代理，第一个非受信地址即真实客户端；
+    客户端自己伪造的左侧条目不会被采用。
+    """
+    if not trusted or not _is_trusted(peer, trusted):
+        return peer
+    if forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not _is_trusted(hop, trusted):
+                return hop
+        if hops:
+            return hops[0]
+    if real_ip and real_ip.strip():
+        return real_ip.strip()
+    return peer
@@ -0,0 +1,108 @@
+import dataclasses
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+
+from src.config import settings
+from src.utils.exceptions import ConfigurationError, InvalidRequestError
+
+PROFILE_FAST = "fast"
+PROFILE_BALANCED = "balanced"
+PROFILE_THOROUGH = "thorough"
+
+
+@dataclass(frozen=True)
+class RetrievalProfile:
+    """一组检索参数：候选召回宽度、关键词兜底、重排权重与对话上下文片段数"""
+
+    name: str
+    # 向量候选数 = clamp(k * candidate_multiplier, candidate_min, candidate_max)
+    candidate_multiplier: int = 32
+    candidate_min: int = 64
+    candidate_max: int = 256
+    lexical_fallback: bool = True
+    dense_weight: float = 0.52
+    lexical_weight: float = 0.16
+    source_weight: float = 0.04
+    project_weight: float = 0.1
+    example_weight: float = 0.08
+    # 用法/示例类问题的示例来源权重
+    usage_example_weight: float = 0.18
+    # 对话时送入 prompt 的片段数
+    context_k: int = 4
+
+    def candidate_k(self, k: int) -> int:
+        return min(max(k * self.candidate_multiplier, self.candidate_min), self.candidate_max)
+
+
+_BUILTIN_PROFILES: Dict[str, RetrievalProfile] = {
+    # 联想搜索：少量候选、不做全量关键词扫描
+    PROFILE_FAST: RetrievalProfile(
+        name=PROFILE_FAST,
+        candidate_multiplier=8,
+        candidate_min=16,
+        candidate_max=64,
+        lexical_fallback=False,
+        context_k=3,
+    ),
+    PROFILE_BALANCED: RetrievalProfile(name=PROFILE_BALANCED),
+    PROFILE_THOROUGH: RetrievalProfile(
+        name=PROFILE_THOROUGH,
+        candidate_multiplier=48,
+        candidate_min=96,
+        candidate_max=384,
+        context_k=6,
+    ),
+}
+
+_FIELDS = {field.name for field in dataclasses.fields(RetrievalProfile)} - {"name"}
+
+
+@lru_cache(maxsize=4)
+def _parse_profiles(raw: str) -> Dict[str, RetrievalProfile]:
+    profiles = dict(_BUILTIN_PROFILES)
+    if not raw.strip():
+        return profiles
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ConfigurationError(f"RETRIEVAL_PROFILES is not valid JSON: {e}")
+    if not isinstance(items, dict):
+        raise ConfigurationError("RETRIEVAL_PROFILES must be a JSON object of name -> overrides")
+
+    for name, overrides in items.items():
+        if not isinstance(overrides, dict):
+            raise ConfigurationError(f"RETRIEVAL_PROFILES[{name!r}] must be an object")
+        unknown = set(overrides) - _FIELDS
+        if unknown:
+            raise ConfigurationError(f"RETRIEVAL_PROFILES[{name!r}] has unknown fields: {sorted(unknown)}")
+        # 同名内置档位只覆盖给出的字段；新名称以 balanced 为基础
+        base = profiles.get(name) or _BUILTIN_PROFILES[PROFILE_BALANCED]
+        try:
+            profile = dataclasses.replace(base, name=name, **overrides)
+        except TypeError as e:
+            raise ConfigurationError(f"RETRIEVAL_PROFILES[{name!r}] is invalid: {e}")
+        if profile.candidate_min < 1 or profile.candidate_max < profile.candidate_min or profile.context_k < 1:
+            raise ConfigurationError(f"RETRIEVAL_PROFILES[{name!r}] has invalid candidate/context sizes")
+        profiles[name] = profile
+    return profiles
+
+
+def retrieval_profiles() -> Dict[str, RetrievalProfile]:
+    """内置档位 + RETRIEVAL_PROFILES（JSON 对象）中的覆盖/新增档位"""
+    profiles = _parse_profiles(settings.RETRIEVAL_PROFILES)
+    if settings.RETRIEVAL_DEFAULT_PROFILE not in profiles:
+        raise ConfigurationError(f"Unknown RETRIEVAL_DEFAULT_PROFILE: {settings.RETRIEVAL_DEFAULT_PROFILE}")
+    if settings.RETRIEVAL_REUSE_PROFILE not in profiles:
+        raise ConfigurationError(f"Unknown RETRIEVAL_REUSE_PROFILE: {settings.RETRIEVAL_REUSE_PROFILE}")
+    return profiles
+
+
+def get_retrieval_profile(name: Optional[str] = None) -> RetrievalProfile:
+    """按名称取检索档位；为空时用 RETRIEVAL_DEFAULT_PROFILE，未知名称抛 InvalidRequestError（400）"""
+    profiles = retrieval_profiles()
+    profile = profiles.get(name or settings.RETRIEVAL_DEFAULT_PROFILE)
+    if profile is None:
+        raise InvalidRequestError(f"Unknown retrieval_profile {name!r}, expected one of {sorted(profiles)}")
+    return profile
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.utils.metrics import metrics
+
+
+class RetrievalSnapshot:
+    """某个会话最近一次检索：锚定问题（含项目提示的完整问句）+ 片段与重排分数"""
+
+    __slots__ = ("query", "docs_with_score", "generation", "profile", "stored_at")
+
+    def __init__(
+        self,
+        query: str,
+        docs_with_score: List[Tuple[Document, float]],
+        generation: int,
+        profile: str,
+        stored_at: float,
+    ):
+        self.query = query
+        self.docs_with_score = docs_with_score
+        self.generation = generation
+        self.profile = profile
+        self.stored_at = stored_at
+
+
+class SessionRetrievalCache:
+    """按会话缓存最近一次检索结果（LRU + TTL），供追问做增量检索
+
+    条目绑定索引代数与检索档位，索引重载或换档位后不再命中。只在本进程内生效。
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self._max_sessions = max(1, int(max_sessions))
+        self._ttl = float(ttl_seconds)
+        self._entries: OrderedDict[str, RetrievalSnapshot] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, generation: int, profile: str) -> Optional[RetrievalSnapshot]:
+        with self._lock:
+            snapshot = self._entries.get(session_id)
+            if snapshot is None:
+                return None
+            if self._ttl > 0 and time.monotonic() - snapshot.stored_at > self._ttl:
+                del self._entries[session_id]
+                return None
+            if snapshot.generation != generation or snapshot.profile != profile:
+                return None
+            self._entries.move_to_end(session_id)
+            return snapshot
+
+    def put(
+        self,
+        session_id: str,
+        generation: int,
+        profile: str,
+        query: str,
+        docs_with_score: List[Tuple[Document, float]],
+    ) -> None:
+        snapshot = RetrievalSnapshot(query, list(docs_with_score), generation, profile, time.monotonic())
+        with self._lock:
+            self._entries[session_id] = snapshot
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self._max_sessions:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("chat.retrieval_reuse.sessions", len(self._entries))
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+            metrics.set_gauge("chat.retrieval_reuse.sessions", len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("chat.retrieval_reuse.sessions", 0)
@@ -0,0 +1,558 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+from src.config import settings
+from src.utils.exceptions import ConfigurationError, SessionStoreError
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MEMORY_STORE_LOCK_STRIPES = 64
+SQLITE_PURGE_EVERY_APPENDS = 256
+
+
+class SessionStore(ABC):
+    """会话历史存储接口：每条记录为 {"role": "user"|"assistant", "content": str}"""
+
+    def __init__(self, max_history_rounds: int, ttl_seconds: float):
+        self._max_entries = max(2, int(max_history_rounds) * 2)
+        self._ttl_seconds = float(ttl_seconds)
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> List[dict]:
+        """返回历史快照（调用方可随意修改）"""
+
+    @abstractmethod
+    def append_turn(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
+        """追加一轮对话，超出上限时丢弃最旧记录并刷新 TTL"""
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def get_summary(self, session_id: str) -> Optional[dict]:
+        """返回滚动摘要 {"text": str, "covered": 最后一条被压缩记录的指纹}"""
+
+    @abstractmethod
+    def set_summary(self, session_id: str, summary: dict) -> None:
+        """写入滚动摘要；会话已过期或被清理时忽略"""
+
+    def close(self) -> None:
+        pass
+
+    def _expires_at(self) -> float:
+        if self._ttl_seconds <= 0:
+            return float("inf")
+        return time.time() + self._ttl_seconds
+
+
+# ------------------------------------------------------------------
+# 进程内
+# ------------------------------------------------------------------
+class _MemorySession:
+    """单个会话；entries 为不可变 tuple，写入时整体替换，读取方无需加锁"""
+
+    __slots__ = ("entries", "expires_at", "summary", "referenced")
+
+    def __init__(self) -> None:
+        self.entries: Tuple[dict, ...] = ()
+        self.expires_at = 0.0
+        self.summary: Optional[dict] = None
+        self.referenced = True
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内存储：单 worker 默认实现，超过 max_sessions 按近似 LRU（CLOCK）淘汰
+
+    - 写：按 session_id 分段加锁（MEMORY_STORE_LOCK_STRIPES 把锁），不同会话互不阻塞。
+    - 读：直接读取会话的不可变快照，不加锁。
+    - 新建/淘汰/清理会话才进入全局成员锁；加锁顺序固定为 分段锁 -> 成员锁。
+    """
+
+    def __init__(
+        self,
+        max_sessions: int,
+        max_history_rounds: int,
+        ttl_seconds: float,
+        *,
+        lock_stripes: int = MEMORY_STORE_LOCK_STRIPES,
+    ):
+        super().__init__(max_history_rounds, ttl_seconds)
+        self._max_sessions = max(1, int(max_sessions))
+        # OrderedDict 的单次 get/赋值/pop/move_to_end 在 CPython 下是原子的；遍历前先整体拷贝。
+        # 顺序即时钟指针的扫描顺序，只在成员锁内调整；调整顺序不会让键暂时消失。
+        self._sessions: "OrderedDict[str, _MemorySession]" = OrderedDict()
+        self._stripes = tuple(threading.Lock() for _ in range(max(1, int(lock_stripes))))
+        self._membership_lock = threading.Lock()
+
+    def get_history(self, session_id: str) -> List[dict]:
+        session = self._live_session(session_id)
+        if session is None:
+            return []
+        session.referenced = True
+        return list(session.entries)
+
+    def append_turn(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
+        turn = ({"role": "user", "content": user_msg}, {"role": "assistant", "content": assistant_msg})
+        with self._stripe(session_id):
+            session = self._live_session(session_id)
+            if session is None:
+                session = self._create_session(session_id)
+            entries = session.entries + turn
+            if len(entries) > self._max_entries:
+                entries = entries[-self._max_entries :]
+            session.entries = entries
+            session.expires_at = self._expires_at()
+            session.referenced = True
+
+    def clear(self, session_id: str) -> None:
+        with self._stripe(session_id):
+            with self._membership_lock:
+                self._sessions.pop(session_id, None)
+
+    def list_sessions(self) -> List[str]:
+        now = time.time()
+        return [sid for sid, session in tuple(self._sessions.items()) if session.expires_at > now]
+
+    def get_summary(self, session_id: str) -> Optional[dict]:
+        session = self._live_session(session_id)
+        return session.summary if session is not None else None
+
+    def set_summary(self, session_id: str, summary: dict) -> None:
+        with self._stripe(session_id):
+            session = self._live_session(session_id)
+            if session is not None:
+                session.summary = dict(summary)
+
+    def _stripe(self, session_id: str) -> threading.Lock:
+        return self._stripes[hash(session_id) % len(self._stripes)]
+
+    def _live_session(self, session_id: str) -> Optional[_MemorySession]:
+        session = self._sessions.get(session_id)
+        if session is None or session.expires_at <= time.time():
+            return None
+        return session
+
+    def _create_session(self, session_id: str) -> _MemorySession:
+        """调用方需持有 session_id 对应的分段锁"""
+        session = _MemorySession()
+        with self._membership_lock:
+            # 无锁读到 None 之后，其他线程可能已建好该会话：仍存活就沿用，不能覆盖掉它的历史。
+            existing = self._live_session(session_id)
+            if existing is not None:
+                return existing
+            # 过期的旧会话直接被新对象覆盖（重新插入到淘汰顺序末尾）。
+            self._sessions.pop(session_id, None)
+            while len(self._sessions) >= self._max_sessions:
+                if not self._evict_one(session_id):
+                    break
+            self._sessions[session_id] = session
+        return session
+
+    def _evict_one(self, current_id: str) -> bool:
+        """CLOCK 淘汰：跳过近期访问过的会话（给一次机会）和正被其他线程写入的会话"""
+        current_stripe = self._stripe(current_id)
+        for _ in range(2 * len(self._sessions) + 1):
+            victim_id, victim = next(iter(self._sessions.items()))
+            stripe = self._stripe(victim_id)
+            if victim.referenced and victim.expires_at > time.time():
+                victim.referenced = False
+                # 移到末尾，相当于时钟指针越过它；键始终在表里，无锁读不会看到空窗。
+                self._sessions.move_to_end(victim_id)
+                continue
+            # 当前线程已持有同一分段锁时可直接淘汰；否则只做非阻塞尝试，避免与写入方反向加锁。
+            if stripe is current_stripe:
+                del self._sessions[victim_id]
+            elif stripe.acquire(blocking=False):
+                try:
+                    del self._sessions[victim_id]
+                finally:
+                    stripe.release()
+            else:
+                self._sessions.move_to_end(victim_id)
+                continue
+            logger.info(f"Evicted oldest session: {victim_id}")
+            return True
+        return False
+
+
+# ------------------------------------------------------------------
+# SQLite（WAL，单机多 worker 共享）
+# ------------------------------------------------------------------
+_SQLITE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        session_id TEXT PRIMARY KEY,
+        next_seq INTEGER NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_chat_sessions_expires ON chat_sessions(expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS chat_session_messages (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (session_id, seq)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_session_summaries (
+        session_id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL
+    )
+    """,
+)
+
+
+class SqliteSessionStore(SessionStore):
+    """SQLite WAL 存储：同一主机上的多个 worker 共享会话"""
+
+    def __init__(self, path: str, max_history_rounds: int, ttl_seconds: float):
+        super().__init__(max_history_rounds, ttl_seconds)
+        self._path = str(Path(path).expanduser())
+        Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._append_count = 0
+        with self._connect() as conn:
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_history(self, session_id: str) -> List[dict]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT expires_at FROM chat_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[0] <= time.time():
+                return []
+            rows = conn.execute(
+                "SELECT role, content FROM chat_session_messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session read failed: {e}") from e
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append_turn(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
+        now = time.time()
+        expires_at = self._expires_at()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT next_seq, expires_at FROM chat_sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                seq = 0
+                if row is not None:
+                    seq = row[0]
+                    if row[1] <= now:
+                        conn.execute("DELETE FROM chat_session_messages WHERE session_id = ?", (session_id,))
+                        conn.execute("DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chat_session_messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    ((session_id, seq, "user", user_msg), (session_id, seq + 1, "assistant", assistant_msg)),
+                )
+                next_seq = seq + 2
+                conn.execute(
+                    "INSERT INTO chat_sessions (session_id, next_seq, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET next_seq = excluded.next_seq, expires_at = excluded.expires_at",
+                    (session_id, next_seq, expires_at),
+                )
+                # 只删窗口外的那一轮，主键范围删除，与历史长度无关。
+                conn.execute(
+                    "DELETE FROM chat_session_messages WHERE session_id = ? AND seq < ?",
+                    (session_id, next_seq - self._max_entries),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session write failed: {e}") from e
+
+        self._append_count += 1
+        if self._append_count % SQLITE_PURGE_EVERY_APPENDS == 0:
+            self._purge_expired()
+
+    def clear(self, session_id: str) -> None:
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM chat_session_messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session clear failed: {e}") from e
+
+    def list_sessions(self) -> List[str]:
+        try:
+            rows = self._connect().execute(
+                "SELECT session_id FROM chat_sessions WHERE expires_at > ? ORDER BY expires_at",
+                (time.time(),),
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session list failed: {e}") from e
+        return [row[0] for row in rows]
+
+    def get_summary(self, session_id: str) -> Optional[dict]:
+        try:
+            row = self._connect().execute(
+                "SELECT s.summary FROM chat_session_summaries s JOIN chat_sessions c USING (session_id) "
+                "WHERE s.session_id = ? AND c.expires_at > ?",
+                (session_id, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session summary read failed: {e}") from e
+        return json.loads(row[0]) if row else None
+
+    def set_summary(self, session_id: str, summary: dict) -> None:
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO chat_session_summaries (session_id, summary) "
+                "SELECT session_id, ? FROM chat_sessions WHERE session_id = ?",
+                (json.dumps(summary, ensure_ascii=False), session_id),
+            )
+        except sqlite3.Error as e:
+            raise SessionStoreError(f"SQLite session summary write failed: {e}") from e
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _purge_expired(self) -> None:
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            for table in ("chat_session_messages", "chat_session_summaries"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE session_id IN "
+                    "(SELECT session_id FROM chat_sessions WHERE expires_at <= ?)",
+                    (now,),
+                )
+            conn.execute("DELETE FROM chat_sessions WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite session purge failed: {e}")
+
+
+# ------------------------------------------------------------------
+# Redis 协议（RESP2）
+# ------------------------------------------------------------------
+class _RespConnection:
+    """最小 RESP2 客户端：支持流水线，按需重连（不依赖 redis-py）"""
+
+    def __init__(self, url: str, timeout_seconds: float):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ConfigurationError(f"Unsupported session store URL: {url}")
+        self._host = parsed.hostname or "127.0.0.1"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else ""
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._timeout = timeout_seconds
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._open()
+                self._sock.sendall(b"".join(_encode_command(cmd) for cmd in commands))
+                replies = [self._read_reply() for _ in commands]
+            except OSError as e:
+                self._reset()
+                raise SessionStoreError(f"Redis session store unavailable: {e}") from e
+        for reply in replies:
+            if isinstance(reply, _RespError):
+                raise SessionStoreError(f"Redis error: {reply}")
+        return replies
+
+    def close(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _open(self) -> None:
+        self._sock = socket.create_connection((self._host, self._port), timeout=self._timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        handshake: List[List[Any]] = []
+        if self._password:
+            handshake.append(["AUTH", self._password])
+        if self._db:
+            handshake.append(["SELECT", self._db])
+        if handshake:
+            self._sock.sendall(b"".join(_encode_command(cmd) for cmd in handshake))
+            for _ in handshake:
+                reply = self._read_reply()
+                if isinstance(reply, _RespError):
+                    raise OSError(f"handshake failed: {reply}")
+
+    def _reset(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise OSError("connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return _RespError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._reader.read(size + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [self._read_reply() for _ in range(size)]
+        raise OSError(f"unexpected RESP reply: {line!r}")
+
+
+class _RespError(str):
+    pass
+
+
+def _encode_command(args: Sequence[Any]) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+class RedisSessionStore(SessionStore):
+    """Redis 协议存储：每个会话一个 list，RPUSH + LTRIM + EXPIRE 一次往返完成追加"""
+
+    def __init__(
+        self,
+        url: str,
+        max_history_rounds: int,
+        ttl_seconds: float,
+        *,
+        key_prefix: str = "galay:chat:session:",
+        summary_prefix: str = "galay:chat:summary:",
+        timeout_seconds: float = 2.0,
+    ):
+        super().__init__(max_history_rounds, ttl_seconds)
+        self._conn = _RespConnection(url, timeout_seconds)
+        self._prefix = key_prefix
+        self._summary_prefix = summary_prefix
+
+    def get_history(self, session_id: str) -> List[dict]:
+        (items,) = self._conn.pipeline([["LRANGE", self._key(session_id), 0, -1]])
+        return [json.loads(item) for item in items or []]
+
+    def append_turn(self, session_id: str, user_msg: str, assistant_msg: str) -> None:
+        key = self._key(session_id)
+        commands: List[List[Any]] = [
+            [
+                "RPUSH",
+                key,
+                json.dumps({"role": "user", "content": user_msg}, ensure_ascii=False),
+                json.dumps({"role": "assistant", "content": assistant_msg}, ensure_ascii=False),
+            ],
+            ["LTRIM", key, -self._max_entries, -1],
+        ]
+        if self._ttl_seconds > 0:
+            ttl = max(1, int(self._ttl_seconds))
+            commands.append(["EXPIRE", key, ttl])
+            commands.append(["EXPIRE", self._summary_key(session_id), ttl])
+        self._conn.pipeline(commands)
+
+    def clear(self, session_id: str) -> None:
+        self._conn.pipeline([["DEL", self._key(session_id)], ["DEL", self._summary_key(session_id)]])
+
+    def list_sessions(self) -> List[str]:
+        sessions: List[str] = []
+        cursor = "0"
+        while True:
+            (reply,) = self._conn.pipeline([["SCAN", cursor, "MATCH", f"{self._prefix}*", "COUNT", 200]])
+            cursor, keys = reply
+            sessions.extend(key[len(self._prefix):] for key in keys)
+            if cursor == "0":
+                return sessions
+
+    def get_summary(self, session_id: str) -> Optional[dict]:
+        (raw,) = self._conn.pipeline([["GET", self._summary_key(session_id)]])
+        return json.loads(raw) if raw else None
+
+    def set_summary(self, session_id: str, summary: dict) -> None:
+        # 摘要与历史同 TTL；历史已过期则不再写入。
+        (ttl,) = self._conn.pipeline([["TTL", self._key(session_id)]])
+        if ttl == -2:
+            return
+        command: List[Any] = ["SET", self._summary_key(session_id), json.dumps(summary, ensure_ascii=False)]
+        if ttl > 0:
+            command.extend(["EX", ttl])
+        self._conn.pipeline([command])
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _key(self, session_id: str) -> str:
+        return f"{self._prefix}{session_id}"
+
+    def _summary_key(self, session_id: str) -> str:
+        return f"{self._summary_prefix}{session_id}"
+
+
+def build_session_store() -> SessionStore:
+    """按 SESSION_STORE_BACKEND 创建会话存储"""
+    backend = settings.SESSION_STORE_BACKEND.strip().lower()
+    rounds = settings.SESSION_MAX_HISTORY_ROUNDS
+    ttl = settings.SESSION_TTL_SECONDS
+    if backend == "memory":
+        return InMemorySessionStore(settings.SESSION_MAX_SESSIONS, rounds, ttl)
+    if backend == "sqlite":
+        logger.info(f"Session store: sqlite path={settings.SESSION_STORE_PATH}")
+        return SqliteSessionStore(settings.SESSION_STORE_PATH, rounds, ttl)
+    if backend == "redis":
+        logger.info("Session store: redis")
+        return RedisSessionStore(settings.SESSION_STORE_REDIS_URL, rounds, ttl)
+    raise ConfigurationError(f"Unknown SESSION_STORE_BACKEND: {settings.SESSION_STORE_BACKEND}")
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+
+class _CoalesceStats:
+    """按模式统计 leader/follower，维护合并比例 gauge"""
+
+    def __init__(self, mode: str):
+        self._mode = mode
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+
+    def record(self, *, follower: bool) -> None:
+        with self._lock:
+            if follower:
+                self._followers += 1
+            else:
+                self._leaders += 1
+            ratio = self._followers / (self._leaders + self._followers)
+        metrics.incr(f"chat.coalesce.{self._mode}.{'follower' if follower else 'leader'}")
+        metrics.set_gauge(f"chat.coalesce.{self._mode}.ratio", round(ratio, 4))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """同步单飞：同一 key 同时只执行一次，其余调用方等待并共享结果（或异常）"""
+
+    def __init__(self, mode: str):
+        self._stats = _CoalesceStats(mode)
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """返回 (结果, 是否为共享结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._stats.record(follower=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+
+class _Subscriber:
+    """单个订阅者的有界待发队列；溢出后不再入队，读空后从 flight 的快照重新同步"""
+
+    __slots__ = ("pending", "maxsize", "overflowed", "wakeup")
+
+    def __init__(self, maxsize: int) -> None:
+        self.pending: Deque[Tuple[int, dict]] = deque()
+        self.maxsize = max(1, int(maxsize))
+        self.overflowed = False
+        self.wakeup = asyncio.Event()
+
+    def offer(self, seq: int, event: dict) -> None:
+        if not self.overflowed:
+            if len(self.pending) < self.maxsize:
+                self.pending.append((seq, event))
+            else:
+                self.overflowed = True
+                metrics.incr("chat.coalesce.subscriber_overflows")
+        self.wakeup.set()
+
+
+class _StreamFlight:
+    """只保留最新的 replace 快照与终止事件（done/error），中间预览不留存"""
+
+    __slots__ = ("seq", "snapshot", "terminal", "finished", "subscribers", "task")
+
+    def __init__(self) -> None:
+        self.seq = 0
+        self.snapshot: Optional[Tuple[int, dict]] = None
+        self.terminal: List[Tuple[int, dict]] = []
+        self.finished = False
+        self.subscribers: Set[_Subscriber] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, event: dict) -> None:
+        self.seq += 1
+        if "replace" in event:
+            self.snapshot = (self.seq, event)
+        if event.get("done") or event.get("error"):
+            self.terminal.append((self.seq, event))
+        for subscriber in self.subscribers:
+            subscriber.offer(self.seq, event)
+
+    def finish(self) -> None:
+        self.finished = True
+        for subscriber in self.subscribers:
+            subscriber.wakeup.set()
+
+    def catch_up(self, after: int) -> List[Tuple[int, dict]]:
+        """晚到或落后的订阅者需要补发的事件：最新快照 + 终止事件（按序号）"""
+        events = list(self.terminal)
+        if self.snapshot is not None:
+            events.append(self.snapshot)
+        return sorted((item for item in events if item[0] > after), key=lambda item: item[0])
+
+
+class StreamSingleFlight:
+    """流式单飞：同一 key 只跑一个上游流，订阅者先拿到最新快照再跟随后续事件
+
+    上游流由独立任务驱动，不绑定某个客户端；每个订阅者有自己的有界队列，慢订阅者
+    不会拖住上游或其它订阅者：队列满后跳过中间预览，读空后改发最新的 replace 快照
+    （全文覆盖，最终答案与 done/error 不会丢）。所有订阅者都断开后才取消上游，
+    取消语义与单请求断开一致。只在事件循环线程内使用。
+    """
+
+    def __init__(self, mode: str, queue_maxsize: int):
+        self._stats = _CoalesceStats(mode)
+        self._queue_maxsize = queue_maxsize
+        self._flights: Dict[Hashable, _StreamFlight] = {}
+
+    async def subscribe(
+        self,
+        key: Hashable,
+        factory: Callable[[], AsyncGenerator[dict, None]],
+    ) -> AsyncGenerator[dict, None]:
+        flight = self._flights.get(key)
+        follower = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _StreamFlight()
+            flight.task = asyncio.create_task(self._drive(key, flight, factory))
+        self._stats.record(follower=follower)
+
+        subscriber = _Subscriber(self._queue_maxsize)
+        flight.subscribers.add(subscriber)
+        last_seq = 0
+        skip_deltas = False
+        # 错过了快照之后的增量片段时，丢弃 content 增量直到下一个 replace，避免拼出残缺文本
+        resync = True
+        try:
+            while True:
+                if resync:
+                    resync = False
+                    for seq, event in flight.catch_up(last_seq):
+                        last_seq = seq
+                        yield event
+                    skip_deltas = flight.seq > last_seq
+                if subscriber.pending:
+                    seq, event = subscriber.pending.popleft()
+                    if seq <= last_seq:
+                        continue
+                    last_seq = seq
+                    if "replace" in event:
+                        skip_deltas = False
+                    elif skip_deltas and "content" in event:
+                        continue
+                    yield event
+                    continue
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    resync = True
+                    continue
+                if flight.finished:
+                    return
+                subscriber.wakeup.clear()
+                await subscriber.wakeup.wait()
+        finally:
+            flight.subscribers.discard(subscriber)
+            if not flight.subscribers and not flight.finished and flight.task is not None:
+                # 最后一个订阅者离开：摘掉 flight，新请求不再加入这次即将取消的上游流。
+                if self._flights.get(key) is flight:
+                    self._flights.pop(key, None)
+                flight.task.cancel()
+
+    async def _drive(
+        self,
+        key: Hashable,
+        flight: _StreamFlight,
+        factory: Callable[[], AsyncGenerator[dict, None]],
+    ) -> None:
+        try:
+            async with aclosing(factory()) as events:
+                async for event in events:
+                    flight.publish(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Coalesced stream error: {e}")
+            flight.publish({"error": str(e)})
+        finally:
+            if self._flights.get(key) is flight:
+                self._flights.pop(key, None)
+            flight.finish()
@@ -28,6 +28,13 @@ class DocumentLoadError(AIServiceError):
         super().__init__(message, status_code=500)
 
 
+class InvalidRequestError(AIServiceError):
+    """请求参数不合法"""
+
+    def __init__(self, message: str = "Invalid request"):
+        super().__init__(message, status_code=400)
+
+
 class ChatServiceError(AIServiceError):
     """聊天服务异常"""
 
@@ -35,6 +42,13 @@ class ChatServiceError(AIServiceError):
         super().__init__(message, status_code=500)
 
 
+class SessionStoreError(AIServiceError):
+    """会话存储读写失败"""
+
+    def __init__(self, message: str = "Session store error"):
+        super().__init__(message, status_code=503)
+
+
 class ServiceUnavailableError(AIServiceError):
     """服务未就绪/不可用"""
 
@@ -42,6 +56,29 @@ class ServiceUnavailableError(AIServiceError):
         super().__init__(message, status_code=503)
 
 
+class DeadlineExceededError(AIServiceError):
+    """请求截止时间已到，后续阶段不再执行"""
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message, status_code=504)
+
+
+class OverloadedError(ServiceUnavailableError):
+    """隔舱已满，快速拒绝（响应带 Retry-After）"""
+
+    def __init__(self, message: str = "Service overloaded", retry_after_seconds: int = 1):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class RateLimitedError(AIServiceError):
+    """客户端请求过于频繁（响应带 Retry-After）"""
+
+    def __init__(self, message: str = "Too many requests", retry_after_seconds: int = 1):
+        super().__init__(message, status_code=429)
+        self.retry_after_seconds = retry_after_seconds
+
+
 class AuthenticationError(AIServiceError):
     """鉴权失败"""
 